@@ -0,0 +1,536 @@
+"""
+Сводный прогресс рендера на ферме без зависимости от hou.
+Каждая сессия (хост) отправляет компактное состояние по UDP или HTTP (ProgressReporter),
+а агрегатор (Aggregator) объединяет кадры задачи со всех хостов, считает общую
+скорость и прогноз и отправляет одно итоговое уведомление, когда задача закончена.
+"""
+import http.server
+import itertools
+import json
+import socket
+import threading
+import time
+import urllib.request
+
+from utils import FrameTracker, format_duration
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 9876
+# Больше не отправляем одним UDP пакетом: диапазоны кадров обрезаются (счетчики остаются точными)
+MAX_DATAGRAM = 8192
+
+
+def parse_url(url):
+    """
+    'udp://host:port', 'http://host:port' или 'host:port' (UDP) -> (схема, (host, port)).
+    """
+    scheme = 'udp'
+    if '://' in url:
+        scheme, url = url.split('://', 1)
+        scheme = scheme.lower()
+    if scheme not in ('udp', 'http'):
+        raise ValueError(f"Unsupported aggregator scheme: {scheme}")
+    host, _, port = url.rstrip('/').rpartition(':')
+    if not host:
+        host, port = port, DEFAULT_PORT
+    return scheme, (host, int(port))
+
+
+def encode_message(message):
+    """
+    JSON без пробелов. Если не помещается в UDP пакет - диапазоны кадров обрезаются
+    (агрегатор считает прогресс по счетчикам, диапазоны нужны только для списка кадров).
+    """
+    data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    if len(data) > MAX_DATAGRAM and message.get('ranges'):
+        message = dict(message, ranges=message['ranges'][:64], truncated=True)
+        data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    return data
+
+
+class ProgressReporter:
+    """
+    Отправляет прогресс сессии агрегатору. Как и LiveMessage, update() только помечает
+    состояние устаревшим, а отправка идет из таймера не чаще interval секунд.
+    Сообщение кумулятивное (счетчики и диапазоны готовых кадров), поэтому потерянный
+    UDP пакет ничего не ломает - следующий содержит все то же самое.
+    progress() -> dict: n, total, busy, start, ranges, expect (см. RenderSession.progress).
+    """
+    DEFAULT_INTERVAL = 5.0
+    # Финальное сообщение по UDP повторяется (агрегатор отбрасывает дубликаты по seq)
+    FINAL_REPEATS = 3
+
+    def __init__(self, url, job, sender_id, host, progress, job_total=None, interval=DEFAULT_INTERVAL,
+                 timeout=2.0):
+        self.url = url
+        self.scheme, self.address = parse_url(url)
+        self.job = job
+        self.sender_id = sender_id
+        self.host = host
+        self.progress = progress
+        self.job_total = job_total
+        self.interval = max(0.1, float(interval))
+        self.timeout = timeout
+        self.last_send_time = 0.0
+        self.finished = False
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._timer = None
+        # Поток финального сообщения (finish) - сокет закрывается после него
+        self._final_thread = None
+        self._sock = None
+        if self.scheme == 'udp':
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def message(self, done=False):
+        message = {
+            'v': PROTOCOL_VERSION,
+            'job': self.job,
+            'id': self.sender_id,
+            'host': self.host,
+            'seq': next(self._seq),
+            't': time.time(),
+            'done': done,
+        }
+        if self.job_total:
+            message['job_total'] = int(self.job_total)
+        message.update(self.progress())
+        return message
+
+    def update(self):
+        """
+        Помечает прогресс устаревшим. Дешево, можно вызывать на каждый кадр.
+        """
+        with self._lock:
+            if self.finished or self._timer is not None:
+                return
+            delay = max(0.0, self.last_send_time + self.interval - time.time())
+            self._timer = threading.Timer(delay, self._on_timer)
+            self._timer.daemon = True
+            self._timer.name = "RenderEstimator_Progress_Timer"
+            self._timer.start()
+
+    def finish(self):
+        """
+        Финальное сообщение (done=True) без ожидания интервала. Состояние берется сразу,
+        а отправка (DNS, HTTP с таймаутом, повторы UDP) идет в фоновом потоке,
+        поэтому вызов из основного потока Houdini не блокируется.
+        """
+        self.cancel()
+        data = encode_message(self.message(done=True))
+        repeats = self.FINAL_REPEATS if self.scheme == 'udp' else 1
+
+        def run():
+            try:
+                for _ in range(repeats):
+                    self._send(data)
+            finally:
+                with self._lock:
+                    self._final_thread = None
+                self._close_socket()
+
+        thread = threading.Thread(target=run, name="RenderEstimator_Progress_Final")
+        thread.daemon = True
+        with self._lock:
+            self._final_thread = thread
+        thread.start()
+        return thread
+
+    def wait(self, timeout=None):
+        """
+        Ждет отправки финального сообщения (консольный режим перед выходом).
+        """
+        thread = self._final_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def cancel(self):
+        with self._lock:
+            self.finished = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def close(self):
+        self.cancel()
+        with self._lock:
+            if self._final_thread is not None:
+                # Сокет закроет поток финального сообщения после отправки
+                return
+        self._close_socket()
+
+    def _close_socket(self):
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            if self.finished:
+                return
+        try:
+            self._send(encode_message(self.message()))
+        except Exception as e:
+            print(f"[RenderEstimator] Aggregator error: {e}")
+
+    def _send(self, data):
+        self.last_send_time = time.time()
+        try:
+            if self.scheme == 'udp':
+                sock = self._sock
+                if sock is None:
+                    return False
+                sock.sendto(data, self.address)
+            else:
+                host, port = self.address
+                request = urllib.request.Request(f"http://{host}:{port}/progress", data=data,
+                                                 headers={'Content-Type': 'application/json'})
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    response.read()
+        except (OSError, ValueError) as e:
+            print(f"[RenderEstimator] Aggregator send error ({self.url}): {e}")
+            return False
+        return True
+
+
+class SenderState:
+    """
+    Последнее состояние одного хоста (сессии) задачи.
+    """
+    __slots__ = ('id', 'host', 'seq', 'n', 'total', 'busy', 'start', 'ranges', 'step', 'expect',
+                 'done', 'last_seen')
+
+    def __init__(self, sender_id, host):
+        self.id = sender_id
+        self.host = host
+        self.seq = 0
+        self.n = 0
+        self.total = 0
+        self.busy = 0.0
+        self.start = None
+        self.ranges = []
+        self.step = 1
+        self.expect = None
+        self.done = False
+        self.last_seen = 0.0
+
+    def rate(self):
+        """
+        Кадров в секунду на этом хосте.
+        """
+        if not self.n or self.start is None:
+            return 0.0
+        return self.n / max(1.0, self.last_seen - self.start)
+
+
+class JobState:
+    def __init__(self, job, now):
+        self.job = job
+        self.senders = {}
+        self.job_total = None
+        self.first_seen = now
+        self.last_change = now
+        self.reported = False
+
+    def _per_chunk(self, attr):
+        """
+        Сумма по кускам задачи. Перезапущенный блейд приходит с новым sender_id, но с тем же
+        диапазоном кадров, поэтому сессии одного диапазона (без диапазона - одного хоста)
+        дают один кусок, и берется максимум по ним, а не сумма.
+        """
+        chunks = {}
+        for sender in self.senders.values():
+            key = tuple(sender.expect) if sender.expect else ('host', sender.host)
+            chunks[key] = max(chunks.get(key, 0), getattr(sender, attr))
+        return sum(chunks.values())
+
+    @property
+    def done(self):
+        return self._per_chunk('n')
+
+    @property
+    def total(self):
+        return max(self.job_total or 0, self._per_chunk('total'))
+
+
+class Aggregator:
+    """
+    Объединяет прогресс задач со всех хостов. handle() принимает сообщение,
+    check() отправляет итоговый отчет по закончившимся задачам через notify(text).
+
+    Задача закончена, когда все ее хосты прислали done (или замолчали на stale_timeout)
+    и settle_time новых сообщений не было - на случай, если следующие блейды фермы
+    еще не стартовали. Если объявлен job_total, а кадров меньше, ждем stale_timeout.
+    """
+    DEFAULT_SETTLE_TIME = 10.0
+    DEFAULT_STALE_TIMEOUT = 600.0
+
+    def __init__(self, notify=None, settle_time=DEFAULT_SETTLE_TIME, stale_timeout=DEFAULT_STALE_TIMEOUT,
+                 clock=time.time):
+        self.notify = notify
+        self.settle_time = settle_time
+        self.stale_timeout = stale_timeout
+        self.clock = clock
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._servers = []
+
+    # --- Сообщения ---
+
+    def handle(self, message):
+        """
+        Применяет сообщение хоста. Возвращает False для чужих/устаревших сообщений.
+        """
+        if not isinstance(message, dict) or message.get('v') != PROTOCOL_VERSION:
+            return False
+        job_name, sender_id = message.get('job'), message.get('id')
+        if not job_name or not sender_id:
+            return False
+        now = self.clock()
+        with self._lock:
+            job = self.jobs.get(job_name)
+            if job is None:
+                job = self.jobs[job_name] = JobState(job_name, now)
+            sender = job.senders.get(sender_id)
+            if sender is None:
+                sender = job.senders[sender_id] = SenderState(sender_id, message.get('host', '?'))
+            seq = int(message.get('seq', 0))
+            if seq <= sender.seq:
+                # Повтор (финальное сообщение по UDP) или пакет пришел не по порядку
+                return False
+            sender.seq = seq
+            sender.n = int(message.get('n', 0))
+            sender.total = int(message.get('total', 0))
+            sender.busy = float(message.get('busy', 0.0))
+            sender.start = message.get('start')
+            if not message.get('truncated'):
+                sender.ranges = message.get('ranges') or []
+            sender.step = message.get('step') or 1
+            sender.expect = message.get('expect')
+            sender.done = bool(message.get('done'))
+            sender.last_seen = message.get('t') or now
+            if message.get('job_total'):
+                job.job_total = int(message['job_total'])
+            job.last_change = now
+            if job.reported and not sender.done:
+                # Задачу перезапустили - будет новый итоговый отчет
+                job.reported = False
+        return True
+
+    def status(self, job_name):
+        """
+        Сводка по задаче: готово/всего, скорость (кадров/сек), прогноз (сек), хосты.
+        """
+        now = self.clock()
+        with self._lock:
+            job = self.jobs[job_name]
+            active = [s for s in job.senders.values() if not s.done and now - s.last_seen < self.stale_timeout]
+            done, total = job.done, job.total
+            # Общая скорость - сумма скоростей работающих хостов
+            rate = sum(s.rate() for s in active)
+            remaining = max(0, total - done)
+            eta = remaining / rate if rate > 0 else None
+            return {
+                'job': job_name,
+                'done': done,
+                'total': total,
+                'rate': rate,
+                'eta': eta,
+                'hosts': len(job.senders),
+                'active': len(active),
+                'reported': job.reported,
+            }
+
+    def check(self):
+        """
+        Отправляет итоговый отчет по закончившимся задачам. Возвращает их имена.
+        """
+        now = self.clock()
+        finished = []
+        with self._lock:
+            for job in self.jobs.values():
+                if job.reported or not job.senders:
+                    continue
+                quiet = now - job.last_change
+                stale = [s for s in job.senders.values() if not s.done and now - s.last_seen >= self.stale_timeout]
+                if not all(s.done for s in job.senders.values() if s not in stale):
+                    continue
+                if job.job_total and job.done < job.job_total and quiet < self.stale_timeout:
+                    # Объявлено больше кадров - остальные хосты могут еще стартовать
+                    continue
+                if quiet < self.settle_time:
+                    continue
+                job.reported = True
+                finished.append(job)
+
+        for job in finished:
+            text = self.build_report(job)
+            if self.notify is not None:
+                try:
+                    self.notify(text)
+                except Exception as e:
+                    print(f"[RenderEstimator] Aggregator notify error: {e}")
+        return [job.job for job in finished]
+
+    def build_report(self, job):
+        """
+        Сводный отчет задачи по всем хостам.
+        """
+        with self._lock:
+            senders = list(job.senders.values())
+            done, total = job.done, job.total
+        now = self.clock()
+
+        expected = set()
+        for sender in senders:
+            if sender.expect:
+                start, end, step = sender.expect
+                frame = start
+                while frame <= end + 1e-9:
+                    expected.add(frame)
+                    frame += step or 1
+        # Сетка задачи по ожидаемым кадрам (общий шаг хостов), иначе кадры с шагом 1
+        steps = {s.expect[2] or 1 for s in senders if s.expect}
+        if expected and len(steps) == 1:
+            grid = (min(expected), max(expected), steps.pop())
+        else:
+            grid = ()
+
+        rendered = FrameTracker(*grid)
+        for sender in senders:
+            for first, last in sender.ranges:
+                frame = first
+                while frame <= last + 1e-9:
+                    rendered.add(frame)
+                    frame += sender.step
+        missing = FrameTracker(*grid)
+        for frame in expected:
+            if frame not in rendered:
+                missing.add(frame)
+
+        starts = [s.start for s in senders if s.start]
+        wall = max(s.last_seen for s in senders) - min(starts) if starts else 0.0
+        busy = sum(s.busy for s in senders)
+        stale = [s.host for s in senders if not s.done and now - s.last_seen >= self.stale_timeout]
+
+        title = "✅ Задача на ферме завершена" if done >= total and not stale else "⚠️ Задача на ферме завершена не полностью"
+        lines = [
+            f"{title}: {job.job}",
+            "",
+            f"🖥 Хостов: {len(senders)}",
+            f"• Кадров: {done}/{total}",
+            f"• Кадры: {rendered.format()}",
+            f"• Общее время: {format_duration(wall)}",
+            f"• Суммарное время рендера: {format_duration(busy)}",
+        ]
+        if wall > 0 and done:
+            lines.append(f"• Скорость фермы: {done / wall * 3600:.1f} кадров/час")
+        if len(missing):
+            lines.append(f"• ⚠️ Не отрендерены ({len(missing)}): {missing.format(separator=',')}")
+        if stale:
+            lines.append(f"• 💀 Нет связи: {', '.join(sorted(stale))}")
+        return "\n".join(lines)
+
+    # --- Сеть ---
+
+    def serve_udp(self, host='0.0.0.0', port=DEFAULT_PORT):
+        """
+        Принимает сообщения по UDP в фоновом потоке. Возвращает фактический адрес.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        sock.settimeout(0.5)
+        self._servers.append(sock)
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    data, _addr = sock.recvfrom(65535)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                try:
+                    self.handle(json.loads(data.decode('utf-8')))
+                except (ValueError, TypeError, UnicodeDecodeError):
+                    pass
+
+        self._start_thread(run, "RenderEstimator_Aggregator_UDP")
+        return sock.getsockname()
+
+    def serve_http(self, host='0.0.0.0', port=DEFAULT_PORT):
+        """
+        HTTP: POST /progress (то же сообщение), GET /jobs (сводка по задачам).
+        Возвращает фактический адрес.
+        """
+        aggregator = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    accepted = self.path == '/progress' and aggregator.handle(json.loads(self.rfile.read(length)))
+                except (ValueError, TypeError):
+                    accepted = False
+                self._reply(200 if accepted else 400, {'ok': accepted})
+
+            def do_GET(self):
+                if self.path != '/jobs':
+                    self._reply(404, {'error': 'not found'})
+                    return
+                self._reply(200, [aggregator.status(name) for name in list(aggregator.jobs)])
+
+            def _reply(self, code, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        self._servers.append(server)
+        self._start_thread(server.serve_forever, "RenderEstimator_Aggregator_HTTP")
+        return server.server_address
+
+    def run(self, interval=1.0, on_status=None):
+        """
+        Основной цикл агрегатора: проверка закончившихся задач раз в interval секунд.
+        on_status(status) вызывается для задач, по которым были новые сообщения.
+        """
+        seen = {}
+        while not self._stop.wait(interval):
+            if on_status is not None:
+                with self._lock:
+                    changed = [name for name, job in self.jobs.items() if seen.get(name) != job.last_change]
+                    seen.update((name, self.jobs[name].last_change) for name in changed)
+                for name in changed:
+                    on_status(self.status(name))
+            self.check()
+
+    def close(self):
+        self._stop.set()
+        for server in self._servers:
+            if isinstance(server, socket.socket):
+                server.close()
+            else:
+                server.shutdown()
+                server.server_close()
+        for thread in self._threads:
+            thread.join(2.0)
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
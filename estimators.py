@@ -0,0 +1,196 @@
+"""
+Модели оценки оставшегося времени рендера.
+Все модели обновляются инкрементально за O(1) на кадр.
+"""
+from collections import deque
+
+
+class Estimator:
+    """
+    Базовый класс модели. Получает длительности готовых кадров через add()
+    и прогнозирует время на кадр / оставшееся время.
+    """
+    name = "base"
+
+    def __init__(self):
+        self.count = 0
+        # Прогноз из истории прошлых рендеров (используется, пока нет своих кадров)
+        self.prior = None
+        self.prior_startup = 0.0
+
+    def add(self, duration):
+        self.count += 1
+
+    def set_prior(self, per_frame, startup=0.0):
+        """
+        Задает априорный прогноз (например, из истории рендеров).
+        """
+        self.prior = per_frame if per_frame and per_frame > 0 else None
+        self.prior_startup = max(0.0, startup or 0.0)
+
+    def per_frame(self):
+        """
+        Прогноз времени на следующий кадр (сек).
+        """
+        return 0.0
+
+    def startup(self):
+        """
+        Оценка фиксированной стоимости старта рендера (сек).
+        """
+        return 0.0
+
+    def remaining(self, remaining_frames):
+        """
+        Прогноз оставшегося времени (сек) для remaining_frames кадров.
+        """
+        if remaining_frames <= 0:
+            return 0.0
+        return max(0.0, self.per_frame() * remaining_frames)
+
+
+class CumulativeMeanEstimator(Estimator):
+    """
+    Среднее по всем кадрам: (Прошедшее время / Кол-во кадров).
+    """
+    name = "mean"
+
+    def __init__(self):
+        super().__init__()
+        self.total = 0.0
+
+    def add(self, duration):
+        super().add(duration)
+        self.total += duration
+
+    def per_frame(self):
+        if not self.count:
+            return self.prior or 0.0
+        return self.total / self.count
+
+
+class SlidingWindowEstimator(Estimator):
+    """
+    Скользящее среднее по последним N кадрам.
+    Быстро реагирует на резкие изменения сложности кадров.
+    """
+    name = "window"
+
+    def __init__(self, window=10):
+        super().__init__()
+        self.window = max(1, int(window))
+        self.samples = deque()
+        self.total = 0.0
+
+    def add(self, duration):
+        super().add(duration)
+        self.samples.append(duration)
+        self.total += duration
+        if len(self.samples) > self.window:
+            self.total -= self.samples.popleft()
+
+    def per_frame(self):
+        if not self.samples:
+            return self.prior or 0.0
+        return self.total / len(self.samples)
+
+
+class EwmaEstimator(Estimator):
+    """
+    Экспоненциально взвешенное среднее: новые кадры весят больше старых.
+    alpha - вес последнего кадра (0..1).
+    """
+    name = "ewma"
+
+    def __init__(self, alpha=0.3):
+        super().__init__()
+        self.alpha = min(1.0, max(0.0, float(alpha))) or 0.3
+        self.value = None
+
+    def add(self, duration):
+        super().add(duration)
+        if self.value is None:
+            self.value = duration
+        else:
+            self.value += self.alpha * (duration - self.value)
+
+    def per_frame(self):
+        if self.value is None:
+            return self.prior or 0.0
+        return self.value
+
+
+class TwoPhaseEstimator(Estimator):
+    """
+    Двухфазная модель: фиксированная стоимость старта (загрузка сцены, BVH,
+    компиляция шейдеров) + стабильная стоимость кадра.
+    Первый кадр содержит старт + кадр, поэтому стабильная стоимость оценивается
+    внутренней моделью по остальным кадрам, а старт = первый кадр - стоимость кадра.
+    """
+
+    def __init__(self, inner):
+        super().__init__()
+        self.inner = inner
+        self.name = inner.name
+        self.first = None
+
+    def add(self, duration):
+        super().add(duration)
+        if self.first is None:
+            self.first = duration
+        else:
+            self.inner.add(duration)
+
+    def set_prior(self, per_frame, startup=0.0):
+        super().set_prior(per_frame, startup)
+        self.inner.set_prior(per_frame)
+
+    def per_frame(self):
+        if self.inner.count or self.prior:
+            return self.inner.per_frame()
+        # Пока есть только первый кадр, отделить старт не от чего
+        return self.first if self.first is not None else 0.0
+
+    def startup(self):
+        if self.first is None:
+            return self.prior_startup
+        if not self.inner.count and not self.prior:
+            return 0.0
+        return max(0.0, self.first - self.inner.per_frame())
+
+    def remaining(self, remaining_frames):
+        # До первого кадра старт еще впереди
+        pending_startup = self.prior_startup if self.first is None and remaining_frames > 0 else 0.0
+        return super().remaining(remaining_frames) + pending_startup
+
+
+ESTIMATORS = {
+    CumulativeMeanEstimator.name: CumulativeMeanEstimator,
+    SlidingWindowEstimator.name: SlidingWindowEstimator,
+    EwmaEstimator.name: EwmaEstimator,
+}
+
+DEFAULT_ESTIMATOR = CumulativeMeanEstimator.name
+
+
+def create_estimator(mode=None, window=None, alpha=None, startup=True):
+    """
+    Создает модель по имени ('mean', 'window', 'ewma').
+    Неизвестное имя -> среднее по всем кадрам.
+    startup=True - оборачивает модель в TwoPhaseEstimator (старт отдельно от кадров).
+    """
+    estimator = _create_base_estimator(mode, window, alpha)
+    if startup:
+        return TwoPhaseEstimator(estimator)
+    return estimator
+
+
+def _create_base_estimator(mode, window, alpha):
+    mode = str(mode or DEFAULT_ESTIMATOR).strip().lower()
+    if mode not in ESTIMATORS:
+        mode = DEFAULT_ESTIMATOR
+    if mode == SlidingWindowEstimator.name:
+        return SlidingWindowEstimator(window) if window else SlidingWindowEstimator()
+    if mode == EwmaEstimator.name:
+        return EwmaEstimator(alpha) if alpha else EwmaEstimator()
+    return CumulativeMeanEstimator()
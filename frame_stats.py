@@ -0,0 +1,169 @@
+"""
+Компактное хранилище времени кадров с потоковой статистикой.
+Счетчик, сумма, мин/макс и дисперсия обновляются за O(1) на кадр,
+перцентили считаются алгоритмом P² без хранения и сортировки всех значений.
+"""
+import math
+from array import array
+
+
+class P2Quantile:
+    """
+    Потоковая оценка квантиля p алгоритмом P² (Jain & Chlamtac): 5 маркеров, O(1) память.
+    """
+    __slots__ = ('p', 'q', 'n', 'np', 'dn', 'count')
+
+    def __init__(self, p):
+        self.p = p
+        self.q = []
+        self.n = [0, 1, 2, 3, 4]
+        self.np = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self.dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+        self.count = 0
+
+    def add(self, x):
+        self.count += 1
+        q = self.q
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        n = self.n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while k < 3 and x >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        for i in (1, 2, 3):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = self._parabolic(i, d)
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def copy(self):
+        other = P2Quantile.__new__(P2Quantile)
+        other.p = self.p
+        other.q = list(self.q)
+        other.n = list(self.n)
+        other.np = list(self.np)
+        other.dn = self.dn
+        other.count = self.count
+        return other
+
+    def value(self):
+        if not self.q:
+            return None
+        if self.count <= 5:
+            # Мало данных - точное значение по отсортированной выборке
+            idx = min(len(self.q) - 1, max(0, int(round(self.p * (len(self.q) - 1)))))
+            return self.q[idx]
+        return self.q[2]
+
+
+class FrameTimeStore:
+    """
+    Времена кадров в параллельных массивах array('i') / array('d')
+    и бегущая статистика по ним.
+    """
+    __slots__ = ('frames', 'durations', 'count', 'total', 'min_time', 'min_frame',
+                 'max_time', 'max_frame', '_mean', '_m2', 'quantiles')
+
+    PERCENTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self.frames = array('i')
+        self.durations = array('d')
+        self.count = 0
+        self.total = 0.0
+        self.min_time = None
+        self.min_frame = None
+        self.max_time = None
+        self.max_frame = None
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.quantiles = {p: P2Quantile(p) for p in self.PERCENTILES}
+
+    def add(self, frame, duration):
+        self.frames.append(int(frame))
+        self.durations.append(duration)
+
+        self.count += 1
+        self.total += duration
+        if self.min_time is None or duration < self.min_time:
+            self.min_time = duration
+            self.min_frame = int(frame)
+        if self.max_time is None or duration > self.max_time:
+            self.max_time = duration
+            self.max_frame = int(frame)
+
+        # Welford
+        delta = duration - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (duration - self._mean)
+
+        for sketch in self.quantiles.values():
+            sketch.add(duration)
+
+    def copy(self):
+        """
+        Независимая копия (для снимков состояния): массивы копируются одним memcpy.
+        """
+        other = FrameTimeStore.__new__(FrameTimeStore)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        other.frames = array('i', self.frames)
+        other.durations = array('d', self.durations)
+        other.quantiles = {p: sketch.copy() for p, sketch in self.quantiles.items()}
+        return other
+
+    # Совместимость со старым списком кортежей (номер_кадра, время)
+    def append(self, item):
+        self.add(*item)
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __iter__(self):
+        return zip(self.frames, self.durations)
+
+    @property
+    def mean(self):
+        return self._mean if self.count else 0.0
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def percentile(self, p):
+        sketch = self.quantiles.get(p)
+        return sketch.value() if sketch is not None else None
@@ -0,0 +1,236 @@
+"""
+Локальная история рендеров (SQLite).
+Хранит длительность и размер каждого готового кадра, чтобы давать прогноз
+еще до того, как первый кадр текущего рендера будет готов.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".render_estimator", "history.sqlite")
+
+# Сколько последних записей на кадр учитывать в прогнозе
+HISTORY_DEPTH = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    hip TEXT NOT NULL,
+    rop TEXT NOT NULL,
+    renderer TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    frame INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    size INTEGER NOT NULL,
+    run_id TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frames_key ON frames (hip, rop, renderer, resolution, frame, ts);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    hip TEXT NOT NULL,
+    rop TEXT NOT NULL,
+    renderer TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    startup REAL NOT NULL,
+    frames INTEGER NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_key ON runs (hip, rop, renderer, resolution, ts);
+"""
+
+
+def connect(db_path):
+    """
+    Открывает базу истории (создает папку и схему при необходимости).
+    """
+    folder = os.path.dirname(db_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=5.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _key_filter(key):
+    """
+    WHERE для ключа (hip, rop, renderer, resolution). None в ключе - любое значение.
+    """
+    columns = ('hip', 'rop', 'renderer', 'resolution')
+    clauses = [f"{column} = ?" for column, value in zip(columns, key) if value is not None]
+    params = tuple(str(value) for value in key if value is not None)
+    return " AND ".join(clauses) or "1", params
+
+
+def load_predictions(db_path, key, frames=None, depth=HISTORY_DEPTH):
+    """
+    Возвращает ({кадр: средняя длительность}, средний старт) по последним
+    depth записям для ключа (hip, rop, renderer, resolution).
+    None в ключе - любое значение (например, прогноз по всем рендерерам ROP).
+    frames - ограничение по номерам кадров (None - все).
+    """
+    if not os.path.exists(db_path):
+        return {}, 0.0
+
+    where, params = _key_filter(key)
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT frame, AVG(duration) FROM (
+                SELECT frame, duration, ROW_NUMBER() OVER (PARTITION BY frame ORDER BY ts DESC) AS rn
+                FROM frames
+                WHERE {where}
+            ) WHERE rn <= ? GROUP BY frame
+            """,
+            (*params, depth),
+        ).fetchall()
+        startup_row = conn.execute(
+            f"""
+            SELECT AVG(startup) FROM (
+                SELECT startup FROM runs
+                WHERE {where}
+                ORDER BY ts DESC LIMIT ?
+            )
+            """,
+            (*params, depth),
+        ).fetchone()
+    finally:
+        conn.close()
+
+    wanted = set(frames) if frames is not None else None
+    predictions = {int(f): d for f, d in rows if wanted is None or int(f) in wanted}
+    startup = startup_row[0] if startup_row and startup_row[0] is not None else 0.0
+    return predictions, startup
+
+
+def predict_total(predictions, frames):
+    """
+    Суммарный прогноз для списка кадров. Кадры без истории получают
+    среднее по известным кадрам. Возвращает (сек, кол-во кадров с историей).
+    """
+    if not predictions:
+        return 0.0, 0
+    fallback = sum(predictions.values()) / len(predictions)
+    known = 0
+    total = 0.0
+    for f in frames:
+        d = predictions.get(f)
+        if d is None:
+            total += fallback
+        else:
+            total += d
+            known += 1
+    return total, known
+
+
+class HistoryWriter:
+    """
+    Пакетная запись истории в фоновом потоке.
+    record() только кладет запись в очередь и возвращается сразу.
+    Поток коммитит пачками и сам завершается после простоя,
+    поэтому не остается "висеть" после перезагрузки модуля.
+    """
+    BATCH_SIZE = 200
+    FLUSH_INTERVAL = 2.0
+    IDLE_TIMEOUT = 30.0
+
+    def __init__(self, db_path, key, run_id):
+        self.db_path = db_path
+        self.key = tuple(str(k) for k in key)
+        self.run_id = run_id
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, frame, duration, size=0):
+        self.queue.put(('frame', (*self.key, int(frame), float(duration), int(size or 0), self.run_id, time.time())))
+        self._ensure_thread()
+
+    def record_run(self, startup, frames):
+        self.queue.put(('run', (self.run_id, *self.key, float(startup), int(frames), time.time())))
+        self._ensure_thread()
+
+    def flush(self, timeout=5.0):
+        """
+        Ждет, пока очередь будет записана (не дольше timeout).
+        """
+        if not self.queue.unfinished_tasks:
+            return True
+        # Маркер обрывает накопление пачки, чтобы записать ее сразу
+        self.queue.put(('flush', None))
+        self._ensure_thread()
+        deadline = time.time() + timeout
+        while self.queue.unfinished_tasks:
+            if time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="RenderEstimator_History_Thread")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        try:
+            conn = connect(self.db_path)
+        except Exception as e:
+            print(f"[RenderEstimator] History DB error: {e}")
+            with self._lock:
+                self._drain()
+                self._thread = None
+            return
+
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=self.IDLE_TIMEOUT)
+                except queue.Empty:
+                    # Проверяем под локом, чтобы не потерять запись, добавленную прямо сейчас
+                    with self._lock:
+                        if self.queue.empty():
+                            self._thread = None
+                            return
+                    continue
+                batch = [item]
+                deadline = time.time() + self.FLUSH_INTERVAL
+                while len(batch) < self.BATCH_SIZE and batch[-1][0] != 'flush':
+                    try:
+                        batch.append(self.queue.get(timeout=max(0.0, deadline - time.time())))
+                    except queue.Empty:
+                        break
+                try:
+                    self._write(conn, batch)
+                except Exception as e:
+                    print(f"[RenderEstimator] History write error: {e}")
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        frames = [row for kind, row in batch if kind == 'frame']
+        runs = [row for kind, row in batch if kind == 'run']
+        with conn:
+            if frames:
+                conn.executemany(
+                    "INSERT INTO frames (hip, rop, renderer, resolution, frame, duration, size, run_id, ts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", frames)
+            if runs:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO runs (run_id, hip, rop, renderer, resolution, startup, frames, ts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", runs)
+
+    def _drain(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self.queue.task_done()
@@ -0,0 +1,178 @@
+"""
+Прогресс текущего кадра из лога рендерера без зависимости от hou.
+Karma/husk, Mantra и Redshift печатают проценты кадра (ALF_PROGRESS и т.п.);
+LogTail дочитывает лог с последней позиции (seek, без повторного чтения),
+а ProgressParser достает из новых строк долю готовности кадра.
+"""
+import os
+import re
+import time
+
+# Проценты кадра в логах рендереров: (regex, есть ли группа "всего")
+# ALF_PROGRESS 45% - Mantra, Karma/husk (-a / --alfprogress), RenderMan
+# Progress: 45% / Render progress: 45.5% - husk -V, Arnold
+# Block 12/64 rendered - Redshift (бакеты)
+DEFAULT_PATTERNS = (
+    r"ALF_PROGRESS\s+(\d+(?:\.\d+)?)\s*%",
+    r"[Pp]rogress:?\s+(\d+(?:\.\d+)?)\s*%",
+    r"Block\s+(\d+)\s*/\s*(\d+)\s+rendered",
+)
+
+
+def compile_patterns(patterns=None):
+    """
+    Регулярные выражения прогресса. Одна группа - проценты, две - готово/всего.
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    compiled = [re.compile(pattern) for pattern in (patterns or DEFAULT_PATTERNS)]
+    for regex in compiled:
+        if regex.groups not in (1, 2):
+            raise ValueError(f"Progress pattern needs 1 (percent) or 2 (done/total) groups: {regex.pattern}")
+    return compiled
+
+
+class LogTail:
+    """
+    Дочитывает растущий лог с последней позиции. Файл открывается один раз
+    и переоткрывается при ротации (другой inode) или усечении (файл стал короче).
+    Если лог вырос больше чем на max_read байт, читается только хвост -
+    для прогресса важны последние строки.
+    from_end=True - содержимое, которое уже было в файле (прошлый рендер), пропускается.
+    """
+    MAX_READ = 1 << 20
+
+    def __init__(self, path, from_end=True, max_read=MAX_READ):
+        self.path = path
+        self.max_read = max_read
+        self.offset = 0
+        self._file = None
+        self._inode = None
+        self._partial = b""
+        if from_end:
+            try:
+                st = os.stat(path)
+                self.offset = st.st_size
+                self._inode = st.st_ino
+            except OSError:
+                pass
+
+    def _reopen(self, st):
+        self.close()
+        self._file = open(self.path, 'rb')
+        if self._inode is not None and self._inode != st.st_ino:
+            # Новый файл (ротация или перезапись) - читаем его с начала
+            self.offset = 0
+        self._inode = st.st_ino
+
+    def read_lines(self):
+        """
+        Новые полные строки с прошлого вызова (str). Незаконченная строка ждет следующего вызова.
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return []
+        if self._file is None or st.st_ino != self._inode:
+            try:
+                self._reopen(st)
+            except OSError:
+                return []
+        if st.st_size < self.offset:
+            # Файл усечен (рендерер начал лог заново)
+            self.offset = 0
+            self._partial = b""
+        if st.st_size == self.offset:
+            return []
+
+        if st.st_size - self.offset > self.max_read:
+            # Большой прирост - только хвост; первая (обрезанная) строка отбрасывается
+            self.offset = st.st_size - self.max_read
+            self._partial = b""
+            skip_first = True
+        else:
+            skip_first = False
+
+        self._file.seek(self.offset)
+        data = self._file.read(st.st_size - self.offset)
+        self.offset += len(data)
+
+        # Проценты часто печатаются через \r в одной "строке"
+        chunks = re.split(rb"[\r\n]", self._partial + data)
+        self._partial = chunks.pop()
+        if skip_first and chunks:
+            chunks.pop(0)
+        return [chunk.decode('utf-8', 'replace') for chunk in chunks if chunk]
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+
+class ProgressParser:
+    """
+    Доля готовности кадра (0..1) по строкам лога.
+    """
+
+    def __init__(self, patterns=None):
+        self.patterns = compile_patterns(patterns)
+
+    def parse(self, line):
+        for regex in self.patterns:
+            match = regex.search(line)
+            if match is None:
+                continue
+            if regex.groups == 2:
+                total = float(match.group(2))
+                if total <= 0:
+                    continue
+                return min(1.0, float(match.group(1)) / total)
+            return min(1.0, float(match.group(1)) / 100.0)
+        return None
+
+    def last(self, lines):
+        """
+        Последняя доля готовности среди строк (или None).
+        """
+        for line in reversed(lines):
+            fraction = self.parse(line)
+            if fraction is not None:
+                return fraction
+        return None
+
+
+class LogProgress:
+    """
+    Источник прогресса текущего кадра: опрос лога не чаще interval секунд.
+    poll(now) -> новая доля готовности или None (нет новых строк прогресса).
+    """
+    DEFAULT_INTERVAL = 2.0
+
+    def __init__(self, path, patterns=None, interval=DEFAULT_INTERVAL, from_end=True):
+        self.tail = LogTail(path, from_end=from_end)
+        self.parser = ProgressParser(patterns)
+        self.interval = interval
+        self.last_poll_time = 0.0
+        self.fraction = None
+
+    @property
+    def path(self):
+        return self.tail.path
+
+    def next_poll(self):
+        return self.last_poll_time + self.interval
+
+    def poll(self, now=None):
+        self.last_poll_time = time.time() if now is None else now
+        fraction = self.parser.last(self.tail.read_lines())
+        if fraction is None:
+            return None
+        self.fraction = fraction
+        return fraction
+
+    def close(self):
+        self.tail.close()
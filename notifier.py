@@ -0,0 +1,448 @@
+"""
+Неблокирующая отправка уведомлений в Telegram.
+Сообщения кладутся в ограниченную очередь и отправляются фоновым потоком
+с таймаутами и повторами. Неотправленные сообщения сохраняются в outbox
+на диске и досылаются при следующем запуске рендера.
+"""
+import atexit
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+import urllib.parse
+import uuid
+import weakref
+
+DEFAULT_API_URL = "https://api.telegram.org"
+DEFAULT_OUTBOX_DIR = os.path.join(os.path.expanduser("~"), ".render_estimator", "outbox")
+# Файл outbox, который досылает какой-то процесс: "<имя>.json.<pid>-<id>.sending"
+CLAIM_SUFFIX = ".sending"
+# Захват старше этого (процесс упал при отправке) возвращается в outbox
+CLAIM_TIMEOUT = 600.0
+
+# Живые отправщики: при выходе из процесса каждый досылает или сохраняет очередь.
+# Слабые ссылки - atexit не держит старые экземпляры до конца процесса
+_instances = weakref.WeakSet()
+
+
+def _shutdown_all():
+    for instance in list(_instances):
+        instance.shutdown()
+
+
+atexit.register(_shutdown_all)
+
+
+class NotifyError(Exception):
+    """
+    Ошибка отправки. retryable=False - повторять бессмысленно (например, 400 Bad Request).
+    """
+
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class TelegramNotifier:
+    """
+    Фоновый отправщик сообщений Telegram Bot API.
+    send() возвращается сразу; сетевые проблемы не блокируют поток Houdini.
+    """
+    QUEUE_SIZE = 100
+    IDLE_TIMEOUT = 30.0
+    SHUTDOWN_TIMEOUT = 3.0
+
+    def __init__(self, token, api_url=DEFAULT_API_URL, outbox_dir=DEFAULT_OUTBOX_DIR,
+                 connect_timeout=5.0, read_timeout=10.0, retries=4, backoff=1.0, max_backoff=30.0):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.outbox_dir = outbox_dir
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = max(1, int(retries))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._current = None
+        self._closed = threading.Event()
+        _instances.add(self)
+
+    # --- Публичный API ---
+
+    def send(self, method, payload, callback=None, spool=True):
+        """
+        Ставит вызов API в очередь. Никогда не блокирует.
+        callback(result) вызывается из фонового потока с полем result ответа (или None при ошибке).
+        Если очередь переполнена, сообщение сразу уходит в outbox.
+        spool=False - не сохранять в outbox (для сообщений, которые теряют смысл позже).
+        """
+        item = {'method': method, 'payload': payload, 'callback': callback, 'outbox_file': None, 'spool': spool}
+        if self._closed.is_set():
+            self._spool(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self._spool(item)
+            return
+        self._ensure_thread()
+
+    def flush_outbox(self):
+        """
+        Досылает сообщения из outbox (чтение папки происходит в фоновом потоке).
+        """
+        try:
+            self.queue.put_nowait({'method': None, 'flush_outbox': True})
+        except queue.Full:
+            return
+        self._ensure_thread()
+
+    def wait(self, timeout=5.0):
+        """
+        Ждет отправки очереди (для тестов и консольного режима).
+        """
+        deadline = time.time() + timeout
+        while self.queue.unfinished_tasks:
+            if time.time() > deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+    def shutdown(self, timeout=None):
+        """
+        Вызывается при выходе из процесса: дает очереди немного времени,
+        остальное сохраняет в outbox.
+        """
+        if self._closed.is_set():
+            return
+        self.wait(self.SHUTDOWN_TIMEOUT if timeout is None else timeout)
+        self._closed.set()
+        with self._lock:
+            pending = []
+            while True:
+                try:
+                    pending.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+                self.queue.task_done()
+            if self._current is not None:
+                pending.insert(0, self._current)
+        for item in pending:
+            if item.get('method'):
+                self._spool(item)
+                if not item.get('outbox_file'):
+                    # Не сохранено (spool=False) - для вызывающего это ошибка доставки
+                    self._run_callback(item, None)
+
+    # --- Фоновый поток ---
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="RenderEstimator_Notifier_Thread")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while not self._closed.is_set():
+            try:
+                item = self.queue.get(timeout=self.IDLE_TIMEOUT)
+            except queue.Empty:
+                with self._lock:
+                    if self.queue.empty():
+                        self._thread = None
+                        return
+                continue
+            try:
+                if item.get('flush_outbox'):
+                    self._load_outbox()
+                else:
+                    self._current = item
+                    self._deliver(item)
+            except Exception as e:
+                print(f"[RenderEstimator] Notifier error: {e}")
+            finally:
+                self._current = None
+                self.queue.task_done()
+
+    def _deliver(self, item):
+        result = None
+        delay = self.backoff
+        for attempt in range(1, self.retries + 1):
+            if self._closed.is_set():
+                return
+            try:
+                result = self._call(item['method'], item['payload'])
+                break
+            except NotifyError as e:
+                if not e.retryable:
+                    print(f"[RenderEstimator] Telegram Error: {e}. Message dropped.")
+                    self._remove_outbox_file(item)
+                    self._run_callback(item, None)
+                    return
+                if attempt == self.retries:
+                    print(f"[RenderEstimator] Telegram Error: {e}. Saved to outbox.")
+                    self._spool(item)
+                    self._run_callback(item, None)
+                    return
+                wait = e.retry_after if e.retry_after else delay
+                # Не спим "насквозь" через shutdown
+                self._closed.wait(min(wait, self.max_backoff))
+                delay = min(delay * 2, self.max_backoff)
+
+        self._remove_outbox_file(item)
+        self._run_callback(item, result)
+
+    def _call(self, method, payload):
+        """
+        Один HTTP запрос к Bot API с раздельными таймаутами на соединение и чтение.
+        """
+        url = urllib.parse.urlsplit(f"{self.api_url}/bot{self.token}/{method}")
+        conn_cls = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        conn = conn_cls(url.hostname, url.port, timeout=self.connect_timeout)
+        try:
+            try:
+                conn.connect()
+                conn.sock.settimeout(self.read_timeout)
+                body = json.dumps(payload).encode('utf-8')
+                conn.request('POST', url.path, body=body, headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                status = response.status
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                raise NotifyError(f"{type(e).__name__}: {e}")
+        finally:
+            conn.close()
+
+        try:
+            parsed = json.loads(data.decode('utf-8'))
+        except ValueError:
+            parsed = {}
+
+        if 200 <= status < 300:
+            return parsed.get('result')
+
+        retry_after = (parsed.get('parameters') or {}).get('retry_after')
+        description = parsed.get('description', '')
+        retryable = status == 429 or status >= 500
+        raise NotifyError(f"HTTP {status} {description}".strip(), retryable=retryable, retry_after=retry_after)
+
+    def _run_callback(self, item, result):
+        callback = item.get('callback')
+        if callback is None:
+            return
+        try:
+            callback(result)
+        except Exception as e:
+            print(f"[RenderEstimator] Notifier callback error: {e}")
+
+    # --- Outbox ---
+
+    def _spool(self, item):
+        if item.get('outbox_source'):
+            # Захваченный файл outbox не отправлен - возвращаем его остальным процессам
+            self._release(item)
+            return
+        if item.get('outbox_file') or not item.get('spool', True):
+            # Уже лежит в outbox или не должно туда попадать
+            return
+        try:
+            os.makedirs(self.outbox_dir, exist_ok=True)
+            name = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.json"
+            path = os.path.join(self.outbox_dir, name)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'method': item['method'], 'payload': item['payload']}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            item['outbox_file'] = path
+        except OSError as e:
+            print(f"[RenderEstimator] Cannot save message to outbox: {e}")
+
+    def _load_outbox(self):
+        try:
+            names = sorted(os.listdir(self.outbox_dir))
+        except OSError:
+            return
+        self._recover_claims(n for n in names if n.endswith(CLAIM_SUFFIX))
+        names = [n for n in names if n.endswith('.json')]
+        if names:
+            print(f"[RenderEstimator] Resending {len(names)} message(s) from outbox.")
+        for name in names:
+            path = os.path.join(self.outbox_dir, name)
+            claimed = self._claim(path)
+            if claimed is None:
+                # Файл уже досылает другой процесс (outbox общий для всех рендеров)
+                continue
+            item = {'method': None, 'payload': None, 'callback': None,
+                    'outbox_file': claimed, 'outbox_source': path}
+            try:
+                with open(claimed, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                item['method'], item['payload'] = data.get('method'), data.get('payload')
+            except (OSError, ValueError):
+                pass
+            if not item['method']:
+                self._release(item)
+                continue
+            self._current = item
+            self._deliver(item)
+            if self._closed.is_set():
+                return
+
+    @staticmethod
+    def _claim(path):
+        """
+        Атомарно забирает файл outbox себе (rename удается только одному процессу).
+        Возвращает новый путь или None, если файл уже забран.
+        """
+        claimed = f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}{CLAIM_SUFFIX}"
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            return None
+        try:
+            # Время захвата - по нему находятся захваты упавших процессов
+            os.utime(claimed)
+        except OSError:
+            pass
+        return claimed
+
+    @staticmethod
+    def _release(item):
+        source, item['outbox_source'] = item.get('outbox_source'), None
+        try:
+            os.rename(item['outbox_file'], source)
+            item['outbox_file'] = source
+        except OSError as e:
+            print(f"[RenderEstimator] Cannot return message to outbox: {e}")
+
+    def _recover_claims(self, names):
+        now = time.time()
+        for name in names:
+            path = os.path.join(self.outbox_dir, name)
+            source, sep, _owner = path[:-len(CLAIM_SUFFIX)].rpartition('.json.')
+            if not sep:
+                continue
+            try:
+                if now - os.path.getmtime(path) > CLAIM_TIMEOUT:
+                    os.rename(path, source + '.json')
+            except OSError:
+                pass
+
+    def _remove_outbox_file(self, item):
+        path = item.get('outbox_file')
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class LiveMessage:
+    """
+    Одно сообщение прогресса, которое обновляется на месте (editMessageText).
+    update() ничего не отправляет сам: он только помечает, что текст устарел.
+    Правка отправляется не чаще одного раза в interval секунд, а текст строится
+    функцией render_text() в момент отправки - частые кадры "склеиваются" в одну правку.
+    """
+
+    def __init__(self, sender, chat_id, render_text, interval=30.0):
+        self.sender = sender
+        self.chat_id = chat_id
+        self.render_text = render_text
+        self.interval = max(1.0, float(interval))
+        self.message_id = None
+        self.last_edit_time = 0.0
+        self.last_text = None
+        self.finished = False
+        self._lock = threading.Lock()
+        self._timer = None
+        self._dirty = False
+
+    def start(self, text=None):
+        """
+        Публикует исходное сообщение. В outbox оно не сохраняется: досланное позже
+        "рендер идет" уже неверно (без message_id итоговый отчет уйдет обычным сообщением).
+        """
+        text = text if text is not None else self.render_text()
+        self.last_text = text
+        self.last_edit_time = time.time()
+        self.sender.send('sendMessage', {'chat_id': self.chat_id, 'text': text}, callback=self._on_created,
+                         spool=False)
+
+    def update(self):
+        """
+        Помечает сообщение устаревшим. Дешево, можно вызывать на каждый кадр.
+        """
+        with self._lock:
+            if self.finished:
+                return
+            self._dirty = True
+            if self._timer is None:
+                delay = max(0.0, self.last_edit_time + self.interval - time.time())
+                self._schedule(delay)
+
+    def finish(self, text):
+        """
+        Финальная правка (сразу, без ожидания интервала).
+        Если правка не прошла (сеть, сообщение удалено или слишком старое),
+        отчет уходит новым сообщением через outbox - итог не теряется.
+        Возвращает message_id, если сообщение было создано.
+        """
+        self.cancel()
+        self._edit(text, callback=lambda result: self._on_final_edit(text, result))
+        return self.message_id
+
+    def cancel(self):
+        """
+        Прекращает обновления без финальной правки.
+        """
+        with self._lock:
+            self.finished = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _schedule(self, delay):
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.name = "RenderEstimator_LiveMessage_Timer"
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            if self.finished or not self._dirty:
+                return
+            if self.message_id is None:
+                # Исходное сообщение еще не доставлено - попробуем позже
+                self._schedule(self.interval)
+                return
+            self._dirty = False
+        try:
+            self._edit(self.render_text())
+        except Exception as e:
+            print(f"[RenderEstimator] Live message error: {e}")
+
+    def _edit(self, text, callback=None):
+        if self.message_id is None or text == self.last_text:
+            return
+        self.last_text = text
+        self.last_edit_time = time.time()
+        self.sender.send('editMessageText', {'chat_id': self.chat_id, 'message_id': self.message_id, 'text': text},
+                         callback=callback, spool=False)
+
+    def _on_final_edit(self, text, result):
+        if result is None:
+            print("[RenderEstimator] Live message final edit failed. Sending report as a new message.")
+            self.sender.send('sendMessage', {'chat_id': self.chat_id, 'text': text})
+
+    def _on_created(self, result):
+        if result and 'message_id' in result:
+            self.message_id = result['message_id']
@@ -0,0 +1,180 @@
+"""
+Шаблон пути выходного файла, скомпилированный один раз.
+Разворачивает номер кадра на чистом Python, без вызовов hou.
+Поддерживает $F, $F<n>, ${F}, ${F<n>}, $FF, \\$F (экранированный для USD), %d, %0<n>d и ####.
+"""
+import re
+
+# Токены кадра. $FF должен идти раньше $F; $F не должен съедать $FPS, $FEND и т.п.
+_FRAME_TOKEN_RE = re.compile(
+    r'\\?\$\{F(?P<brace_pad>\d*)\}'
+    r'|\\?\$FF(?![A-Za-z0-9_])'
+    r'|\\?\$F(?P<pad>\d*)(?![A-Za-z_])'
+    r'|%(?:0(?P<printf_pad>\d+))?d'
+    r'|(?P<hashes>#+)'
+)
+
+# Числа в готовом пути (кандидаты на номер кадра)
+_NUMBER_RE = re.compile(r'(?<![0-9])\d+(?![0-9])')
+
+# То, что нельзя развернуть статически: выражения в backticks и переменные времени
+_DYNAMIC_RE = re.compile(r'`|\$\{?(?:T|SF|ST)\}?(?![A-Za-z0-9_])')
+
+
+class FrameToken:
+    """
+    Токен номера кадра. kind: 'int' или 'float' ($FF).
+    """
+    __slots__ = ('kind', 'pad')
+
+    def __init__(self, kind='int', pad=0):
+        self.kind = kind
+        self.pad = pad
+
+    def format(self, frame):
+        if self.kind == 'float':
+            frame = float(frame)
+            if frame.is_integer():
+                return str(int(frame))
+            return repr(frame)
+        if self.pad:
+            return f"{int(frame):0{self.pad}d}"
+        return str(int(frame))
+
+
+class PathTemplate:
+    """
+    Путь, разбитый на литералы и токены кадра.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.has_frame = any(isinstance(p, FrameToken) for p in parts)
+
+    def expand(self, frame):
+        return ''.join(p if isinstance(p, str) else p.format(frame) for p in self.parts)
+
+    @classmethod
+    def compile(cls, raw, expand=None):
+        """
+        Компилирует неразвернутую строку пути (parm.unexpandedString()).
+        expand(str) -> str разворачивает остальные переменные ($HIP, $OS, $JOB...).
+        Возвращает None, если путь содержит то, что нельзя развернуть статически.
+        """
+        if not raw:
+            return None
+
+        parts = []
+        pos = 0
+        for match in _FRAME_TOKEN_RE.finditer(raw):
+            literal = raw[pos:match.start()]
+            if literal:
+                parts.append(literal)
+            parts.append(_token_from_match(match))
+            pos = match.end()
+        if pos < len(raw):
+            parts.append(raw[pos:])
+
+        literals = [p for p in parts if isinstance(p, str)]
+        if any(_DYNAMIC_RE.search(p) for p in literals):
+            return None
+
+        if expand is not None:
+            expanded = []
+            for p in parts:
+                if isinstance(p, str) and '$' in p:
+                    try:
+                        p = expand(p)
+                    except Exception:
+                        return None
+                    if p is None:
+                        return None
+                expanded.append(p)
+            parts = expanded
+        elif any('$' in p for p in literals):
+            return None
+
+        return cls(parts)
+
+    @classmethod
+    def from_examples(cls, examples):
+        """
+        Восстанавливает шаблон по готовым путям [(кадр, путь), ...]
+        (например, USD productName, вычисленный на нескольких кадрах).
+        Номер кадра ищется среди чисел пути, начиная с имени файла; шаблон
+        должен воспроизвести все примеры. Возвращает None, если не получилось.
+        """
+        if not examples:
+            return None
+        frame, path = examples[0]
+        same_path = all(p == path for _f, p in examples)
+        if same_path and len({f for f, _p in examples}) > 1:
+            # Путь не зависит от кадра
+            return cls([path])
+
+        for match in reversed(list(_NUMBER_RE.finditer(path))):
+            digits = match.group(0)
+            if int(digits) != frame:
+                continue
+            # Сначала с паддингом по примеру ($F4 -> 1001), потом без него
+            for pad in dict.fromkeys((len(digits), 0)):
+                template = cls([p for p in (path[:match.start()], FrameToken('int', pad), path[match.end():]) if p != ''])
+                if all(template.expand(f) == p for f, p in examples):
+                    return template
+
+        if same_path:
+            # Один кадр без номера в пути
+            return cls([path])
+        return None
+
+    def frame_matcher(self):
+        """
+        Обратное преобразование "имя файла -> кадр" для поиска кадров по листингу папки.
+        Возвращает (папка, функция(имя) -> кадр или None) или None,
+        если номер кадра есть в пути папки (тогда папок много и листинг не поможет).
+        """
+        path = ''.join(p if isinstance(p, str) else '\0' for p in self.parts)
+        sep = max(path.rfind('/'), path.rfind('\\'))
+        if '\0' in path[:sep + 1] or not self.has_frame:
+            return None
+        directory = path[:sep] if sep > 0 else ('/' if sep == 0 else '.')
+
+        # Части после последнего разделителя -> regex имени файла
+        pattern = []
+        consumed = 0
+        for p in self.parts:
+            if isinstance(p, str):
+                start = max(0, sep + 1 - consumed)
+                if start < len(p):
+                    pattern.append(re.escape(p[start:]))
+                consumed += len(p)
+            else:
+                pattern.append(r'(-?\d+(?:\.\d+)?)' if p.kind == 'float' else r'(-?\d+)')
+                consumed += 1
+        regex = re.compile(''.join(pattern))
+
+        def parse(name):
+            match = regex.fullmatch(name)
+            if not match:
+                return None
+            value = float(match.group(1))
+            if not value.is_integer():
+                return None
+            frame = int(value)
+            # Проверка: разные токены ($F4 и $F) должны дать то же имя
+            full = self.expand(frame)
+            if max(full.rfind('/'), full.rfind('\\')) >= 0:
+                full = full[max(full.rfind('/'), full.rfind('\\')) + 1:]
+            return frame if full == name else None
+
+        return directory, parse
+
+
+def _token_from_match(match):
+    text = match.group(0)
+    if match.group('hashes'):
+        return FrameToken('int', len(match.group('hashes')))
+    if text.lstrip('\\').startswith('$FF'):
+        return FrameToken('float')
+    pad = match.group('brace_pad') or match.group('pad') or match.group('printf_pad') or ''
+    return FrameToken('int', int(pad) if pad else 0)
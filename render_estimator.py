@@ -1,38 +1,26 @@
 import threading
+import functools
 import re
-import hou
 import time
 import datetime
 import os
-import json
 import socket
-import urllib.request
-import urllib.parse
-import urllib.error
 import sys
+import argparse
+import json
 
-# Глобальный словарь для хранения статистики рендера
-# Мы используем словарь, чтобы состояние сохранялось между вызовами функций
-render_stats = {
-    'start_time': None,
-    'last_frame_time': None,
-    'frames_rendered': 0,
-    'total_frames': 0,
-    'frame_times': [], # Список кортежей (номер_кадра, время)
-    'hip_name': "Unknown",
-    'rop_name': "Unknown",
-    'camera_name': "Unknown",
-    'renderer': "Unknown",
-    'resolution': "Unknown",
-    'hostname': "Unknown",
-    'lights': [],
-    'output_path': "Unknown",
-    'total_size_bytes': 0
-}
-
-# --- File Watcher Globals ---
-watcher_thread = None
-stop_watcher_event = None
+try:
+    import hou
+except ImportError:
+    # Без Houdini (husk/hbatch на ферме) доступен только консольный watcher:
+    # python -m render_estimator watch --pattern ... --range ...
+    hou = None
+
+# --- File Watcher ---
+# Интервал страховочного полного скана при работе через inotify (сек)
+WATCHER_SWEEP_INTERVAL = 30.0
+# Сколько finish_render ждет последние кадры и остановку watcher'а (сек)
+WATCHER_DRAIN_TIMEOUT = 1.0
 
 # --- CONFIGURATION ---
 # Check if stdout supports colors (e.g., not redirected to a file)
@@ -51,21 +39,82 @@ class Colors:
     CYAN = "\033[96m" if USE_COLORS else ""
     WHITE = "\033[97m" if USE_COLORS else ""
 
-def log(message, color=Colors.RESET, icon=""):
+def log(message, color=Colors.RESET, icon="", file=None):
     """
     Helper for formatted logging.
+    file - поток вывода (sys.stderr, когда stdout занят данными, например plan --json).
     """
     prefix = f"{Colors.CYAN}[RenderEstimator]{Colors.RESET}"
     icon_str = f"{icon} " if icon else ""
     if USE_COLORS and color:
-        print(f"{prefix} {color}{icon_str}{message}{Colors.RESET}")
+        print(f"{prefix} {color}{icon_str}{message}{Colors.RESET}", file=file)
     else:
-        print(f"[RenderEstimator] {icon_str}{message}")
+        print(f"[RenderEstimator] {icon_str}{message}", file=file)
 
 import importlib
 import utils
 importlib.reload(utils)
-from utils import format_duration, format_frame_list
+from utils import format_duration
+import watcher
+importlib.reload(watcher)
+import estimators
+importlib.reload(estimators)
+import history
+importlib.reload(history)
+import notifier
+importlib.reload(notifier)
+import scene_info
+importlib.reload(scene_info)
+import path_template
+importlib.reload(path_template)
+import frame_stats
+importlib.reload(frame_stats)
+import status_bar
+importlib.reload(status_bar)
+import aggregator
+importlib.reload(aggregator)
+import planner
+importlib.reload(planner)
+import log_progress
+importlib.reload(log_progress)
+
+import session as render_session
+importlib.reload(render_session)
+
+# Сессии рендера (render_session.RenderSession) по пути ROP: у каждого рендера своя
+# статистика, модель прогноза и File Watcher, поэтому одновременные рендеры
+# (фоновые, ROP network с несколькими ROP) не мешают друг другу. Словарь и общий
+# поток File Watcher переживают importlib.reload из loader_pre_render.py.
+try:
+    active_sessions
+except NameError:
+    active_sessions = {}
+
+# Общий поток File Watcher для всех сессий (задания - FrameWatch).
+# Хаб с работающими заданиями остается после перезагрузки модуля, простаивающий - пересоздается.
+try:
+    watcher_hub
+except NameError:
+    watcher_hub = None
+if watcher_hub is None or not len(watcher_hub):
+    watcher_hub = watcher.WatcherHub()
+
+# Статус-бар Houdini (status_bar.StatusPump). Создается в start_render; установленный
+# на цикл событий переживает перезагрузку модуля, чтобы не было двух callback'ов.
+try:
+    status_pump
+except NameError:
+    status_pump = None
+
+# Фоновый отправщик Telegram (создается при первой отправке). Переживает перезагрузку модуля:
+# второй экземпляр со своим atexit и flush_outbox отправил бы повторно сообщения из outbox,
+# которые первый еще пытается доставить.
+try:
+    telegram_notifier
+except NameError:
+    telegram_notifier = None
+# Сколько ждать размеры последних кадров перед итоговым отчетом (сек)
+SIZE_WAIT_TIMEOUT = 5.0
 
 def get_output_path_parm(node):
     """
@@ -84,99 +133,304 @@ def get_output_path_parm(node):
             return parm
     return None
 
-def file_watcher_loop(paths_to_watch, start_time, stop_event):
+class FrameWatch:
     """
-    Фоновый поток, который следит за появлением файлов.
+    File Watcher одного рендера - задание общего потока watcher.WatcherHub.
+    Находит готовые файлы кадров сессии, считает время кадров и отправляет итоговый отчет.
+    pending_frames - watcher.HorizonIndex (окно ближайших кадров + редкий sweep)
+    или watcher.DirectoryIndex ({frame: path}).
+    schedule - watcher.PollSchedule (интервал опроса и таймаут зависания).
+    
+    Он же - контроллер watcher'а для основного потока: pending, last_activity и eta()
+    для статуса, drain() и cancel() для завершения рендера (finish_render).
+    Индекс кадров трогает только поток хаба, контроллер лишь выставляет флаги и будит его.
     """
-    global render_stats
+    def __init__(self, session, pending_frames, schedule=None, hub=None):
+        self.session = session
+        self.pending_frames = pending_frames
+        self.schedule = schedule or watcher.PollSchedule()
+        self.hub = hub
+        self.start_time = session.get('start_time')
+        
+        # Трейкинг активности для таймаута
+        self.last_activity_time = self.start_time
+        self.last_poll_time = 0.0
+        self.last_sweep_time = time.time()
+        # Точное время появления кадров по событиям inotify {frame: timestamp}
+        self.event_times = {}
+        self.timed_out = False
+        self.finished = False
+        # drain(): частые проверки, первая - с полным проходом
+        self.draining = False
+        self.drain_sweep = False
+        # cancel(): заголовок итогового отчета (None - без отчета)
+        self.cancelled = False
+        self.cancel_title = None
+        # Выставляется, когда задание снято с хаба (итоговый отчет отправляется после)
+        self.stopped_event = threading.Event()
+        # Прогресс текущего кадра из лога рендерера (log_progress.LogProgress, опционально)
+        self.log_progress = None
+        # Работает ли событийный бэкенд (передается хабом в next_poll)
+        self.evented = False
+        
+        log(f"FileWatcher started. Watching {len(pending_frames)} files.", Colors.BLUE, "👀")
+    
+    # --- Контроллер (основной поток) ---
     
-    # paths_to_watch = {frame_number: file_path}
-    pending_frames = paths_to_watch.copy()
+    @property
+    def pending(self):
+        """
+        Сколько кадров еще не найдено.
+        """
+        return len(self.pending_frames)
     
-    log(f"FileWatcher started. Watching {len(pending_frames)} files.", Colors.BLUE, "👀")
+    @property
+    def last_activity(self):
+        """
+        Время (time.time()) последнего найденного кадра или старта рендера.
+        """
+        return self.last_activity_time
+    
+    def eta(self):
+        """
+        Оставшееся время рендера (сек) по модели прогноза сессии.
+        """
+        return self.session.estimate()[1]
+    
+    def drain(self, timeout=1.0):
+        """
+        Просит поток хаба сразу проверить файлы (с полным проходом) и проверять их
+        часто, пока не найдутся все кадры. Ждет не дольше timeout.
+        Возвращает True, если все кадры найдены (итоговый отчет отправит watcher).
+        """
+        self.drain_sweep = True
+        self.draining = True
+        self._wake()
+        if self.stopped_event.wait(timeout):
+            return not self.pending_frames
+        # Кадры не дописались (detached рендер) - обычное расписание, без опроса каждые min_interval
+        self.draining = False
+        self.drain_sweep = False
+        return False
     
-    # Трейкинг активности для таймаута
-    last_activity_time = start_time # Use start_time initially
+    def cancel(self, title=None, timeout=1.0):
+        """
+        Останавливает watcher: поток хаба снимает задание и освобождает inotify/папки.
+        title - заголовок итогового отчета (None - без отчета).
+        Возвращает True, если задание снято за timeout.
+        """
+        self.cancel_title = title
+        self.cancelled = True
+        self._wake()
+        return self.stopped_event.wait(timeout)
     
-    def check_for_updates():
-        nonlocal last_activity_time
-        # Проверяем файлы
-        completed_frames = []
-        for frame, path in pending_frames.items():
-            if os.path.exists(path):
-                # Проверяем время модификации
-                try:
-                    mtime = os.path.getmtime(path)
-                    # Если файл изменен ПОСЛЕ старта рендера (с небольшим запасом)
-                    if mtime >= start_time - 1.0:
-                        completed_frames.append(frame)
-                except:
-                   pass
+    def _wake(self):
+        if self.hub is not None:
+            self.hub.wake()
+    
+    # --- Задание WatcherHub (поток хаба) ---
+    
+    @property
+    def active(self):
+        return (bool(self.pending_frames) and not self.timed_out and not self.finished
+                and not self.cancelled and not self.session.closed)
+    
+    def directories(self):
+        pending = self.pending_frames
+        # Окно сдвигается - папки меняются (если номер кадра в пути папки)
+        if hasattr(pending, 'directories'):
+            return pending.directories()
+        return pending.by_dir.keys()
+    
+    def on_event(self, directory, name, timestamp):
+        frame = self.pending_frames.lookup(directory, name)
+        if frame is None:
+            return False
+        self.event_times.setdefault(frame, timestamp)
+        return True
+    
+    def stall_timeout(self):
+        # Таймаут неактивности: масштабируется по p99 времени кадра
+        return self.schedule.stall_timeout(self.session.percentile(0.99))
+    
+    def next_file_check(self, now, evented=False):
+        """
+        Время следующей проверки файлов (без учета чтения лога).
+        """
+        if self.draining:
+            # Рендер закончен - кадры дописываются прямо сейчас
+            return 0.0 if self.drain_sweep else self.last_poll_time + self.schedule.min_interval
+        # Страховочный проход (пропущенные события, NFS) и проверка таймаута
+        deadline = min(self.last_sweep_time + WATCHER_SWEEP_INTERVAL,
+                       self.last_activity_time + self.stall_timeout())
+        if evented:
+            return deadline
+        # Опрос чаще ближе к ожидаемому окончанию кадра, реже - между ними
+        last_frame_time = self.session.get('last_frame_time') or self.start_time
+        interval = self.schedule.interval(now - last_frame_time, self.session.percentile(0.5))
+        return min(deadline, self.last_poll_time + interval)
+    
+    def next_poll(self, now, evented=False):
+        self.evented = evented
+        deadline = self.next_file_check(now, evented)
+        if self.log_progress is not None and not self.draining:
+            deadline = min(deadline, self.log_progress.next_poll())
+        return deadline
+    
+    def poll(self, now, changed=False):
+        if self.log_progress is not None and now >= self.log_progress.next_poll():
+            self.poll_log(now)
+            if not changed and now < self.next_file_check(now, self.evented):
+                # Подошел только срок лога - файлы не менялись, скан папок не нужен
+                return
+        self.last_poll_time = now
+        sweep = self.drain_sweep or now - self.last_sweep_time >= WATCHER_SWEEP_INTERVAL
+        if sweep:
+            self.drain_sweep = False
+            self.last_sweep_time = now
+        self.check_for_updates(sweep=sweep)
+        
+        stall_timeout = self.stall_timeout()
+        if self.pending_frames and time.time() - self.last_activity_time > stall_timeout:
+            log(f"File Watcher timed out (no new frames for {format_duration(stall_timeout)}). Stopping.", Colors.RED, "💀")
+            self.timed_out = True
+    
+    def finish(self):
+        """
+        Вызывается потоком хаба после снятия задания: итоговый отчет (Watcher берет ответственность на себя).
+        Отчет ждет метаданные, размеры и историю (до десятка секунд), поэтому отправляется
+        отдельным потоком сессии - общий поток хаба сразу возвращается к watcher'ам других рендеров.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        if self.log_progress is not None:
+            self.log_progress.close()
+        self.stopped_event.set()
+        if self.session.closed:
+            return
+        self.session.start_thread(self._send_report, "RenderEstimator_Report_Thread")
+    
+    def poll_log(self, now):
+        """
+        Дочитывает лог рендерера: доля готовности текущего кадра уточняет прогноз
+        между кадрами (длинный кадр не висит без прогресса до появления файла).
+        """
+        fraction = self.log_progress.poll(now)
+        if fraction is None:
+            return
+        session = self.session
+        session.set_frame_progress(fraction, now)
+        # Рендерер жив - длинный кадр не считается зависанием
+        self.last_activity_time = now
+        publish_progress(session)
+        
+        rem_str = str(datetime.timedelta(seconds=int(session.estimate()[1])))
+        post_status(f"RenderEstimator: {session.get('rop_name')}: кадр {fraction * 100:.0f}% "
+                    f"({session.get('frames_rendered')}/{session.get('total_frames')}). Осталось: {rem_str}")
+    
+    def _send_report(self):
+        session = self.session
+        # Остановлен явно (перезапуск рендера) - отчет не нужен
+        if session.closed:
+            return
+        
+        if self.cancelled:
+            if self.cancel_title:
+                log(f"File Watcher stopped. Frames not found: {self.pending}.", Colors.YELLOW, "⛔")
+                finalize_and_send_report(session, title=self.cancel_title)
+            return
+        
+        if self.timed_out:
+            # Отправляем отчет о таймауте
+            finalize_and_send_report(session, title="💀 File Watcher Timed Out")
+            return
+        
+        # Final check for any fast frames appearing just as we stopped
+        if self.pending_frames:
+            self.check_for_updates()
+        
+        log("FileWatcher finished.", Colors.BLUE, "🏁")
+        finalize_and_send_report(session)
+    
+    def check_for_updates(self, sweep=False):
+        """
+        Забирает готовые кадры из индекса, считает их время и обновляет статистику.
+        """
+        session = self.session
+        start_time = self.start_time
+        pending_frames = self.pending_frames
+        event_times = self.event_times
+        # Проверяем файлы (mtime и размер берутся из результатов scandir)
+        found = pending_frames.pop_completed(min_mtime=start_time - 1.0)
+        if sweep and hasattr(pending_frames, 'sweep'):
+            # Кадры за пределами окна, готовые не по порядку
+            found = sorted(found + pending_frames.sweep(min_mtime=start_time - 1.0))
+        completed_frames = [frame for frame, _path, _mtime, _size in found]
+        sizes = {frame: size for frame, _path, _mtime, size in found}
         
         # Обрабатываем найденные кадры
         if completed_frames:
             # Сортируем чтобы уведомления шли по порядку
             completed_frames.sort()
             
-            last_activity_time = time.time()
+            self.last_activity_time = time.time()
             current_time = time.time()
             
-            # --- Логика усреднения времени для "пачки" кадров ---
-            # Если мы обнаружили сразу несколько кадров (например 10 штук за 1 сек),
-            # это значит что они рендерились параллельно или очень быстро.
-            # Если считать duration = current - last для каждого по очереди в цикле,
-            # то первый получит все время, а остальные 0.0s.
-            # Поэтому мы распределяем время равномерно.
-            
-            last_time_stats = render_stats['last_frame_time']
-            if last_time_stats is None: last_time_stats = render_stats['start_time']
+            last_time_stats = session.get('last_frame_time') or start_time
             
-            # Общее время, прошедшее с последнего обнаружения (или старта)
-            batch_duration_total = current_time - last_time_stats
-            
-            # Время на один кадр в этой пачке
-            # Если batch_duration_total очень мал (быстрый диск/CPU), будет малое число, но не 0 (если sleep работает)
-            if batch_duration_total < 0: batch_duration_total = 0
-            
-            frames_count = len(completed_frames)
-            avg_batch_duration = batch_duration_total / frames_count
-            
-            # Обновляем глобальное время "последнего кадра" сразу на текущее
-            render_stats['last_frame_time'] = current_time
-            
-            for i, frame in enumerate(completed_frames):
-                # Удаляем из списка ожидания
-                if frame in pending_frames:
-                    # Capture path for size calculation
-                    f_path = pending_frames[frame]
-                    del pending_frames[frame]
-                    
-                    try:
-                        if os.path.exists(f_path):
-                            s_bytes = os.path.getsize(f_path)
-                            render_stats['total_size_bytes'] += s_bytes
-                    except:
-                        pass
+            # --- Реальные времена по времени файлов (уже прочитано сканом) ---
+            # Кадры сортируются по моменту появления, каждый получает интервал
+            # от предыдущего готового кадра - "пачка" не усредняется
+            timed = watcher.frame_durations(found, last_time_stats, current_time)
+            durations = {}
+            if timed is not None:
+                durations, last_frame_time = timed
+                for frame in completed_frames:
+                    event_times.pop(frame, None)
+            elif all(frame in event_times for frame in completed_frames):
+                # --- Часы файлового сервера сдвинуты: времена из событий inotify ---
+                # Каждый кадр получает время от предыдущего события до своего
+                prev_time = last_time_stats
+                for frame in sorted(completed_frames, key=lambda f: event_times[f]):
+                    t = event_times.pop(frame)
+                    durations[frame] = max(0.0, t - prev_time)
+                    prev_time = max(prev_time, t)
+                last_frame_time = prev_time
+            else:
+                # --- Запасной вариант: усреднение времени для "пачки" кадров ---
+                # Если мы обнаружили сразу несколько кадров (например 10 штук за 1 сек),
+                # это значит что они рендерились параллельно или очень быстро.
+                # Если считать duration = current - last для каждого по очереди в цикле,
+                # то первый получит все время, а остальные 0.0s.
+                # Поэтому мы распределяем время равномерно.
                 
-                # Обновляем статистику
-                # Для каждого кадра записываем усредненное время
-                duration = avg_batch_duration
+                # Общее время, прошедшее с последнего обнаружения (или старта)
+                batch_duration_total = current_time - last_time_stats
                 
-                render_stats['frames_rendered'] += 1
-                render_stats['frame_times'].append((frame, duration))
+                # Время на один кадр в этой пачке
+                # Если batch_duration_total очень мал (быстрый диск/CPU), будет малое число, но не 0 (если sleep работает)
+                if batch_duration_total < 0: batch_duration_total = 0
                 
-                # Расчет прогресса (общий)
-                elapsed = current_time - render_stats['start_time']
-                count = render_stats['frames_rendered']
-                total = render_stats['total_frames']
+                frames_count = len(completed_frames)
+                avg_batch_duration = batch_duration_total / frames_count
+                for frame in completed_frames:
+                    event_times.pop(frame, None)
+                    durations[frame] = avg_batch_duration
                 
-                # Среднее время вообще по всем кадрам
-                avg = elapsed / count if count > 0 else 0
-                rem_frames = total - count
-                if rem_frames < 0: rem_frames = 0
+                # Время "последнего кадра" сразу на текущее
+                last_frame_time = current_time
+            
+            session.touch(last_frame_time)
+            
+            for frame in completed_frames:
+                # Размер уже известен из скана папки
+                size_bytes = sizes.get(frame, 0)
                 
-                rem_time = avg * rem_frames
-                if rem_time < 0: rem_time = 0
+                # Обновляем статистику и прогноз (одним шагом под локом сессии)
+                duration = durations[frame]
+                avg, rem_time, _done = session.add_frame(frame, duration, size_bytes)
+                record_history(session, frame, duration, size_bytes)
                 
                 rem_str = str(datetime.timedelta(seconds=int(rem_time)))
                 
@@ -190,39 +444,11 @@ def file_watcher_loop(paths_to_watch, start_time, stop_event):
                        f"({Colors.CYAN}~{avg_str}/fr{Colors.RESET})")
                 
                 log(msg, Colors.GREEN, "✅")
+                publish_progress(session)
                 
-                # UI Update removed to prevent thread locking/deadlocks in Houdini
-                # try:
-                #     # Strip colors for UI status message
-                #     clean_msg = f"RenderEstimator: Frame {frame} done. Rem: {rem_str}"
-                #     hou.ui.setStatusMessage(clean_msg)
-                # except:
-                #     pass
-
-    while (stop_event is not None and not stop_event.is_set()) and pending_frames:
-        check_for_updates()
-        
-        # Таймаут неактивности (10 минут)
-        if time.time() - last_activity_time > 600:
-            log("File Watcher timed out (no new frames for 10 min). Stopping.", Colors.RED, "💀")
-            # Отправляем отчет о таймауте
-            finalize_and_send_report(title="💀 File Watcher Timed Out")
-            return # Выходим и НЕ отправляем второй отчет ниже
-            
-        # Спим немного
-        time.sleep(1.0)
-    
-    # Final check for any fast frames appearing just as we stopped
-    # Only if NOT stopped explicitly (e.g. by restart)
-    if pending_frames and not stop_event.is_set():
-        check_for_updates()
-    
-    log("FileWatcher finished.", Colors.BLUE, "🏁")
-    
-    # Отправляем финальный отчет (Watcher берет ответственность на себя)
-    # Only if NOT stopped explicitly
-    if not stop_event.is_set():
-        finalize_and_send_report()
+                # hou.ui нельзя звать из этого потока - статус-бар обновит основной поток (StatusPump)
+                post_status(f"RenderEstimator: {session.get('rop_name')}: кадр {frame} готов "
+                            f"({session.get('frames_rendered')}/{session.get('total_frames')}). Осталось: {rem_str}")
 
 def resolve_frame_in_path(path, frame):
     """
@@ -238,49 +464,234 @@ def resolve_frame_in_path(path, frame):
     # $F followed by optional digits
     return re.sub(r'\$F(\d*)', repl, path)
 
-def try_start_file_watcher(rop):
+def expand_hou_string(text):
     """
-    Пытается запустить File Watcher.
-    Возвращает True, если watcher был запущен.
+    Разворачивает переменные ($HIP, $OS, $JOB...) в строке через hou.
     """
-    global render_stats, watcher_thread, stop_watcher_event
+    text_module = getattr(hou, 'text', None)
+    if text_module is not None and hasattr(text_module, 'expandString'):
+        return text_module.expandString(text)
+    return hou.expandString(text)
+
+def eval_output_path(path_parm, frame):
+    """
+    Путь вывода через evalAtFrame (медленный путь для путей с выражениями).
+    """
+    path = path_parm.evalAtFrame(frame)
+    # Fix: Если в пути остались $F (из-за экранирования \$F для USD), заменяем их вручную
+    if path and '$F' in path:
+        path = resolve_frame_in_path(path, frame)
+    return path
+
+def get_output_template(session, path_parm, check_frames=()):
+    """
+    Компилирует шаблон пути из unexpandedString() один раз (кэш - в сессии рендера).
+    Шаблон сверяется с evalAtFrame на check_frames; если путь содержит выражения
+    или результат не совпал - возвращает None (нужен evalAtFrame на каждый кадр).
+    """
+    try:
+        raw = path_parm.unexpandedString()
+        key = (path_parm.path(), raw)
+    except Exception:
+        return None
+    
+    if key in session.output_templates:
+        return session.output_templates[key]
+    
+    template = path_template.PathTemplate.compile(raw, expand=expand_hou_string)
+    if template is not None:
+        try:
+            for frame in check_frames:
+                if template.expand(frame) != eval_output_path(path_parm, frame):
+                    log(f"Output path template mismatch at frame {frame}. Using evalAtFrame.", Colors.YELLOW)
+                    template = None
+                    break
+        except Exception:
+            template = None
+    
+    session.output_templates[key] = template
+    return template
+
+# Дополнительные image planes в отдельных файлах: (счетчик multiparm, флаг "в отдельный файл", путь)
+EXTRA_OUTPUT_MULTIPARMS = [
+    ('vm_numaux', 'vm_usefile_plane{}', 'vm_filename_plane{}'),
+    ('vm_cryptolayers', 'vm_cryptolayeroutputenable{}', 'vm_cryptolayeroutput{}'),
+]
+# Deep выход Mantra: {значение vm_deepresolver: параметр пути}
+DEEP_OUTPUT_PARMS = {'camera': 'vm_dcmfilename', 'shadow': 'vm_dsmfilename'}
+# Значения пути, которые означают вывод не в файл (MPlay)
+NON_FILE_OUTPUTS = ('', 'ip', 'md')
+
+def get_extra_output_parms(rop):
+    """
+    Параметры путей дополнительных файлов кадра: image planes, cryptomatte и deep (Mantra).
+    """
+    parms = []
+    for count_name, enable_name, path_name in EXTRA_OUTPUT_MULTIPARMS:
+        count_parm = rop.parm(count_name)
+        if not count_parm:
+            continue
+        for i in range(1, count_parm.evalAsInt() + 1):
+            enable = rop.parm(enable_name.format(i))
+            path_parm = rop.parm(path_name.format(i))
+            if enable and enable.eval() and path_parm and path_parm.eval() not in NON_FILE_OUTPUTS:
+                parms.append(path_parm)
+    
+    resolver = rop.parm('vm_deepresolver')
+    if resolver:
+        path_parm = rop.parm(DEEP_OUTPUT_PARMS.get(resolver.evalAsString(), ''))
+        if path_parm and path_parm.eval() not in NON_FILE_OUTPUTS:
+            parms.append(path_parm)
+    return parms
+
+def get_usd_products(session, rop, frames, skip_first=False):
+    """
+    RenderProducts из USD render settings (Karma/Solaris).
+    skip_first - первый product переопределен параметром Output Image ROP.
+    Шаблон пути восстанавливается по productName на нескольких кадрах.
+    Stage берется из сборщика метаданных сессии (ищется один раз за рендер).
+    """
+    rs_parm = rop.parm('rendersettings')
+    if not rs_parm or not len(frames):
+        return []
+    stage = get_scene_collector(session, rop).stage()
+    if not stage:
+        return []
+    
+    prims = scene_info.find_render_products(stage, rs_parm.eval())
+    if skip_first:
+        prims = prims[1:]
+    
+    sample_frames = sorted({frames[0], frames[min(1, len(frames) - 1)], frames[len(frames) - 1]})
+    products = []
+    for prim in prims:
+        examples = [(frame, scene_info.product_name(prim, frame)) for frame in sample_frames]
+        if any(path in NON_FILE_OUTPUTS or path is None for _frame, path in examples):
+            continue
+        template = path_template.PathTemplate.from_examples(examples)
+        products.append((template, functools.partial(scene_info.product_name, prim)))
+    return products
+
+def get_output_products(session, rop):
+    """
+    Все файлы, которые ROP пишет на каждый кадр: основной путь, дополнительные
+    image planes / deep / cryptomatte и USD RenderProducts.
+    Возвращает [(PathTemplate или None, функция(кадр) -> путь), ...].
+    Шаблон разворачивает путь без hou, функция - медленный путь (только основной поток).
+    Кэшируется в сессии рендера.
+    """
+    key = rop.path()
+    if key in session.output_products:
+        return session.output_products[key]
+    
+    f_start, f_end, f_step = get_frame_range(rop)
+    products = []
+    
+    path_parm = get_output_path_parm(rop)
+    has_primary = bool(path_parm) and path_parm.eval() not in NON_FILE_OUTPUTS
+    parms = ([path_parm] if has_primary else []) + get_extra_output_parms(rop)
+    for parm in parms:
+        template = get_output_template(session, parm, (f_start, f_end))
+        products.append((template, functools.partial(eval_output_path, parm)))
+    
+    try:
+        products += get_usd_products(session, rop, watcher.FrameRange(f_start, f_end, f_step), skip_first=has_primary)
+    except Exception as e:
+        log(f"Render products error: {e}", Colors.YELLOW)
     
-    if watcher_thread and watcher_thread.is_alive():
+    # Файл без номера кадра (общий для всех кадров) не говорит, какой кадр готов
+    if f_start != f_end:
+        per_frame = [product for product in products if is_per_frame_product(product, f_start, f_end)]
+        if len(per_frame) < len(products):
+            log(f"Skipped {len(products) - len(per_frame)} output file(s) that do not depend on frame.", Colors.YELLOW)
+        products = per_frame
+    
+    if len(products) > 1:
+        log(f"Output files per frame: {len(products)}", Colors.BLUE)
+    session.output_products[key] = products
+    return products
+
+def is_per_frame_product(product, first, last):
+    """
+    True, если путь product меняется с кадром (иначе все кадры ждали бы один файл).
+    """
+    template, evaluate = product
+    if template is not None:
+        return template.has_frame
+    try:
+        return evaluate(first) != evaluate(last)
+    except Exception:
+        return True
+
+def output_paths_at_frame(session, rop, frame):
+    """
+    Пути всех файлов кадра: через скомпилированные шаблоны, иначе evalAtFrame.
+    """
+    return tuple(template.expand(frame) if template is not None else evaluate(frame)
+                 for template, evaluate in get_output_products(session, rop))
+
+def is_watching(session):
+    """
+    True, если у сессии работает File Watcher (кадры и отчет ведет он).
+    """
+    watch = session.frame_watch
+    return watch is not None and watch.active
+
+def try_start_file_watcher(session, rop):
+    """
+    Пытается запустить File Watcher для сессии рендера.
+    Возвращает True, если watcher был запущен.
+    """
+    if is_watching(session):
         log("File Watcher already running.", Colors.YELLOW)
         return True
         
     try:
-        # Проверяем, есть ли выходной файл
-        path_parm = get_output_path_parm(rop)
+        # Все файлы кадра (основной, AOV, deep, cryptomatte, USD RenderProducts)
+        products = get_output_products(session, rop)
         
-        if not path_parm:
+        if not products:
             log("Cannot find output path parameter. File Watcher skipped.", Colors.RED, "❌")
             return False
 
-        # Генерируем пути
-        paths_to_watch = {}
-        
         # Получаем диапазон кадров с учетом trange
         f_start, f_end, f_step = get_frame_range(rop)
+        frames = watcher.FrameRange(f_start, f_end, f_step)
+        
+        # Шаблоны путей компилируются один раз; evalAtFrame на каждый кадр - только для путей с выражениями
+        templates = [template for template, _evaluate in products]
         
-        # evalAtFrame
-        curr_frame = f_start
-        while curr_frame <= f_end + 0.0001:
-            path = path_parm.evalAtFrame(curr_frame)
-            # Fix: Если в пути остались $F (из-за экранирования \$F для USD), заменяем их вручную
-            if '$F' in path:
-                path = resolve_frame_in_path(path, curr_frame)
+        if all(template is not None for template in templates):
+            # Пути генерируются лениво в потоке watcher'а (чистый Python, без hou)
+            if len(templates) == 1:
+                path_for_frame = templates[0].expand
+            else:
+                path_for_frame = lambda frame: tuple(template.expand(frame) for template in templates)
+            # Отставшие кадры ищутся по листингу папки основного файла
+            frame_matcher = templates[0].frame_matcher()
+        else:
+            # evalAtFrame нельзя звать из фонового потока - считаем пути заранее
+            paths = {frame: output_paths_at_frame(session, rop, frame) for frame in frames}
+            path_for_frame = paths.__getitem__
+            frame_matcher = None
+        
+        if len(frames):
+            try:
+                horizon = int(float(get_setting('WATCHER_HORIZON', watcher.HorizonIndex.DEFAULT_HORIZON, rop)))
+            except (TypeError, ValueError):
+                horizon = watcher.HorizonIndex.DEFAULT_HORIZON
+            pending = watcher.HorizonIndex(frames, path_for_frame, horizon=horizon, frame_matcher=frame_matcher)
             
-            paths_to_watch[int(curr_frame)] = path
-            curr_frame += f_step
-        
-        if paths_to_watch:
-            stop_watcher_event = threading.Event()
-            watcher_thread = threading.Thread(target=file_watcher_loop, args=(paths_to_watch, render_stats['start_time'], stop_watcher_event), name="RenderEstimator_FileWatcher_Thread")
-            watcher_thread.daemon = True
-            # Прикрепляем событие к потоку для восстановления при перезагрузке
-            watcher_thread.stop_event = stop_watcher_event
-            watcher_thread.start()
+            schedule = create_poll_schedule(rop)
+            
+            # Задание общего потока File Watcher (inotify на Linux, иначе адаптивный опрос).
+            # Закрытие сессии (следующий start_render этого ROP) снимает задание
+            session.frame_watch = FrameWatch(session, pending, schedule, hub=watcher_hub)
+            try:
+                session.frame_watch.log_progress = create_log_progress(rop)
+            except Exception as e:
+                log(f"Log progress error: {e}", Colors.YELLOW)
+            watcher_hub.add(session.frame_watch)
             log("File Watcher started successfully (Lazy/Explicit).", Colors.GREEN, "🚀")
             return True
         else:
@@ -291,6 +702,135 @@ def try_start_file_watcher(rop):
         log(f"Error starting File Watcher: {e}", Colors.RED, "💥")
         return False
 
+def create_poll_schedule(rop):
+    """
+    Интервал опроса и таймаут зависания File Watcher по настройкам ROP / .env:
+    WATCHER_POLL_MIN / WATCHER_POLL_MAX - пределы интервала опроса (сек),
+    WATCHER_STALL_TIMEOUT - таймаут до первого кадра (сек),
+    WATCHER_STALL_FACTOR / WATCHER_STALL_MIN - таймаут после: p99 * factor, но не меньше min.
+    """
+    defaults = watcher.PollSchedule
+    settings = {
+        'min_interval': ('WATCHER_POLL_MIN', defaults.DEFAULT_MIN_INTERVAL),
+        'max_interval': ('WATCHER_POLL_MAX', defaults.DEFAULT_MAX_INTERVAL),
+        'stall_timeout': ('WATCHER_STALL_TIMEOUT', defaults.DEFAULT_STALL_TIMEOUT),
+        'stall_factor': ('WATCHER_STALL_FACTOR', defaults.DEFAULT_STALL_FACTOR),
+        'stall_min': ('WATCHER_STALL_MIN', defaults.DEFAULT_STALL_MIN),
+    }
+    kwargs = {}
+    for arg, (key, default) in settings.items():
+        value = get_setting(key, default, rop)
+        try:
+            kwargs[arg] = float(value)
+        except (TypeError, ValueError):
+            log(f"Invalid {key}={value}. Using {default}.", Colors.YELLOW)
+            kwargs[arg] = default
+    return watcher.PollSchedule(**kwargs)
+
+def create_log_progress(rop, path=None, patterns=None):
+    """
+    Прогресс кадров из лога рендерера (только режим File Watcher), если задан RENDER_LOG.
+    LOG_PROGRESS_PATTERN - свое регулярное выражение (группа процентов или готово/всего),
+    LOG_PROGRESS_INTERVAL - как часто дочитывать лог (сек).
+    """
+    path = path or get_setting('RENDER_LOG', None, rop)
+    if not path:
+        return None
+    path = expand_hou_string(path) if hou is not None and rop is not None else os.path.expandvars(path)
+    patterns = patterns or get_setting('LOG_PROGRESS_PATTERN', None, rop)
+    try:
+        interval = float(get_setting('LOG_PROGRESS_INTERVAL', log_progress.LogProgress.DEFAULT_INTERVAL, rop))
+    except (TypeError, ValueError):
+        interval = log_progress.LogProgress.DEFAULT_INTERVAL
+    source = log_progress.LogProgress(path, patterns, interval=interval)
+    log(f"Log progress: {path}", Colors.BLUE, "📜")
+    return source
+
+def create_frame_estimator(rop):
+    """
+    Создает модель прогноза по настройкам ROP / .env:
+    ESTIMATOR_MODE (mean, window, ewma), ESTIMATOR_WINDOW, ESTIMATOR_ALPHA,
+    ESTIMATOR_STARTUP (1 - считать старт рендера отдельно от кадров).
+    """
+    mode = get_setting('ESTIMATOR_MODE', estimators.DEFAULT_ESTIMATOR, rop)
+    window = get_setting('ESTIMATOR_WINDOW', None, rop)
+    alpha = get_setting('ESTIMATOR_ALPHA', None, rop)
+    startup = str(get_setting('ESTIMATOR_STARTUP', '1', rop)).strip().lower() not in ('0', 'false', 'no', 'off')
+    try:
+        window = int(float(window)) if window else None
+        alpha = float(alpha) if alpha else None
+    except (TypeError, ValueError):
+        log(f"Invalid estimator settings (window={window}, alpha={alpha}). Using defaults.", Colors.YELLOW)
+        window = alpha = None
+    return estimators.create_estimator(mode, window=window, alpha=alpha, startup=startup)
+
+def history_db_path(rop):
+    """
+    База истории по настройкам HISTORY_ENABLED (1/0) и HISTORY_DB (путь к sqlite).
+    None - история выключена. Читает параметры ROP, поэтому только из основного потока.
+    """
+    enabled = str(get_setting('HISTORY_ENABLED', '1', rop)).strip().lower()
+    if enabled in ('0', 'false', 'no', 'off'):
+        return None
+    return get_setting('HISTORY_DB', history.DEFAULT_DB_PATH, rop)
+
+def setup_history(session, db_path, frames):
+    """
+    Подключает историю рендеров: загружает прогноз по кадрам для этой ROP
+    (задает априорную оценку модели) и создает фоновый writer для новых записей.
+    db_path - из history_db_path() (None - история выключена). hou не нужен,
+    поэтому можно звать из фонового потока.
+    """
+    session.set_predictions(None, frames)
+    
+    if db_path is None:
+        with session.lock:
+            session.history_writer = None
+            session.history_buffer = None
+        return
+    
+    stats = session.snapshot()
+    key = (stats['hip_name'], stats['rop_name'], stats['renderer'], stats['resolution'])
+    
+    predictions, startup = history.load_predictions(db_path, key, frames)
+    session.set_predictions(predictions, frames)
+    if predictions:
+        total, known = history.predict_total(predictions, frames)
+        with session.lock:
+            session.estimator.set_prior(total / len(frames), startup)
+        eta_str = str(datetime.timedelta(seconds=int(total + startup)))
+        log(f"История: найдено {known}/{len(frames)} кадров. Прогноз: ~{eta_str}", Colors.CYAN, "📚")
+    
+    run_id = f"{stats['hostname']}-{stats['start_time']:.3f}"
+    writer = history.HistoryWriter(db_path, key, run_id)
+    
+    # Кадры, готовые до подключения истории, дописываем из буфера
+    with session.lock:
+        for frame, duration, size_bytes in session.history_buffer or []:
+            writer.record(frame, duration, size_bytes)
+        session.history_buffer = None
+        session.history_writer = writer
+
+def record_history(session, frame, duration, size_bytes=0):
+    """
+    Кладет готовый кадр в очередь записи истории (не блокирует).
+    Пока история подключается в фоне, кадры копятся в буфере сессии.
+    Первый кадр рендера содержит старт (загрузка сцены), который хранится отдельно
+    в runs.startup, поэтому он записывается в finalize без оценки старта.
+    """
+    with session.lock:
+        if session.history_first is False:
+            session.history_first = (frame, duration, size_bytes)
+            return
+        if session.history_writer is None:
+            if session.history_buffer is not None:
+                session.history_buffer.append((frame, duration, size_bytes))
+            return
+        try:
+            session.history_writer.record(frame, duration, size_bytes)
+        except Exception:
+            pass
+
 def get_frame_range(rop):
     """
     Возвращает (start, end, step) с учетом параметра 'trange' (Valid Frame Range).
@@ -316,47 +856,67 @@ def get_frame_range(rop):
     
     return f_start, f_end, f_step
 
-def start_render():
+class SceneInfoCollector:
+    """
+    Однократный сбор метаданных сцены (рендерер, путь, разрешение, камера, свет).
+    Stage ищется один раз и переиспользуется, время каждого шага записывается в timings.
     """
-    Функция для 'Pre-Render Script'.
-    Инициализирует статистику перед началом рендера.
-    """
-    global render_stats, watcher_thread, stop_watcher_event
-    
-    # Останавливаем старый поток, если он есть (включая "фантомные" потоки после перезагрузки модуля)
-    # Ищем ВСЕ потоки с нашим именем, так как ссылка watcher_thread может быть утеряна при перезагрузке
-    for thread in threading.enumerate():
-        if thread.name == "RenderEstimator_FileWatcher_Thread":
-            log(f"Found orphaned watcher thread: {thread.name}. Stopping...", Colors.YELLOW)
-            # Пытаемся найти stop_event прикрепленный к потоку
-            if hasattr(thread, 'stop_event') and thread.stop_event:
-                thread.stop_event.set()
-            
-            # Ждем завершения
-            thread.join(timeout=2.0)
-            if thread.is_alive():
-                 log("Orphaned thread did not stop in time.", Colors.RED)
-            else:
-                 log("Orphaned thread stopped.", Colors.GREEN)
-        
-    watcher_thread = None
-    stop_watcher_event = None
     
-    # Сброс
-    render_stats['start_time'] = time.time()
-    render_stats['last_frame_time'] = time.time()
-    render_stats['frames_rendered'] = 0
-    render_stats['frame_times'] = []
+    def __init__(self, node):
+        self.node = node
+        self.timings = {}
+        self._stage = None
+        self._stage_resolved = False
     
-    # Сохраняем информацию о сцене
-    try:
-        render_stats['hip_name'] = hou.hipFile.basename()
-        render_stats['rop_name'] = hou.pwd().path()
-        render_stats['hostname'] = socket.gethostname()
+    def _timed(self, name, func, default="Unknown"):
+        t0 = time.perf_counter()
+        try:
+            return func()
+        except Exception as e:
+            print(f"[RenderEstimator] Scene info '{name}' error: {e}")
+            return default
+        finally:
+            self.timings[name] = time.perf_counter() - t0
+    
+    def stage(self):
+        """
+        USD stage ноды (или ее первого инпута). Ищется один раз.
+        """
+        if not self._stage_resolved:
+            self._stage_resolved = True
+            self._stage = self._timed('stage', self._find_stage, default=None)
+        return self._stage
+    
+    def _find_stage(self):
+        node = self.node
+        stage = None
+        if hasattr(node, 'stage'):
+            stage = node.stage()
         
-        # --- Определение рендерера ---
-        renderer_val = "Unknown"
-        rop_node = hou.pwd()
+        # Если у ноды нет stage (например, это ROP), берем из инпута
+        if not stage and node.inputs():
+            input_node = node.inputs()[0]
+            if hasattr(input_node, 'stage'):
+                stage = input_node.stage()
+        return stage
+    
+    def _render_settings_prim(self):
+        rs_parm = self.node.parm('rendersettings')
+        if not rs_parm:
+            return None
+        stage = self.stage()
+        if not stage:
+            return None
+        rs_path = rs_parm.eval()
+        if not rs_path:
+            return None
+        prim = stage.GetPrimAtPath(rs_path)
+        if prim and prim.IsValid():
+            return prim
+        return None
+    
+    def renderer(self):
+        rop_node = self.node
         
         # Пробуем параметр renderer (обычно есть у Karma/Solaris)
         r_parm = rop_node.parm('renderer')
@@ -374,36 +934,26 @@ def start_render():
             elif 'arnold' in type_name: renderer_val = 'Arnold'
             elif 'karma' in type_name: renderer_val = 'Karma'
             else: renderer_val = type_name
-            
-        render_stats['renderer'] = renderer_val
-        
-        # --- Output Path ---
-        out_parm = get_output_path_parm(rop_node)
-        if out_parm:
-            try:
-                # Store unexpanded string to show variables like $F
-                val = out_parm.unexpandedString()
-                if not val: val = out_parm.eval()
-                render_stats['output_path'] = val
-            except:
-                render_stats['output_path'] = "Unknown"
-        else:
-            render_stats['output_path'] = "Unknown"
-
-        # --- Определение разрешения ---
+        return renderer_val
+    
+    def output_path(self):
+        out_parm = get_output_path_parm(self.node)
+        if not out_parm:
+            return "Unknown"
+        # Store unexpanded string to show variables like $F
+        val = out_parm.unexpandedString()
+        if not val: val = out_parm.eval()
+        return val
+    
+    def resolution(self, renderer):
+        rop_node = self.node
         res_val = "Unknown"
-        res_source = "None"
         
-        # Debug params
-
-
         # 1. Стандартные паметры (Mantra/Redshift/Standard ROPs)
         if rop_node.parm('resx') and rop_node.parm('resy'):
              res_val = f"{rop_node.evalParm('resx')}x{rop_node.evalParm('resy')}"
-             res_source = "ROP resx/resy"
         elif rop_node.parm('tres1') and rop_node.parm('tres2'): # Иногда так называется
              res_val = f"{rop_node.evalParm('tres1')}x{rop_node.evalParm('tres2')}"
-             res_source = "ROP tres"
         
         # 2. Переопределения в Solaris (Karma ROP)
         # Если есть override_resolution (и он включен)
@@ -413,30 +963,32 @@ def start_render():
             if is_overridden:
                  if rop_node.parm('res1') and rop_node.parm('res2'):
                      res_val = f"{rop_node.evalParm('res1')}x{rop_node.evalParm('res2')}"
-                     res_source = "ROP Override"
             else:
                 # Если override ВЫКЛЮЧЕН, мы должны игнорировать локальные параметры ROP
                 # и искать в USD.
-                # Если мы уже нашли что-то через resx/tres, нужно сбросить, если мы уверены, что это Solaris
-                if 'karma' in render_stats['renderer'].lower() or 'usd' in render_stats['renderer'].lower():
-                    # log("Override is OFF. Ignoring ROP params, looking in USD...", Colors.CYAN)
+                if 'karma' in renderer.lower() or 'usd' in renderer.lower():
                     res_val = "Unknown"
-                    res_source = "Forced USD lookup"
         
-
-        render_stats['resolution'] = res_val # Предварительно сохраняем, может обновиться через USD
-
-        # --- Поиск камеры и доп. данных через USD ---
-        # Пытаемся найти камеру
+        # 3. Если разрешение еще не найдено, ищем в Render Settings
+        if res_val == "Unknown":
+            prim = self._render_settings_prim()
+            if prim:
+                attr_res = prim.GetAttribute('resolution')
+                if attr_res and attr_res.IsValid():
+                    res_vec = attr_res.Get()
+                    if res_vec:
+                        # res_vec обычно Gf.Vec2i
+                        res_val = f"{res_vec[0]}x{res_vec[1]}"
+        return res_val
+    
+    def camera(self):
         # Проверяем разные параметры, так как имя может отличаться в разных рендерах (Mantra, Karma, Redshift и т.д.)
         camera_parms = ['camera', 'render_camera', 'camera_path', 'cam']
         found_camera = "Unknown"
         
-        node = hou.pwd()
-        
         # 1. Поиск по стандартным параметрам ROP
         for parm_name in camera_parms:
-            parm = node.parm(parm_name)
+            parm = self.node.parm(parm_name)
             if parm:
                 val = parm.eval()
                 if val and isinstance(val, str) and val != "":
@@ -445,110 +997,268 @@ def start_render():
         
         # 2. Если не нашли и есть rendersettings (Solaris/Subnet), пробуем через USD
         if found_camera == "Unknown":
-            rs_parm = node.parm('rendersettings')
-            if rs_parm:
-                try:
-                    # Пытаемся получить stage
-                    stage = None
-                    if hasattr(node, 'stage'):
-                        stage = node.stage()
-                    
-                    # Если у ноды нет stage (например, это ROP), берем из инпута
-                    if not stage and node.inputs():
-                        input_node = node.inputs()[0]
-                        if hasattr(input_node, 'stage'):
-                            stage = input_node.stage()
-                            
-                    if stage:
-                        rs_path = rs_parm.eval()
-                        if rs_path:
-                            # Используем USD API
-                            prim = stage.GetPrimAtPath(rs_path)
-                            if prim and prim.IsValid():
-                                # Ищем relationship 'camera'
-                                rel = prim.GetRelationship('camera')
-                                if rel:
-                                    targets = rel.GetTargets()
-                                    if targets:
-                                        found_camera = str(targets[0])
-                                
-                                # Если разрешение еще не найдено, ищем в Render Settings
-                                if render_stats['resolution'] == "Unknown":
-                                    attr_res = prim.GetAttribute('resolution')
-                                    if attr_res and attr_res.IsValid():
-                                        res_vec = attr_res.Get()
-                                        if res_vec:
-                                            # res_vec обычно Gf.Vec2i
-                                            render_stats['resolution'] = f"{res_vec[0]}x{res_vec[1]}"
-
-                except Exception as e:
-                    # print(f"[RenderEstimator] USD extraction error: {e}")
-                    pass
-
+            prim = self._render_settings_prim()
+            if prim:
+                # Ищем relationship 'camera'
+                rel = prim.GetRelationship('camera')
+                if rel:
+                    targets = rel.GetTargets()
+                    if targets:
+                        found_camera = str(targets[0])
+        
         # 3. Очистка имени (оставляем только имя ноды)
         if isinstance(found_camera, str) and '/' in found_camera:
             found_camera = found_camera.split('/')[-1]
-            
-        render_stats['camera_name'] = found_camera
-
-        # --- Поиск источников света ---
+        return found_camera
+    
+    def lights(self):
+        """
+        Возвращает (список имен, truncated).
+        """
         found_lights = []
+        lights_truncated = False
+        
+        # 1. USD / Solaris
+        stage = self.stage()
+        if stage:
+            # Поиск по схемам UsdLux с отсечением геометрии/инстансеров и лимитом на большие stage
+            try:
+                max_prims = int(float(get_setting('LIGHTS_MAX_PRIMS', scene_info.DEFAULT_LIGHTS_MAX_PRIMS, self.node)))
+            except (TypeError, ValueError):
+                log(f"Invalid LIGHTS_MAX_PRIMS, using {scene_info.DEFAULT_LIGHTS_MAX_PRIMS}.", Colors.YELLOW)
+                max_prims = scene_info.DEFAULT_LIGHTS_MAX_PRIMS
+            try:
+                max_seconds = float(get_setting('LIGHTS_MAX_SECONDS', scene_info.DEFAULT_LIGHTS_MAX_SECONDS, self.node))
+            except (TypeError, ValueError):
+                log(f"Invalid LIGHTS_MAX_SECONDS, using {scene_info.DEFAULT_LIGHTS_MAX_SECONDS}.", Colors.YELLOW)
+                max_seconds = scene_info.DEFAULT_LIGHTS_MAX_SECONDS
+            found_lights, lights_truncated = scene_info.find_usd_lights(stage, max_prims, max_seconds)
+            if lights_truncated:
+                log(f"Light search stopped by budget: {len(found_lights)}+ lights (truncated).", Colors.YELLOW)
+        
+        # 2. Standard / OBJ (если не нашли в USD или это не USD рендер)
+        if not found_lights and not lights_truncated:
+            # Ищем в /obj
+            obj_context = hou.node("/obj")
+            if obj_context:
+                # Список распространенных типов источников света
+                light_types = ['hlight', 'envlight', 'sunlight', 'skylight', 'arealight', 'pointlight', 'spotlight', 
+                              'rslight', 'rsdome', 'rssun', # Redshift
+                              'arnold_light', 'skydome_light', # Arnold
+                              'octane_light', 'octane_daylight'] # Octane
+                for child in obj_context.children():
+                    # Проверяем тип ноды
+                    type_name = child.type().name().lower()
+                    if any(lt in type_name for lt in light_types):
+                        found_lights.append(child.name())
+        
+        return found_lights, lights_truncated
+    
+    def collect(self):
+        """
+        Выполняет все шаги и возвращает словарь полей статистики сессии.
+        """
+        info = {}
+        info['renderer'] = self._timed('renderer', self.renderer)
+        info['output_path'] = self._timed('output_path', self.output_path)
+        info['resolution'] = self._timed('resolution', lambda: self.resolution(info['renderer']))
+        info['camera_name'] = self._timed('camera', self.camera)
+        info['lights'], info['lights_truncated'] = self._timed('lights', self.lights, default=([], False))
+        return info
+
+def get_scene_collector(session, rop):
+    """
+    Сборщик метаданных сцены этой сессии (stage ищется один раз и для render products,
+    и для отчета).
+    """
+    collector = session.scene_collector
+    if collector is None or collector.node != rop:
+        collector = session.scene_collector = SceneInfoCollector(rop)
+    return collector
+
+def start_scene_info(session, rop, frames):
+    """
+    Сбор метаданных сцены и подключение истории.
+    hou не потокобезопасен, поэтому сцена (stage, параметры) читается только в основном
+    потоке - по умолчанию сразу в Pre-Render: при рендере в основном потоке Houdini (foreground)
+    цикл событий стоит до конца рендера, а прогноз по истории нужен до первого кадра.
+    В фоновый поток уходит только загрузка истории (SQLite) с готовыми данными.
+    SCENE_INFO_DEFERRED=1 - читать сцену на цикле событий после старта рендера (или в первом
+    post_frame / перед отчетом), чтобы Pre-Render возвращался сразу; имеет смысл, когда
+    рендер идет отдельным процессом (husk в фоне), а UI остается свободным.
+    """
+    db_path = history_db_path(rop)
+    session.scene_info_ready.clear()
+    
+    def collect():
+        collector = get_scene_collector(session, rop)
+        t0 = time.perf_counter()
+        info = collector.collect()
+        session.update(scene_info_timings=collector.timings, **info)
+        
+        steps = ", ".join(f"{k} {v:.2f}s" for k, v in collector.timings.items())
+        log(f"Scene info collected in {time.perf_counter() - t0:.2f}s ({steps})", Colors.BLUE)
+    
+    def load_history():
+        # Ключ истории включает рендерер и разрешение, поэтому подключаем ее после сбора
         try:
-            # 1. USD / Solaris
-            # Используем stage который мы могли найти ранее
-            usd_lights_found = False
-            
-            # Повторно пытаемся получить stage, если он не был инициализирован (код дублируется, но так надежнее без рефакторинга)
-            stage = None
-            if hasattr(node, 'stage'):
-                stage = node.stage()
-            if not stage and node.inputs():
-                try:
-                    input_node = node.inputs()[0]
-                    if hasattr(input_node, 'stage'):
-                        stage = input_node.stage()
-                except:
-                    pass
-            
-            if stage:
-                # Сканируем stage на наличие источников света
-                try:
-                    for prim in stage.Traverse():
-                        t_name = prim.GetTypeName()
-                        # Простая проверка по имени типа (UsdLuxDomeLight, UsdLuxSphereLight, KarmaSkyDomeLight и т.д.)
-                        if "UsdLux" in t_name or "Light" in t_name: 
-                             found_lights.append(prim.GetName())
-                except:
-                    pass
-
-            # 2. Standard / OBJ (если не нашли в USD или это не USD рендер)
-            if not found_lights:
-                # Ищем в /obj
-                obj_context = hou.node("/obj")
-                if obj_context:
-                    for child in obj_context.children():
-                        # Проверяем тип ноды
-                        type_name = child.type().name().lower()
-                        # Список распространенных типов источников света
-                        light_types = ['hlight', 'envlight', 'sunlight', 'skylight', 'arealight', 'pointlight', 'spotlight', 
-                                      'rslight', 'rsdome', 'rssun', # Redshift
-                                      'arnold_light', 'skydome_light', # Arnold
-                                      'octane_light', 'octane_daylight'] # Octane
-                        
-                        if any(lt in type_name for lt in light_types):
-                            found_lights.append(child.name())
-                            
+            setup_history(session, db_path, frames)
         except Exception as e:
-            print(f"[RenderEstimator] Light extraction error: {e}")
-            pass
-            
-        render_stats['lights'] = found_lights
+            log(f"History error: {e}", Colors.YELLOW)
+        finally:
+            session.scene_info_ready.set()
+    
+    deferred = str(get_setting('SCENE_INFO_DEFERRED', '0', rop)).strip().lower() in ('1', 'true', 'yes', 'on')
+    
+    def task():
+        collect()
+        session.start_thread(load_history, "RenderEstimator_History_Thread")
+    
+    session.scene_info_pending = task
+    ui = getattr(hou, 'ui', None)
+    if deferred and ui is not None and hasattr(ui, 'addEventLoopCallback') and hou.isUIAvailable():
+        def on_event_loop():
+            try:
+                ui.removeEventLoopCallback(on_event_loop)
+            except Exception:
+                pass
+            run_pending_scene_info(session)
+        ui.addEventLoopCallback(on_event_loop)
+    else:
+        # Foreground рендер или без UI (hython, hbatch): цикл событий до конца рендера не дойдет -
+        # сцена читается сразу, история - в фоне
+        run_pending_scene_info(session)
+
+def run_pending_scene_info(session):
+    """
+    Выполняет отложенный сбор метаданных сцены (только из основного потока).
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    with session.lock:
+        task, session.scene_info_pending = session.scene_info_pending, None
+    if task is None or session.closed:
+        return
+    try:
+        task()
+    except Exception as e:
+        log(f"Scene info error: {e}", Colors.YELLOW)
+        with session.lock:
+            session.history_buffer = None
+        session.scene_info_ready.set()
+
+def wait_scene_info(session, timeout=5.0):
+    """
+    Ждет метаданные сцены и историю (перед отчетом). В основном потоке
+    отложенный сбор выполняется сразу; фоновый поток только ждет его.
+    """
+    run_pending_scene_info(session)
+    session.scene_info_ready.wait(timeout)
+
+def start_status_pump(rop):
+    """
+    Подключает статус-бар Houdini для рендера (только из основного потока).
+    Без UI (hython, hbatch) статус-бар не нужен.
+    """
+    global status_pump
+    ui = getattr(hou, 'ui', None)
+    if ui is None or not hasattr(ui, 'addEventLoopCallback') or not hou.isUIAvailable():
+        return
+    
+    if status_pump is None or not status_pump.installed:
+        try:
+            interval = float(get_setting('STATUS_BAR_INTERVAL', status_bar.StatusPump.DEFAULT_INTERVAL, rop))
+        except (TypeError, ValueError):
+            interval = status_bar.StatusPump.DEFAULT_INTERVAL
+        status_pump = status_bar.StatusPump(ui.setStatusMessage, ui.addEventLoopCallback,
+                                            ui.removeEventLoopCallback, interval=interval)
+    status_pump.begin(session_key(rop))
+
+def post_status(text):
+    """
+    Сообщение в статус-бар Houdini из любого потока (покажется на цикле событий).
+    Из основного потока (post_frame) показывается сразу, не дожидаясь цикла событий
+    (с тем же ограничением частоты STATUS_BAR_INTERVAL).
+    """
+    pump = status_pump
+    if pump is None:
+        return
+    pump.post(text)
+    if threading.current_thread() is threading.main_thread():
+        pump.drain()
+
+def session_key(rop=None):
+    """
+    Ключ сессии рендера - путь ROP ноды (None, если ROP неизвестен).
+    """
+    try:
+        return (rop or hou.pwd()).path()
+    except Exception:
+        return None
 
+def get_session(rop=None):
+    """
+    Сессия рендера ROP, который вызвал скрипт (или None, если рендер не инициализирован).
+    """
+    return active_sessions.get(session_key(rop))
+
+def stop_session(session):
+    """
+    Останавливает потоки прошлой сессии рендера (watcher, сбор метаданных, live сообщение).
+    """
+    if session is None:
+        return
+    # Задание File Watcher снимается сразу (без отчета), не дожидаясь следующего прохода хаба
+    if session.frame_watch is not None:
+        session.frame_watch.cancel(timeout=0)
+    if not session.close():
+        log("Previous render threads did not stop in time.", Colors.RED)
+
+def start_render():
+    """
+    Функция для 'Pre-Render Script'.
+    Создает новую сессию рендера для этого ROP (его прошлая сессия останавливается,
+    рендеры других ROP продолжают работать).
+    """
+    key = session_key()
+    
+    # Останавливаем потоки прошлого рендера этого ROP (сессии переживают перезагрузку модуля)
+    stop_session(active_sessions.pop(key, None))
+    # Завершенные сессии других ROP (отчет отправлен) больше не нужны
+    for other_key, other in list(active_sessions.items()):
+        if other.closed:
+            del active_sessions[other_key]
+    
+    # Досылаем сообщения, которые не удалось отправить в прошлый раз (в фоне)
+    try:
+        sender, _chat_id = get_notifier()
+        if sender:
+            sender.flush_outbox()
+    except Exception as e:
+        log(f"Outbox flush error: {e}", Colors.YELLOW)
+    
+    try:
+        estimator = create_frame_estimator(hou.pwd())
+    except Exception as e:
+        log(f"Estimator setup error: {e}. Using cumulative mean.", Colors.YELLOW)
+        estimator = estimators.create_estimator()
+    
+    # Быстрые данные о сцене (остальное собирается в фоне, см. start_scene_info)
+    try:
+        info = {
+            'hip_name': hou.hipFile.basename(),
+            'rop_name': hou.pwd().path(),
+            'hostname': socket.gethostname(),
+        }
     except:
-        render_stats['hip_name'] = "Unknown"
-        render_stats['rop_name'] = "Unknown"
-        render_stats['camera_name'] = "Unknown"
+        info = {}
+    
+    session = render_session.RenderSession(estimator=estimator, **info)
+    session.size_worker = watcher.SizeWorker()
+    session.key = key
+    active_sessions[key] = session
     
+    frames = []
     # Пытаемся получить диапазон кадров из ROP ноды, которая вызывает скрипт
     try:
         # hou.pwd() возвращает текущую ноду (ROP)
@@ -558,9 +1268,31 @@ def start_render():
         f_start, f_end, f_step = get_frame_range(rop)
         
         # Вычисляем общее количество кадров
-        render_stats['total_frames'] = int((f_end - f_start) / f_step) + 1
+        session.update(total_frames=int((f_end - f_start) / f_step) + 1)
+        session.set_frame_range(f_start, f_end, f_step)
+        
+        print(f"[RenderEstimator] Начало рендера. Кадров: {session.get('total_frames')}")
         
-        print(f"[RenderEstimator] Начало рендера. Кадров: {render_stats['total_frames']}")
+        # Диапазон без материализации списка (длинные секвенции)
+        frames = watcher.FrameRange(f_start, f_end, f_step)
+        
+        # --- Прогресс для агрегатора фермы ---
+        try:
+            start_progress_reporter(session, rop)
+        except Exception as e:
+            log(f"Aggregator error: {e}", Colors.YELLOW)
+        
+        # --- Live сообщение прогресса в Telegram ---
+        try:
+            start_live_message(session, rop)
+        except Exception as e:
+            log(f"Live message error: {e}", Colors.YELLOW)
+        
+        # --- Статус-бар Houdini (обновляется из основного потока) ---
+        try:
+            start_status_pump(rop)
+        except Exception as e:
+            log(f"Status bar error: {e}", Colors.YELLOW)
         
         # --- ЗАПУСК FILE WATCHER ---
         should_start_watcher = False
@@ -576,108 +1308,83 @@ def start_render():
              print("[RenderEstimator] 'Single Process' flag not found. File Watcher will NOT start explicitly.")
              
         if should_start_watcher:
-            try_start_file_watcher(rop)
+            try_start_file_watcher(session, rop)
             
     except Exception as e:
         print(f"[RenderEstimator] Ошибка при инициализации: {e}")
-        render_stats['total_frames'] = 0
+        session.update(total_frames=0)
+    
+    # --- Метаданные сцены (камера, разрешение, свет) и история - после запуска рендера ---
+    try:
+        start_scene_info(session, hou.pwd(), frames)
+    except Exception as e:
+        log(f"Scene info error: {e}", Colors.YELLOW)
+        with session.lock:
+            session.history_buffer = None
+        session.scene_info_ready.set()
 
 def post_frame():
     """
     Функция для 'Post-Frame Script'.
     Вызывается после каждого кадра, считает время и прогноз.
     """
-    global render_stats
+    session = get_session()
     
     # Если рендер не был инициализирован (например, запустили с середины или без pre-render), выходим
-    if render_stats['start_time'] is None:
+    if session is None or session.closed:
         return
 
     current_time = time.time()
     
+    # Метаданные сцены, если цикл событий еще не успел их собрать (рендер в основном потоке)
+    run_pending_scene_info(session)
+    
     # В Single Process режиме этот скрипт вызывается ОЧЕНЬ быстро во время генерации.
     # Мы не хотим, чтобы он портил статистику "фейковыми" быстрыми кадрами, 
     # ЕСЛИ у нас работает File Watcher.
     
-    # Время последнего кадра (или старта)
-    last_t = render_stats['last_frame_time']
-    if last_t is None: last_t = render_stats['start_time']
+    # Время прошлого вызова (или последнего кадра / старта)
+    last_t = session.get('last_post_frame_time') or session.get('last_frame_time')
     frame_duration = current_time - last_t
+    session.update(last_post_frame_time=current_time)
     
     # --- LAZY START WATCHER ---
     # Если кадры летят очень быстро (генерация USD), а Watcher не работает
     # (Даже если кадр один - это может быть запуск фонового процесса, так что ловим его)
-    if frame_duration < 0.2 and not watcher_thread:
+    if frame_duration < 0.2 and session.frame_watch is None:
          print(f"[RenderEstimator] Fast frame detected ({frame_duration:.4f}s). Attempting LAZY START of File Watcher...")
          # Пытаемся запустить
-         if try_start_file_watcher(hou.pwd()):
+         if try_start_file_watcher(session, hou.pwd()):
              # Если запустился, то выходим, чтобы не портить статистику первыми быстрыми кадрами
              # (Watcher сам найдет файлы)
              print("[RenderEstimator] Lazy start successful. Handing over to File Watcher.")
-             render_stats['last_frame_time'] = current_time
+             session.touch(current_time)
              return
          else:
              print("[RenderEstimator] Lazy start failed.")
 
-    # Если watcher работает, мы игнорируем быстрые вызовы post_frame
-    if watcher_thread and watcher_thread.is_alive():
-        # Если это реально генерация
-        if frame_duration < 0.5:
-            # print(f"[RenderEstimator] Generating scene... (Watcher Active)")
-            render_stats['last_frame_time'] = current_time
-            return
-        else:
-             # Если это НЕ генерация (вдруг?), но вотчер работает...
-             # Лучше довериться вотчеру, если он включен.
-             render_stats['last_frame_time'] = current_time
-             return
+    # Если watcher работает, мы игнорируем вызовы post_frame:
+    # и быстрые (генерация сцены), и обычные - лучше довериться вотчеру, если он включен.
+    # Время кадров при этом ведет сам watcher.
+    if is_watching(session):
+        return
 
     # Обычный режим (без Watcher)
     
-    # --- File Size Tracking ---
-    try:
-        current_frame = int(hou.frame())
-        out_parm = get_output_path_parm(hou.pwd())
-        if out_parm:
-             file_path = out_parm.evalAtFrame(current_frame)
-             
-             # Fix: Handle escaped $F manually (same as in File Watcher)
-             if file_path and '$F' in file_path:
-                 file_path = resolve_frame_in_path(file_path, current_frame)
-                 
-             if file_path and os.path.exists(file_path):
-                 size_bytes = os.path.getsize(file_path)
-                 render_stats['total_size_bytes'] += size_bytes
-             # else:
-             #    print(f"[RenderEstimator] Debug: File not found: {file_path}")
-    except Exception:
-        pass
-
-    render_stats['frames_rendered'] += 1
-    
     # Время с начала рендера
-    elapsed_total = current_time - render_stats['start_time']
-    render_stats['last_frame_time'] = current_time
+    elapsed_total = current_time - session.get('start_time')
     
     # Сохраняем статистику по кадру
     try:
         current_frame = int(hou.frame())
     except:
-        current_frame = render_stats['frames_rendered']
-        
-    render_stats['frame_times'].append((current_frame, frame_duration))
+        current_frame = session.get('frames_rendered') + 1
     
-    # Среднее время на кадр
-    avg_time_per_frame = elapsed_total / render_stats['frames_rendered']
-    
-    # Оставшиеся кадры
-    remaining_frames = render_stats['total_frames'] - render_stats['frames_rendered']
-    
-    if remaining_frames < 0:
-        remaining_frames = 0
-        
-    # Прогноз оставшегося времени
-    estimated_remaining_seconds = avg_time_per_frame * remaining_frames
+    # Статистика и прогноз по выбранной модели (mean / window / ewma) - одним шагом под локом
+    avg_time_per_frame, estimated_remaining_seconds, frames_rendered = session.add_frame(
+        current_frame, frame_duration, finished_at=current_time)
+    # Размер файла и запись в историю - в фоне (stat на сетевом диске бывает медленным)
+    account_output_size(session, current_frame, frame_duration)
     
     # Форматирование времени
     time_str = str(datetime.timedelta(seconds=int(estimated_remaining_seconds)))
@@ -685,58 +1392,73 @@ def post_frame():
     
     # Обычный режим рендера
     avg_str = format_duration(avg_time_per_frame)
-    msg = (f"[RenderEstimator] ✅ Кадр {render_stats['frames_rendered']}/{render_stats['total_frames']} готов. "
+    msg = (f"[RenderEstimator] ✅ Кадр {frames_rendered}/{session.get('total_frames')} готов. "
            f"Прошло: {elapsed_str}. ⏳ Осталось: {time_str} ({avg_str}/кадр)")
     
     print(msg)
+    publish_progress(session)
     
-    # Также можно обновлять статус бар Houdini
-    try:
-        hou.ui.setStatusMessage(msg)
-    except:
-        pass
+    # Статус бар Houdini - не чаще STATUS_BAR_INTERVAL, а не на каждый кадр
+    post_status(msg)
 
-def finalize_and_send_report(title="✅ Рендер завершен!"):
+def account_output_size(session, frame, duration):
     """
-    Формирует и отправляет итоговый отчет.
-    Используется как FileWatcher'ом, так и finish_render'ом.
+    Передает файлы кадра фоновому SizeWorker. Пути вычисляются здесь (hou - только
+    из основного потока), а stat, повторы и запись истории - в фоне.
     """
-    global render_stats
+    worker = session.size_worker
+    file_paths = ()
+    try:
+        # Все файлы кадра; шаблоны путей кэшируются, evalAtFrame только для путей с выражениями
+        file_paths = output_paths_at_frame(session, hou.pwd(), frame)
+    except Exception:
+        pass
     
-    if render_stats['start_time'] is None:
+    if worker is None or not file_paths:
+        record_history(session, frame, duration, 0)
         return
+    
+    def on_size(size_bytes):
+        # Результат после перезапуска рендера (сессия закрыта) уже никуда не пойдет
+        if session.closed:
+            return
+        session.add_size(size_bytes)
+        record_history(session, frame, duration, size_bytes)
+    
+    worker.submit(file_paths, on_size)
 
-    total_time = time.time() - render_stats['start_time']
+def build_report_message(stats, title, final=True):
+    """
+    Формирует текст отчета по снимку статистики (RenderSession.snapshot()).
+    final=False - промежуточный отчет (live сообщение), без фолбэков "рендер завершен".
+    """
+    total_time = time.time() - stats['start_time']
     total_time_str = str(datetime.timedelta(seconds=int(total_time)))
     
     avg_time = 0
     min_time_str = "N/A"
     max_time_str = "N/A"
+    percentiles_str = "N/A"
     
     # Определяем, сколько кадров реально готово
-    reported_frames = render_stats['frames_rendered']
+    reported_frames = stats['frames_rendered']
     
     # Фолбэк logic: Если frames_rendered 0, но прошло много времени и total_frames > 0
-    if reported_frames == 0 and total_time > 10 and render_stats['total_frames'] > 0:
-         reported_frames = render_stats['total_frames']
+    if final and reported_frames == 0 and total_time > 10 and stats['total_frames'] > 0:
+         reported_frames = stats['total_frames']
 
     if reported_frames > 0:
         avg_time = total_time / reported_frames
         
-        # Вычисляем мин/макс
-        # Вычисляем мин/макс
-        if render_stats['frame_times']:
-            try:
-                min_frame = min(render_stats['frame_times'], key=lambda x: x[1])
-                max_frame = max(render_stats['frame_times'], key=lambda x: x[1])
-                
-                min_time_str = f"{format_duration(min_frame[1])} ({min_frame[0]} кадр)"
-                max_time_str = f"{format_duration(max_frame[1])} ({max_frame[0]} кадр)"
-            except:
-                pass
+        # Мин/макс и перцентили считаются на лету в FrameTimeStore
+        store = stats['frame_times']
+        if store:
+            min_time_str = f"{format_duration(store.min_time)} ({store.min_frame} кадр)"
+            max_time_str = f"{format_duration(store.max_time)} ({store.max_frame} кадр)"
+            percentiles_str = " / ".join(format_duration(store.percentile(p)) for p in store.PERCENTILES)
     
     # Расчет размера
-    total_size_mb = render_stats.get('total_size_bytes', 0) / (1024 * 1024)
+    total_size_mb = stats.get('total_size_bytes', 0) / (1024 * 1024)
     if total_size_mb > 1024:
         size_str = f"{total_size_mb/1024:.2f} GB"
     else:
@@ -744,88 +1466,287 @@ def finalize_and_send_report(title="✅ Рендер завершен!"):
     
     avg_str = format_duration(avg_time)
     
-    # Формируем список кадров
-    frame_numbers = [x[0] for x in render_stats['frame_times']]
-    # Если рендерился 1 кадр, но список пуст (быстрый рендер), добавим текущий
-    if not frame_numbers and render_stats['total_frames'] == 1:
-        # Пытаемся взять из ROP, но проще просто не показывать, если не знаем
-        pass
-        
-    frames_str = format_frame_list(frame_numbers)
+    # Формируем список кадров (интервалы с учетом шага, без сортировки всех кадров)
+    tracker = stats['frames']
+    frames_str = tracker.format()
     
     # Выбираем правильное окончание
-    frames_label = "Кадр" if render_stats['total_frames'] == 1 else "Кадры"
+    frames_label = "Кадр" if stats['total_frames'] == 1 else "Кадры"
         
     stats_block = (
         f"📊 Статистика:\n"
-        f"• Всего кадров: {render_stats['total_frames']} (Рендер: {reported_frames})\n"
+        f"• Всего кадров: {stats['total_frames']} (Рендер: {reported_frames})\n"
         f"• {frames_label}: {frames_str}\n"
         f"• Общее время: {total_time_str}\n"
     )
     
     # Добавляем среднее, только если кадров > 1
-    if render_stats['total_frames'] > 1:
+    if stats['total_frames'] > 1:
         stats_block += f"• Среднее на кадр: {avg_str}\n"
         
+        # Оценка стоимости старта (загрузка сцены, компиляция шейдеров)
+        startup_time = stats['startup']
+        if startup_time > 0:
+            stats_block += f"• Старт рендера: ~{format_duration(startup_time)}\n"
+        
     stats_block += f"• 💾 Размер: {size_str}"
     
+    # Пропущенные кадры - готовые диапазоны для перерендера
+    missing = tracker.missing_count
+    if final and missing and stats['frames_rendered'] > 0:
+        stats_block += f"\n• ⚠️ Не отрендерены ({missing}): {tracker.format_missing()}"
+    
     # Добавляем мин/макс только если кадров > 1 и они есть
-    if render_stats['total_frames'] > 1 and min_time_str != "N/A":
+    if stats['total_frames'] > 1 and min_time_str != "N/A":
         stats_block += (
             f"\n• Мин. время: {min_time_str}\n"
-            f"• Макс. время: {max_time_str}"
+            f"• Макс. время: {max_time_str}\n"
+            f"• p50 / p90 / p99: {percentiles_str}"
         )
 
     msg = (
         f"{title}\n\n"
-        f"📂 Файл: {render_stats['hip_name']}\n"
-        f"🕸 Нода: {render_stats['rop_name']}\n"
-        f"🖥 Хост: {render_stats['hostname']}\n"
-        f"🎨 Рендер: {render_stats['renderer']}\n"
-        f"📷 Камера: {render_stats['camera_name']}\n"
-        f"💡 Свет: {', '.join(render_stats['lights'][:5]) + ('...' if len(render_stats['lights']) > 5 else '') if render_stats['lights'] else 'Не найдено'}\n"
-        f"📐 Разрешение: {render_stats['resolution']}\n"
-        f"📂 Путь: {render_stats.get('output_path', 'Unknown')}\n"
+        f"📂 Файл: {stats['hip_name']}\n"
+        f"🕸 Нода: {stats['rop_name']}\n"
+        f"🖥 Хост: {stats['hostname']}\n"
+        f"🎨 Рендер: {stats['renderer']}\n"
+        f"📷 Камера: {stats['camera_name']}\n"
+        f"💡 Свет: {format_lights(stats)}\n"
+        f"📐 Разрешение: {stats['resolution']}\n"
+        f"📂 Путь: {stats.get('output_path', 'Unknown')}\n"
         f"{stats_block}"
     )
+    return msg
+
+def format_lights(stats):
+    """
+    Строка со списком света для отчета (первые 5 имен).
+    """
+    lights = stats['lights']
+    truncated = stats.get('lights_truncated', False)
+    if not lights:
+        return "Не найдено (поиск прерван по лимиту)" if truncated else "Не найдено"
+    text = ', '.join(lights[:5]) + ('...' if len(lights) > 5 else '')
+    if truncated:
+        text += f" ({len(lights)}+ lights, truncated)"
+    return text
+
+def build_progress_title(stats):
+    """
+    Заголовок live сообщения: прогресс и прогноз оставшегося времени.
+    """
+    done = stats['frames_rendered']
+    total = stats['total_frames']
+    rem_str = str(datetime.timedelta(seconds=int(stats['remaining'])))
+    progress = stats.get('frame_progress')
+    current = f" (кадр {progress * 100:.0f}%)" if progress is not None else ""
+    return f"⏳ Рендер идет: {done}/{total}{current}\n⏳ Осталось: {rem_str}"
+
+def build_progress_message(session):
+    """
+    Текст live сообщения по свежему снимку сессии.
+    """
+    stats = session.snapshot()
+    return build_report_message(stats, build_progress_title(stats), final=False)
+
+def start_live_message(session, rop):
+    """
+    Публикует live сообщение прогресса, если включено TELEGRAM_LIVE.
+    TELEGRAM_LIVE_INTERVAL - минимальный интервал между правками (сек).
+    """
+    session.live_message = None
+    enabled = str(get_setting('TELEGRAM_LIVE', '0', rop)).strip().lower()
+    if enabled not in ('1', 'true', 'yes', 'on') or not session.notify:
+        return
+    
+    sender, chat_id = get_notifier()
+    if sender is None:
+        return
     
     try:
-        send_telegram_notification(msg)
-    except Exception as e:
-        print(f"[RenderEstimator] Ошибка отправки Telegram: {e}")
+        interval = float(get_setting('TELEGRAM_LIVE_INTERVAL', 30, rop))
+    except (TypeError, ValueError):
+        interval = 30.0
+    
+    live_message = notifier.LiveMessage(sender, chat_id, lambda: build_progress_message(session), interval=interval)
+    session.live_message = live_message
+    live_message.start()
+
+def update_live_message(session):
+    """
+    Отмечает, что live сообщение устарело (реальная правка - не чаще раза в интервал).
+    """
+    live_message = session.live_message
+    if live_message is not None:
+        try:
+            live_message.update()
+        except Exception:
+            pass
+
+def start_progress_reporter(session, rop, url=None, job=None):
+    """
+    Отправка прогресса агрегатору фермы, если задан AGGREGATOR_URL (udp://host:port или http://host:port).
+    AGGREGATOR_JOB - имя задачи, общее для всех блейдов (по умолчанию "сцена:ROP").
+    AGGREGATOR_JOB_TOTAL - кадров во всей задаче (агрегатор ждет их все).
+    AGGREGATOR_ONLY=1 (по умолчанию) - итоговый отчет в Telegram шлет только агрегатор.
+    Вызывать после установки диапазона кадров (start_render / watch_command).
+    """
+    session.progress_reporter = None
+    url = url or get_setting('AGGREGATOR_URL', None, rop)
+    if not url:
+        return None
+    
+    job = job or get_setting('AGGREGATOR_JOB', None, rop) or f"{session.get('hip_name')}:{session.get('rop_name')}"
+    try:
+        job_total = int(get_setting('AGGREGATOR_JOB_TOTAL', 0, rop)) or None
+    except (TypeError, ValueError):
+        job_total = None
+    try:
+        interval = float(get_setting('AGGREGATOR_INTERVAL', aggregator.ProgressReporter.DEFAULT_INTERVAL, rop))
+    except (TypeError, ValueError):
+        interval = aggregator.ProgressReporter.DEFAULT_INTERVAL
+    
+    hostname = session.get('hostname')
+    sender_id = f"{hostname}:{os.getpid()}:{session.get('start_time')}"
+    reporter = aggregator.ProgressReporter(url, job, sender_id, hostname, session.progress,
+                                           job_total=job_total, interval=interval)
+    session.progress_reporter = reporter
+    
+    only = str(get_setting('AGGREGATOR_ONLY', '1', rop)).strip().lower()
+    if only in ('1', 'true', 'yes', 'on'):
+        # Сводный отчет пришлет агрегатор - отчет этого хоста только в консоль
+        session.notify = False
+    
+    log(f"Aggregator: {url} (job {job})", Colors.BLUE, "🛰")
+    reporter.update()
+    return reporter
 
+def publish_progress(session):
+    """
+    Новый кадр: live сообщение и агрегатор фермы (оба отправляют не чаще своего интервала).
+    """
+    update_live_message(session)
+    reporter = session.progress_reporter
+    if reporter is not None:
+        try:
+            reporter.update()
+        except Exception:
+            pass
+
+def finalize_and_send_report(session, title="✅ Рендер завершен!"):
+    """
+    Формирует и отправляет итоговый отчет (один раз на сессию).
+    Используется как FileWatcher'ом, так и finish_render'ом.
+    """
+    if session is None or not session.claim_report():
+        return
+    
+    # Метаданные сцены собираются в фоне - даем им время появиться в отчете
+    wait_scene_info(session)
+    
+    # Размеры последних кадров (и их запись в историю) еще могут быть в работе
+    worker = session.size_worker
+    if worker is not None and not worker.wait(timeout=SIZE_WAIT_TIMEOUT):
+        log("Output sizes are still pending. Report size may be incomplete.", Colors.YELLOW)
+    
+    stats = session.snapshot()
+    msg = build_report_message(stats, title)
+    
+    # Дописываем историю (старт рендера нужен для прогноза следующих запусков)
+    writer = session.history_writer
+    with session.lock:
+        first, session.history_first = session.history_first, None
+    if writer is not None and stats['frames_rendered'] > 0:
+        try:
+            if first:
+                frame, duration, size_bytes = first
+                writer.record(frame, max(0.0, duration - stats['startup']), size_bytes)
+            writer.record_run(stats['startup'], stats['frames_rendered'])
+            writer.flush(timeout=2.0)
+        except Exception as e:
+            print(f"[RenderEstimator] History error: {e}")
+    
+    with session.lock:
+        live_message, session.live_message = session.live_message, None
+        reporter = session.progress_reporter
+    
+    # Финальное состояние хоста - агрегатору (сводный отчет по всей задаче пришлет он).
+    # Отправка в фоне: finish_render в основном потоке не ждет сеть
+    if reporter is not None:
+        try:
+            reporter.finish()
+        except Exception as e:
+            print(f"[RenderEstimator] Aggregator error: {e}")
+    
+    if not session.notify:
+        # Консольный режим без уведомлений - отчет только в консоль
+        print(msg)
+    else:
+        try:
+            if live_message is not None:
+                # Live сообщение превращается в итоговый отчет, а короткий ответ на него дает push-уведомление
+                message_id = live_message.finish(msg)
+                reply_text = f"{title}\n🕸 {stats['rop_name']}"
+                send_telegram_notification(reply_text if message_id else msg, reply_to=message_id)
+            else:
+                send_telegram_notification(msg)
+        except Exception as e:
+            print(f"[RenderEstimator] Ошибка отправки Telegram: {e}")
+    
+    # Последнее сообщение рендера в статус-баре; без открытых рендеров callback снимется сам
+    pump = status_pump
+    if pump is not None:
+        pump.end(session.key, f"RenderEstimator: {stats['rop_name']}: {title} "
+                              f"({stats['frames_rendered']}/{stats['total_frames']})")
+    
+    # Отчет отправлен - фоновые потоки сессии больше не нужны (сессия удалится при следующем start_render)
+    session.close()
+
+
+def stop_frame_watch(watch):
+    """
+    Рендер закончился (например, отменен), а кадров нет - останавливаем watcher сразу,
+    а не через таймаут, и отправляем отчет о том, что успело отрендериться.
+    """
+    if not watch.cancel(title="⛔ Рендер остановлен", timeout=WATCHER_DRAIN_TIMEOUT):
+        log("File Watcher did not stop in time.", Colors.YELLOW)
 
 def finish_render():
     """
     Функция для 'Post-Render Script'.
     """
-    global render_stats, watcher_thread, stop_watcher_event
+    session = get_session()
+    if session is None:
+        return
     
     # Если Watcher работает
-    if watcher_thread and watcher_thread.is_alive():
-        # Проверяем, есть ли еще кадры для ожидания (в pending_frames внутри watcher thread)
-        # Но pending_frames локальная переменная.
-        # Мы можем косвенно проверить: frames_rendered < total_frames?
-        # Или просто довериться Watcher'у.
-        
-        # Если это Detached render, watcher должен продолжать работу.
-        # Если мы здесь, значит ROP "завершил" работу (или инициировал post-render).
-        
-        # ПРАВИЛО: Если Watcher запущен, ОН отвечает за отправку отчета.
-        # finish_render просто выходит, чтобы не мешать, если watcher еще ждет файлы.
-        
-        # Единственный нюанс: как остановить watcher если пользователь ОТМЕНИЛ рендер?
-        # Мы не знаем точно. Пусть watcher отвалится по таймауту или когда найдет файлы.
+    if is_watching(session):
+        watch = session.frame_watch
         
-        print("[RenderEstimator] finish_render called. Handing over final report to active File Watcher.")
+        # По умолчанию watcher отвечает за отчет: husk (detached render) или медленное сетевое
+        # хранилище могут дописывать кадры после Post-Render, а watcher дождется их (или таймаута)
+        detached = str(get_setting('WATCHER_DETACHED', '1', hou.pwd())).strip().lower()
+        if detached not in ('0', 'false', 'no', 'off'):
+            print(f"[RenderEstimator] finish_render called. Handing over final report to active File Watcher "
+                  f"({watch.pending} frames pending).")
+            return
         
-        # Если мы уверены, что рендер ВСЕ (все кадры найдены), можно ускорить выход watcher
-        # Но у нас нет доступа к pending_frames из этого скоупа легко (без переделки в класс).
-        # Поэтому просто выходим.
+        # WATCHER_DETACHED=0: рендер точно закончен. Быстрая финальная проверка кадров,
+        # дописанных перед самым концом (если нашлись все - watcher сам отправит отчет),
+        # иначе рендер отменен - watcher останавливается сразу, а не по таймауту
+        if not watch.drain(timeout=WATCHER_DRAIN_TIMEOUT):
+            stop_frame_watch(watch)
         return
 
-    # Если watcher не работает (обычный рендер), отправляем сами
-    finalize_and_send_report()
+    # Если watcher не работает (обычный рендер), отправляем сами.
+    # Сцена читается здесь (hou - только основной поток), а ожидание размеров,
+    # истории и сети в UI уходит в поток отчета, чтобы Post-Render возвращался сразу
+    run_pending_scene_info(session)
+    if hou.isUIAvailable():
+        session.start_thread(finalize_and_send_report, "RenderEstimator_Report_Thread", args=(session,))
+    else:
+        # hython/hbatch завершается сразу после рендера - отчет отправляется до выхода
+        finalize_and_send_report(session)
 
 
 def load_env(env_path):
@@ -845,9 +1766,9 @@ def load_env(env_path):
     return env_vars
 
 
-def send_telegram_notification(message):
+def find_env_path():
     """
-    Отправляет сообщение в Telegram, используя .env файл для токена и chat_id.
+    Ищет .env: рядом со скриптом, затем рядом с HIP, затем в рабочей директории.
     """
     # 1. Пытаемся найти .env рядом со скриптом
     env_path = None
@@ -859,15 +1780,47 @@ def send_telegram_notification(message):
         pass
     
     # Если путь через __file__ не сработал или файл там не найден
-    if not env_path or not os.path.exists(env_path):
+    if (not env_path or not os.path.exists(env_path)) and hou is not None:
         # Попробуем путь проекта (через HIP, если они рядом)
         hip_dir = os.path.dirname(hou.hipFile.path())
         env_path = os.path.join(hip_dir, '.env')
         
     # Если всё еще нет, проверяем рабочую директорию
-    if not os.path.exists(env_path):
+    if not env_path or not os.path.exists(env_path):
          env_path = os.path.join(os.getcwd(), '.env')
-         
+    
+    return env_path
+
+
+def get_setting(key, default=None, node=None):
+    """
+    Возвращает настройку: сначала spare parm на ROP (имя ключа в нижнем регистре,
+    например estimator_mode), затем ключ из .env, иначе default.
+    """
+    if node is not None:
+        try:
+            parm = node.parm(key.lower())
+            if parm is not None:
+                val = parm.eval()
+                if val not in (None, ""):
+                    return val
+        except Exception:
+            pass
+    
+    env = load_env(find_env_path())
+    return env.get(key, default)
+
+
+def get_notifier():
+    """
+    Возвращает (notifier, chat_id) по настройкам .env или (None, None),
+    если токен/чат не настроены. Notifier переиспользуется между рендерами.
+    Настройки: TELEGRAM_API_URL, NOTIFY_OUTBOX, NOTIFY_CONNECT_TIMEOUT,
+    NOTIFY_READ_TIMEOUT, NOTIFY_RETRIES.
+    """
+    global telegram_notifier
+    
+    env_path = find_env_path()
     env = load_env(env_path)
     
     token = env.get('TELEGRAM_BOT_TOKEN')
@@ -875,23 +1828,350 @@ def send_telegram_notification(message):
     
     if not token or not chat_id:
         print(f"[RenderEstimator] TELEGRAM_BOT_TOKEN or TELEGRAM_CHAT_ID not found in {env_path}")
-        return
+        return None, None
+    
+    api_url = env.get('TELEGRAM_API_URL', notifier.DEFAULT_API_URL)
+    outbox_dir = env.get('NOTIFY_OUTBOX', notifier.DEFAULT_OUTBOX_DIR)
+    
+    current = telegram_notifier
+    if current is None or current.token != token or current.api_url != api_url.rstrip('/') or current.outbox_dir != outbox_dir:
+        try:
+            telegram_notifier = notifier.TelegramNotifier(
+                token, api_url=api_url, outbox_dir=outbox_dir,
+                connect_timeout=float(env.get('NOTIFY_CONNECT_TIMEOUT', 5)),
+                read_timeout=float(env.get('NOTIFY_READ_TIMEOUT', 10)),
+                retries=int(env.get('NOTIFY_RETRIES', 4)))
+        except ValueError as e:
+            print(f"[RenderEstimator] Invalid notifier settings: {e}. Using defaults.")
+            telegram_notifier = notifier.TelegramNotifier(token, api_url=api_url, outbox_dir=outbox_dir)
+    
+    return telegram_notifier, chat_id
+
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+def send_telegram_notification(message, reply_to=None):
+    """
+    Отправляет сообщение в Telegram, используя .env файл для токена и chat_id.
+    Не блокирует: сообщение уходит в фоновую очередь (см. notifier.py).
+    """
+    sender, chat_id = get_notifier()
+    if sender is None:
+        return
+    
     data = {
         "chat_id": chat_id,
         "text": message
     }
+    if reply_to:
+        data["reply_to_message_id"] = reply_to
+    
+    def on_sent(result):
+        if result is not None:
+            print("[RenderEstimator] Telegram notification sent.")
+    
+    sender.send('sendMessage', data, callback=on_sent)
+
+
+# --- Консольный режим (без Houdini) ---
+# Сколько ждать итоговый отчет после остановки watcher'а (сек)
+CLI_REPORT_TIMEOUT = 30.0
+
+def process_alive(pid):
+    """
+    True, пока процесс рендера (husk) жив. Только POSIX: на Windows os.kill завершает процесс.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def compile_patterns(patterns):
+    """
+    Шаблоны путей из командной строки ($F4, ####, %04d; $HIP, $JOB и т.п. - из окружения).
+    """
+    templates = []
+    for pattern in patterns:
+        template = path_template.PathTemplate.compile(pattern, expand=os.path.expandvars)
+        if template is None or not template.has_frame:
+            raise ValueError(f"Unsupported output pattern (needs a frame token like $F4 or ####): {pattern}")
+        templates.append(template)
+    return templates
+
+def watch_command(args):
+    """
+    python -m render_estimator watch: File Watcher для рендера вне Houdini (husk, hbatch).
+    Тот же движок, что и в Houdini: FrameWatch в общем потоке WatcherHub, модель прогноза,
+    история и отчет в Telegram. Кадры, записанные до запуска команды, не учитываются.
+    """
+    try:
+        templates = compile_patterns(args.pattern)
+    except ValueError as e:
+        log(str(e), Colors.RED, "❌")
+        return 2
+    if args.pid and os.name == 'nt':
+        log("--pid is not supported on Windows.", Colors.RED, "❌")
+        return 2
+    
+    f_start, f_end = args.range
+    frames = watcher.FrameRange(f_start, f_end, args.step)
+    if not len(frames):
+        log("Empty frame range.", Colors.RED, "❌")
+        return 2
+    try:
+        log_source = create_log_progress(None, path=args.log, patterns=args.log_pattern)
+    except (ValueError, re.error) as e:
+        log(f"Log progress error: {e}", Colors.RED, "❌")
+        return 2
     
-    headers = {'Content-Type': 'application/json'}
-    req = urllib.request.Request(url, data=json.dumps(data).encode('utf-8'), headers=headers)
+    try:
+        estimator = create_frame_estimator(None)
+    except Exception as e:
+        log(f"Estimator setup error: {e}. Using cumulative mean.", Colors.YELLOW)
+        estimator = estimators.create_estimator()
+    
+    session = render_session.RenderSession(
+        estimator=estimator,
+        total_frames=len(frames),
+        hip_name=args.hip,
+        rop_name=args.name,
+        hostname=socket.gethostname(),
+        renderer=args.renderer,
+        resolution=args.resolution,
+        camera_name=args.camera,
+        output_path=", ".join(args.pattern),
+    )
+    session.key = args.name
+    session.notify = not args.no_notify
+    session.set_frame_range(f_start, f_end, args.step)
+    active_sessions[session.key] = session
+    
+    if args.no_history:
+        session.history_buffer = None
+    else:
+        try:
+            setup_history(session, history_db_path(None), frames)
+        except Exception as e:
+            log(f"History error: {e}", Colors.YELLOW)
+            with session.lock:
+                session.history_buffer = None
     
+    reporter = None
     try:
-        with urllib.request.urlopen(req) as response:
-            print(f"[RenderEstimator] Telegram notification sent. Status: {response.getcode()}")
-    except urllib.error.HTTPError as e:
-        print(f"[RenderEstimator] Telegram HTTP Error: {e.code} - {e.reason}")
-        print(e.read().decode())
+        reporter = start_progress_reporter(session, None, url=args.aggregator, job=args.job)
     except Exception as e:
-        print(f"[RenderEstimator] Telegram Error: {e}")
+        log(f"Aggregator error: {e}", Colors.YELLOW)
+    
+    if session.notify:
+        try:
+            start_live_message(session, None)
+        except Exception as e:
+            log(f"Live message error: {e}", Colors.YELLOW)
+    
+    if len(templates) == 1:
+        path_for_frame = templates[0].expand
+    else:
+        path_for_frame = lambda frame: tuple(template.expand(frame) for template in templates)
+    try:
+        horizon = int(float(get_setting('WATCHER_HORIZON', watcher.HorizonIndex.DEFAULT_HORIZON)))
+    except (TypeError, ValueError):
+        horizon = watcher.HorizonIndex.DEFAULT_HORIZON
+    pending = watcher.HorizonIndex(frames, path_for_frame, horizon=horizon,
+                                   frame_matcher=templates[0].frame_matcher())
+    
+    watch = session.frame_watch = FrameWatch(session, pending, create_poll_schedule(None), hub=watcher_hub)
+    watch.log_progress = log_source
+    watcher_hub.add(watch)
+    
+    try:
+        while not watch.stopped_event.wait(1.0):
+            if args.pid and not process_alive(args.pid):
+                log(f"Render process {args.pid} exited.", Colors.BLUE)
+                # Быстрая финальная проверка, затем отчет о том, что успело отрендериться
+                if not watch.drain(timeout=WATCHER_DRAIN_TIMEOUT):
+                    stop_frame_watch(watch)
+                break
+    except KeyboardInterrupt:
+        log("Interrupted.", Colors.YELLOW, "⛔")
+        stop_frame_watch(watch)
+    
+    # Отчет отправляется потоком watcher'а; сессия закрывается после отправки
+    if not session.stop_event.wait(CLI_REPORT_TIMEOUT):
+        log("Final report did not finish in time.", Colors.YELLOW)
+    sender = telegram_notifier
+    if sender is not None:
+        sender.wait(timeout=CLI_REPORT_TIMEOUT)
+    if reporter is not None:
+        reporter.wait(timeout=CLI_REPORT_TIMEOUT)
+    return 0 if not watch.pending else 1
+
+def parse_listen_address(text):
+    host, _, port = text.rpartition(':')
+    return host or '0.0.0.0', int(port)
+
+def aggregate_command(args):
+    """
+    python -m render_estimator aggregate: принимает прогресс блейдов фермы
+    и отправляет один сводный отчет, когда вся задача закончена.
+    """
+    if not args.udp and not args.http:
+        args.udp = f"0.0.0.0:{aggregator.DEFAULT_PORT}"
+    
+    def notify(text):
+        print(text)
+        if not args.no_notify:
+            send_telegram_notification(text)
+    
+    def on_status(status):
+        eta = format_duration(status['eta']) if status['eta'] is not None else "?"
+        log(f"{status['job']}: {status['done']}/{status['total']} "
+            f"({status['active']}/{status['hosts']} hosts, {status['rate'] * 3600:.1f} fr/h). ETA: {eta}",
+            Colors.CYAN)
+    
+    agg = aggregator.Aggregator(notify, settle_time=args.settle, stale_timeout=args.stale)
+    try:
+        if args.udp:
+            host, port = agg.serve_udp(*parse_listen_address(args.udp))
+            log(f"Aggregator UDP: {host}:{port}", Colors.BLUE, "🛰")
+        if args.http:
+            host, port = agg.serve_http(*parse_listen_address(args.http))[:2]
+            log(f"Aggregator HTTP: {host}:{port}", Colors.BLUE, "🛰")
+    except (OSError, ValueError) as e:
+        log(f"Aggregator error: {e}", Colors.RED, "❌")
+        agg.close()
+        return 2
+    
+    try:
+        agg.run(on_status=on_status)
+    except KeyboardInterrupt:
+        log("Interrupted.", Colors.YELLOW, "⛔")
+    finally:
+        agg.close()
+    sender = telegram_notifier
+    if sender is not None:
+        sender.wait(timeout=CLI_REPORT_TIMEOUT)
+    return 0
+
+def plan_command(args):
+    """
+    python -m render_estimator plan: делит диапазон кадров между хостами фермы
+    по времени кадров из истории прошлых рендеров этой ROP.
+    """
+    # С --json в stdout только JSON (plan --json | jq), диагностика - в stderr
+    stream = sys.stderr if args.json else None
+    if args.hosts < 1:
+        log("--hosts must be positive.", Colors.RED, "❌", file=stream)
+        return 2
+    f_start, f_end = args.range
+    frames = list(watcher.FrameRange(f_start, f_end, args.step))
+    if not frames:
+        log("Empty frame range.", Colors.RED, "❌", file=stream)
+        return 2
+    
+    db_path = args.db or get_setting('HISTORY_DB', history.DEFAULT_DB_PATH)
+    key = (args.hip, args.name, args.renderer, args.resolution)
+    predictions, startup = history.load_predictions(db_path, key)
+    if args.startup is not None:
+        startup = args.startup
+    known = sum(1 for frame in frames if frame in predictions)
+    if not predictions:
+        log(f"No history for {args.name} in {db_path}. Frames are treated as equal.", Colors.YELLOW, file=stream)
+    
+    costs = planner.frame_costs(frames, predictions)
+    chunks = planner.PLANNERS[args.mode](frames, costs, args.hosts, startup)
+    even = planner.plan_even(frames, costs, args.hosts, startup)
+    span, even_span = planner.makespan(chunks), planner.makespan(even)
+    
+    if args.json:
+        print(json.dumps({
+            'mode': args.mode,
+            'startup': startup,
+            'makespan': span,
+            'even_makespan': even_span,
+            'known_frames': known,
+            'hosts': [{'frames': chunk.format(args.step), 'count': len(chunk.frames), 'time': chunk.time}
+                      for chunk in chunks],
+        }, indent=2))
+        return 0
+    
+    print(f"[RenderEstimator] План: {len(frames)} кадров на {len(chunks)} хостов ({args.mode}). "
+          f"История: {known}/{len(frames)} кадров, старт процесса: {format_duration(startup)}")
+    for index, chunk in enumerate(chunks, 1):
+        print(f"  {index:>3}. {chunk.format(args.step)}  ({len(chunk.frames)} кадров, ~{format_duration(chunk.time)})")
+    gain = f" (-{(1 - span / even_span) * 100:.0f}%)" if even_span > span else ""
+    print(f"[RenderEstimator] Прогноз: {format_duration(span)}{gain}. Ровное деление: {format_duration(even_span)}")
+    return 0
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m render_estimator",
+        description="Render Estimator без Houdini: прогресс, прогноз и отчет для husk/hbatch рендеров.")
+    commands = parser.add_subparsers(dest='command')
+    
+    watch = commands.add_parser('watch', help="Следить за файлами кадров рендера")
+    watch.add_argument('--pattern', action='append', required=True,
+                       help="Путь файла кадра с номером кадра ($F4, ####, %%04d). "
+                            "Можно указать несколько раз (AOV, deep) - кадр готов, когда записаны все файлы.")
+    watch.add_argument('--range', nargs=2, type=int, required=True, metavar=('START', 'END'),
+                       help="Диапазон кадров (включительно)")
+    watch.add_argument('--step', type=int, default=1, help="Шаг кадров (по умолчанию 1)")
+    watch.add_argument('--name', default="husk", help="Имя задачи в отчете и истории (вместо ROP ноды)")
+    watch.add_argument('--hip', default="Unknown", help="Имя сцены в отчете и истории")
+    watch.add_argument('--renderer', default="Unknown", help="Рендерер в отчете (например, Karma CPU)")
+    watch.add_argument('--resolution', default="Unknown", help="Разрешение в отчете")
+    watch.add_argument('--camera', default="Unknown", help="Камера в отчете")
+    watch.add_argument('--pid', type=int, default=None,
+                       help="PID процесса рендера: когда он завершится, watcher остановится сразу (POSIX)")
+    watch.add_argument('--no-notify', action='store_true', help="Не отправлять Telegram, только консоль")
+    watch.add_argument('--no-history', action='store_true', help="Не читать и не писать историю рендеров")
+    watch.add_argument('--log', default=None,
+                       help="Лог рендерера (husk ... > render.log): проценты кадра (ALF_PROGRESS) уточняют прогноз")
+    watch.add_argument('--log-pattern', action='append', default=None,
+                       help="Регулярное выражение прогресса в логе: группа процентов или две группы готово/всего")
+    watch.add_argument('--aggregator', default=None,
+                       help="Агрегатор фермы (udp://host:port или http://host:port), вместо AGGREGATOR_URL")
+    watch.add_argument('--job', default=None, help="Имя задачи для агрегатора, общее для всех блейдов")
+    watch.set_defaults(handler=watch_command)
+    
+    aggregate = commands.add_parser('aggregate', help="Агрегатор фермы: сводный прогресс и один отчет на задачу")
+    aggregate.add_argument('--udp', default=None, metavar='HOST:PORT',
+                           help=f"Принимать прогресс по UDP (например, 0.0.0.0:{aggregator.DEFAULT_PORT})")
+    aggregate.add_argument('--http', default=None, metavar='HOST:PORT',
+                           help="Принимать прогресс по HTTP (POST /progress, сводка - GET /jobs)")
+    aggregate.add_argument('--settle', type=float, default=aggregator.Aggregator.DEFAULT_SETTLE_TIME,
+                           help="Сколько ждать после последнего хоста, прежде чем считать задачу законченной (сек)")
+    aggregate.add_argument('--stale', type=float, default=aggregator.Aggregator.DEFAULT_STALE_TIMEOUT,
+                           help="Хост без сообщений дольше этого считается потерянным (сек)")
+    aggregate.add_argument('--no-notify', action='store_true', help="Не отправлять Telegram, только консоль")
+    aggregate.set_defaults(handler=aggregate_command)
+    
+    plan = commands.add_parser('plan', help="Разбить кадры между хостами фермы по истории рендеров")
+    plan.add_argument('--range', nargs=2, type=int, required=True, metavar=('START', 'END'),
+                      help="Диапазон кадров (включительно)")
+    plan.add_argument('--step', type=int, default=1, help="Шаг кадров (по умолчанию 1)")
+    plan.add_argument('--hosts', type=int, required=True, help="Число хостов (блейдов)")
+    plan.add_argument('--mode', choices=sorted(planner.PLANNERS), default='contiguous',
+                      help="contiguous - непрерывные куски, interleaved - списки кадров вразброс")
+    plan.add_argument('--name', required=True, help="ROP (путь ноды или --name консольного режима) из истории")
+    plan.add_argument('--hip', default=None, help="Сцена из истории (по умолчанию любая)")
+    plan.add_argument('--renderer', default=None, help="Рендерер из истории (по умолчанию любой)")
+    plan.add_argument('--resolution', default=None, help="Разрешение из истории (по умолчанию любое)")
+    plan.add_argument('--startup', type=float, default=None,
+                      help="Старт процесса на хосте (сек), по умолчанию из истории")
+    plan.add_argument('--db', default=None, help="База истории (по умолчанию HISTORY_DB)")
+    plan.add_argument('--json', action='store_true', help="Вывод в JSON")
+    plan.set_defaults(handler=plan_command)
+    return parser
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, 'handler', None):
+        parser.print_help()
+        return 2
+    return args.handler(args)
+
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Сбор информации о сцене (USD stage) без зависимости от hou.
+"""
+import time
+
+try:
+    from pxr import Usd, UsdGeom, UsdLux, UsdShade
+except ImportError:
+    Usd = UsdGeom = UsdLux = UsdShade = None
+
+# Стандартное место render settings/products в Solaris
+RENDER_SCOPE_PATH = '/Render'
+
+# Лимиты поиска источников света на больших stage
+DEFAULT_LIGHTS_MAX_PRIMS = 200000
+DEFAULT_LIGHTS_MAX_SECONDS = 2.0
+
+# Типы, внутри которых не бывает источников света (используются, если pxr недоступен)
+_PRUNE_TYPE_NAMES = {
+    'PointInstancer', 'Mesh', 'BasisCurves', 'NurbsCurves', 'Points', 'NurbsPatch',
+    'Capsule', 'Cone', 'Cube', 'Cylinder', 'Sphere', 'Plane', 'Volume',
+    'Material', 'Shader', 'NodeGraph', 'GeomSubset',
+    'Skeleton', 'SkelAnimation', 'SkelRoot',
+}
+
+
+def is_light(prim):
+    """
+    Проверка по схеме UsdLux: LightAPI (USD 21.11+) или типизированная UsdLux.Light.
+    Без pxr - по имени типа.
+    """
+    if UsdLux is not None:
+        light_api = getattr(UsdLux, 'LightAPI', None)
+        if light_api is not None and prim.HasAPI(light_api):
+            return True
+        light_type = getattr(UsdLux, 'Light', None)
+        if light_type is not None and prim.IsA(light_type):
+            return True
+        return False
+    return 'Light' in prim.GetTypeName()
+
+
+def should_prune(prim):
+    """
+    True, если в поддереве прима не может быть источников света:
+    инстансеры, геометрия, материалы/шейдеры.
+    """
+    if UsdGeom is not None:
+        return (prim.IsA(UsdGeom.PointInstancer) or prim.IsA(UsdGeom.Gprim)
+                or prim.IsA(UsdShade.Material) or prim.IsA(UsdShade.NodeGraph)
+                or prim.IsA(UsdShade.Shader) or prim.IsA(UsdGeom.Subset))
+    return prim.GetTypeName() in _PRUNE_TYPE_NAMES
+
+
+class _PrimWalker:
+    """
+    Обход в глубину через GetChildren() с возможностью отсечь поддерево
+    (аналог Usd.PrimRange.PruneChildren для случаев без pxr).
+    """
+
+    def __init__(self, root):
+        self._stack = list(reversed(root.GetChildren()))
+        self._current = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._current is not None:
+            self._stack.extend(reversed(self._current.GetChildren()))
+        if not self._stack:
+            raise StopIteration
+        self._current = self._stack.pop()
+        return self._current
+
+    def PruneChildren(self):
+        self._current = None
+
+
+def _prim_iterator(stage):
+    if Usd is not None and isinstance(stage, Usd.Stage):
+        # PrimRange по умолчанию не заходит в неактивные/незагруженные (payload) примы и инстансы
+        return iter(Usd.PrimRange(stage.GetPseudoRoot()))
+    return _PrimWalker(stage.GetPseudoRoot())
+
+
+def find_usd_lights(stage, max_prims=DEFAULT_LIGHTS_MAX_PRIMS, max_seconds=DEFAULT_LIGHTS_MAX_SECONDS):
+    """
+    Ищет источники света на stage с отсечением поддеревьев без света.
+    Возвращает (список имен, truncated). truncated=True - поиск остановлен
+    по лимиту примов/времени, список неполный.
+    """
+    lights = []
+    deadline = time.perf_counter() + max_seconds if max_seconds and max_seconds > 0 else None
+    it = _prim_iterator(stage)
+    visited = 0
+    for prim in it:
+        visited += 1
+        if max_prims and visited > max_prims:
+            return lights, True
+        # Время проверяем не на каждом приме
+        if deadline is not None and (visited & 1023) == 0 and time.perf_counter() > deadline:
+            return lights, True
+
+        if is_light(prim):
+            lights.append(prim.GetName())
+            it.PruneChildren()
+        elif should_prune(prim):
+            it.PruneChildren()
+    return lights, False
+
+
+def find_render_products(stage, settings_path=None):
+    """
+    RenderProduct примы для рендера: цели relationship products у render settings,
+    а если их нет - все RenderProduct внутри /Render.
+    """
+    if settings_path:
+        settings = stage.GetPrimAtPath(settings_path)
+        if settings and settings.IsValid():
+            rel = settings.GetRelationship('products')
+            if rel:
+                products = [stage.GetPrimAtPath(path) for path in rel.GetTargets()]
+                products = [p for p in products if p and p.IsValid()]
+                if products:
+                    return products
+
+    scope = stage.GetPrimAtPath(RENDER_SCOPE_PATH)
+    if not scope or not scope.IsValid():
+        return []
+    products = []
+    it = _PrimWalker(scope)
+    for prim in it:
+        if prim.GetTypeName() == 'RenderProduct':
+            products.append(prim)
+            it.PruneChildren()
+        elif should_prune(prim):
+            it.PruneChildren()
+    return products
+
+
+def product_name(prim, frame):
+    """
+    Путь файла render product на кадре (атрибут productName может быть анимирован).
+    """
+    attr = prim.GetAttribute('productName')
+    if not attr:
+        return None
+    value = attr.Get(frame)
+    return str(value) if value else None
@@ -0,0 +1,316 @@
+"""
+Состояние одного рендера без зависимости от hou.
+Поток Houdini (post_frame / finish_render) и фоновые потоки (File Watcher,
+размеры файлов, сбор метаданных) меняют сессию только через ее методы под локом,
+а отчеты читают неизменяемый снимок snapshot() без блокировок.
+"""
+import threading
+import time
+from types import MappingProxyType
+
+import frame_stats
+import utils
+
+# Поля статистики и их значения до начала рендера
+STATS_DEFAULTS = {
+    'start_time': None,
+    'last_frame_time': None,
+    'frames_rendered': 0,
+    'total_frames': 0,
+    'hip_name': "Unknown",
+    'rop_name': "Unknown",
+    'camera_name': "Unknown",
+    'renderer': "Unknown",
+    'resolution': "Unknown",
+    'hostname': "Unknown",
+    'lights': [],
+    'lights_truncated': False, # Поиск света остановлен по лимиту (список неполный)
+    'output_path': "Unknown",
+    'total_size_bytes': 0,
+    'scene_info_timings': {},
+    # Время последнего вызова post_frame (в режиме File Watcher время кадров ведет watcher)
+    'last_post_frame_time': None,
+}
+
+
+class RenderSession:
+    """
+    Статистика рендера, модель прогноза и фоновые объекты, которые ему принадлежат
+    (потоки, live сообщение, история, подсчет размеров).
+    close() останавливает все это, поэтому после перезапуска рендера или
+    перезагрузки модуля от прошлой сессии не остается висящих потоков.
+    """
+    # Сколько ждать остановки потоков сессии в close() (сек)
+    CLOSE_TIMEOUT = 2.0
+
+    def __init__(self, estimator=None, start_time=None, **stats):
+        self.lock = threading.RLock()
+        self._stats = dict(STATS_DEFAULTS)
+        self._stats['frame_times'] = frame_stats.FrameTimeStore()
+        # Готовые кадры интервалами (диапазон задается set_frame_range)
+        self._stats['frames'] = utils.FrameTracker()
+        start_time = time.time() if start_time is None else start_time
+        self._stats['start_time'] = start_time
+        self._stats['last_frame_time'] = start_time
+        self._stats.update(stats)
+        self.estimator = estimator
+        self._reported = False
+        # Прогресс текущего кадра из лога рендерера: [первая доля, ее время, последняя доля, ее время]
+        self._frame_progress = None
+        # Прогноз по кадрам из истории (set_predictions): {кадр: сек}, значение для кадров
+        # без истории и суммы прогноза готовых [сек, кадров] и оставшихся кадров диапазона
+        self._predictions = None
+        self._prediction_fallback = 0.0
+        self._predicted_done = [0.0, 0]
+        self._predicted_remaining = 0.0
+        self._predicted_mean = 0.0
+        # Ключ сессии (путь ROP)
+        self.key = None
+        # False - итоговый отчет только в консоль, без Telegram
+        self.notify = True
+
+        # Сигнал остановки для всех потоков сессии
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        # Фоновые объекты рендера (создаются по мере необходимости)
+        self.frame_watch = None # Задание общего потока File Watcher
+        # Отложенный сбор метаданных сцены (выполняется в основном потоке) и его готовность
+        self.scene_info_pending = None
+        self.scene_info_ready = threading.Event()
+        self.scene_info_ready.set() # Пока сбор не запущен, ждать нечего
+        self.scene_collector = None # SceneInfoCollector (stage ищется один раз за рендер)
+        self.live_message = None
+        self.progress_reporter = None # Отправка прогресса агрегатору фермы
+        self.size_worker = None
+        self.history_writer = None
+        # Кадры, готовые до подключения истории (None - буферизация не нужна)
+        self.history_buffer = []
+        # Первый кадр рендера для истории: False - еще не было, (кадр, время, размер) - ждет
+        # оценки старта (записывается в finalize за вычетом старта), None - записан
+        self.history_first = False
+        # Кэш путей вывода: {(путь параметра, строка): PathTemplate}, {путь ROP: products}
+        self.output_templates = {}
+        self.output_products = {}
+
+    @property
+    def closed(self):
+        return self.stop_event.is_set()
+
+    # --- Изменение состояния ---
+
+    def update(self, **values):
+        with self.lock:
+            self._stats.update(values)
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self._stats.get(key, default)
+
+    def touch(self, timestamp):
+        """
+        Сдвигает время "последнего кадра" (кадр учтен без статистики).
+        """
+        with self.lock:
+            self._stats['last_frame_time'] = timestamp
+
+    def set_frame_range(self, start, end, step=1):
+        """
+        Ожидаемый диапазон кадров (для пропущенных кадров в отчете).
+        """
+        with self.lock:
+            tracker = utils.FrameTracker(start, end, step)
+            for frame in self._stats['frame_times'].frames:
+                tracker.add(frame)
+            self._stats['frames'] = tracker
+
+    def set_predictions(self, predictions, frames):
+        """
+        Прогноз длительности кадров из истории прошлых рендеров. Оставшееся время
+        считается по прогнозу еще не готовых кадров, поэтому тяжелый конец шота
+        не усредняется с легким началом.
+        """
+        with self.lock:
+            self._predictions = None
+            if not predictions or not frames:
+                return
+            fallback = sum(predictions.values()) / len(predictions)
+            done = self._stats['frames']
+            total = remaining = 0.0
+            done_count = 0
+            for frame in frames:
+                cost = predictions.get(frame, fallback)
+                total += cost
+                if frame in done:
+                    done_count += 1
+                else:
+                    remaining += cost
+            self._predictions = predictions
+            self._prediction_fallback = fallback
+            self._predicted_remaining = remaining
+            self._predicted_mean = total / len(frames)
+            self._predicted_done = [total - remaining, done_count]
+
+    def add_frame(self, frame, duration, size_bytes=0, finished_at=None):
+        """
+        Учитывает готовый кадр одним атомарным шагом.
+        finished_at - момент готовности (время "последнего кадра" для следующего).
+        Возвращает (время на кадр, оставшееся время, готово кадров).
+        """
+        with self.lock:
+            stats = self._stats
+            stats['frames_rendered'] += 1
+            stats['total_size_bytes'] += size_bytes
+            stats['frame_times'].add(frame, duration)
+            if stats['frames'].add(frame) and self._predictions is not None:
+                cost = self._predictions.get(frame, self._prediction_fallback)
+                self._predicted_remaining = max(0.0, self._predicted_remaining - cost)
+                self._predicted_done[0] += cost
+                self._predicted_done[1] += 1
+            self._frame_progress = None
+            if finished_at is not None:
+                stats['last_frame_time'] = max(stats['last_frame_time'] or finished_at, finished_at)
+            if self.estimator is None:
+                return duration, 0.0, stats['frames_rendered']
+            self.estimator.add(duration)
+            per_frame, remaining = self._estimate()
+            return per_frame, remaining, stats['frames_rendered']
+
+    def set_frame_progress(self, fraction, timestamp):
+        """
+        Доля готовности текущего кадра (0..1) из лога рендерера.
+        Доля меньше прошлой - начался следующий кадр.
+        """
+        with self.lock:
+            progress = self._frame_progress
+            if progress is None or fraction < progress[2]:
+                self._frame_progress = [fraction, timestamp, fraction, timestamp]
+            else:
+                progress[2], progress[3] = fraction, timestamp
+
+    def add_size(self, size_bytes):
+        with self.lock:
+            self._stats['total_size_bytes'] += size_bytes
+
+    def estimate(self):
+        """
+        (время на кадр, оставшееся время) по модели прогноза.
+        """
+        with self.lock:
+            return self._estimate()
+
+    def percentile(self, p):
+        with self.lock:
+            return self._stats['frame_times'].percentile(p)
+
+    def claim_report(self):
+        """
+        True только для первого вызова: итоговый отчет отправляется один раз,
+        даже если его одновременно пытаются отправить watcher и finish_render.
+        """
+        with self.lock:
+            if self._reported:
+                return False
+            self._reported = True
+            return True
+
+    def _estimate(self):
+        if self.estimator is None:
+            return 0.0, 0.0
+        rem_frames = max(0, self._stats['total_frames'] - self._stats['frames_rendered'])
+        if rem_frames > 0 and self._predictions is not None:
+            # Остаток в "кадрах" той же стоимости, что уже готовые (или средний кадр диапазона):
+            # модель дает скорость, история - относительную тяжесть оставшихся кадров
+            done_cost, done_count = self._predicted_done
+            mean = done_cost / done_count if done_count else self._predicted_mean
+            if mean > 0:
+                rem_frames = self._predicted_remaining / mean
+        per_frame = self.estimator.per_frame()
+        progress = self._frame_progress
+        if progress is None or rem_frames <= 0:
+            return per_frame, self.estimator.remaining(rem_frames)
+        
+        # Кадр в работе: остаток по скорости роста процентов с начала кадра
+        # (старт сцены уже позади), остальные кадры - по модели
+        first, first_time, fraction, last_time = progress
+        if fraction > first and last_time > first_time:
+            current = (1.0 - fraction) * (last_time - first_time) / (fraction - first)
+        else:
+            current = (1.0 - fraction) * per_frame
+        return per_frame, per_frame * max(0.0, rem_frames - 1) + current
+
+    # --- Чтение ---
+
+    def snapshot(self):
+        """
+        Неизменяемый снимок статистики для отчетов и live сообщения.
+        Помимо полей статистики содержит per_frame, remaining и startup модели прогноза.
+        """
+        with self.lock:
+            data = dict(self._stats)
+            data['frame_times'] = self._stats['frame_times'].copy()
+            data['frames'] = self._stats['frames'].copy()
+            data['lights'] = tuple(self._stats['lights'])
+            data['per_frame'], data['remaining'] = self._estimate()
+            data['frame_progress'] = self._frame_progress[2] if self._frame_progress is not None else None
+            data['startup'] = self.estimator.startup() if self.estimator is not None else 0.0
+        return MappingProxyType(data)
+
+    def progress(self):
+        """
+        Компактное состояние для агрегатора фермы: готово/всего кадров, суммарное время
+        кадров, начало рендера, готовые интервалы и ожидаемый диапазон.
+        """
+        with self.lock:
+            stats = self._stats
+            tracker = stats['frames']
+            return {
+                'n': stats['frames_rendered'],
+                'total': stats['total_frames'],
+                'busy': round(stats['frame_times'].total, 3),
+                'start': stats['start_time'],
+                'ranges': tracker.ranges(),
+                'step': tracker.step,
+                'expect': tracker.expected_range(),
+            }
+
+    # --- Потоки ---
+
+    def start_thread(self, target, name, args=()):
+        """
+        Запускает фоновый поток, принадлежащий сессии (остановится в close()).
+        """
+        thread = threading.Thread(target=target, name=name, args=args)
+        thread.daemon = True
+        # Ссылка на сессию: по ней поток находится и останавливается после перезагрузки модуля
+        thread.session = self
+        thread.stop_event = self.stop_event
+        with self.lock:
+            self.threads = [t for t in self.threads if t.is_alive()]
+            self.threads.append(thread)
+        thread.start()
+        return thread
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """
+        Останавливает потоки и фоновые объекты сессии.
+        Возвращает False, если какой-то поток не успел завершиться.
+        """
+        self.stop_event.set()
+        with self.lock:
+            live_message, self.live_message = self.live_message, None
+            reporter, self.progress_reporter = self.progress_reporter, None
+            threads = list(self.threads)
+        if live_message is not None:
+            live_message.cancel()
+        if reporter is not None:
+            reporter.close()
+
+        deadline = time.time() + timeout
+        stopped = True
+        for thread in threads:
+            if thread is threading.current_thread():
+                continue
+            thread.join(max(0.0, deadline - time.time()))
+            stopped = stopped and not thread.is_alive()
+        return stopped
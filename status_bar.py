@@ -0,0 +1,102 @@
+"""
+Статус-бар Houdini из любого потока без зависимости от hou.
+Сообщения кладутся в почтовый ящик, а показываются на цикле событий Houdini
+(основной поток) не чаще заданного интервала.
+"""
+import itertools
+import time
+
+
+class StatusPump:
+    """
+    Почтовый ящик статус-бара на одно последнее сообщение.
+    post() можно звать из любого потока: это одна атомарная замена ссылки, без локов.
+    drain() вызывается циклом событий Houdini (hou.ui.addEventLoopCallback) и показывает
+    последнее сообщение не чаще interval секунд, поэтому пачка кадров не перерисовывает
+    UI на каждый кадр, а промежуточные сообщения просто заменяются новыми.
+
+    show(text) - вывод в статус-бар (hou.ui.setStatusMessage).
+    add_callback / remove_callback - регистрация drain() на цикле событий
+    (только из основного потока). Пока открыт хоть один рендер (begin/end),
+    drain() остается на цикле событий, потом снимает себя сам.
+    """
+    DEFAULT_INTERVAL = 0.5
+
+    def __init__(self, show, add_callback=None, remove_callback=None, interval=DEFAULT_INTERVAL,
+                 clock=time.monotonic):
+        self.show = show
+        self.add_callback = add_callback
+        self.remove_callback = remove_callback
+        self.interval = interval
+        self.clock = clock
+        self.installed = False
+        # (номер, текст) последнего сообщения; номер растет, поэтому "новое ли оно" видно без сброса ящика
+        self._seq = itertools.count(1)
+        self._latest = None
+        self._shown_seq = 0
+        self._shown_at = None
+        # Открытые рендеры {ключ: True} (операции dict атомарны)
+        self._open = {}
+
+    def post(self, text):
+        self._latest = (next(self._seq), text)
+
+    def begin(self, key):
+        """
+        Рендер начался - drain() нужен на цикле событий (только из основного потока).
+        """
+        self._open[key] = True
+        self.install()
+
+    def end(self, key, text=None):
+        """
+        Рендер закончен (из любого потока). text - последнее сообщение рендера.
+        """
+        if text is not None:
+            self.post(text)
+        self._open.pop(key, None)
+
+    def install(self):
+        if self.installed or self.add_callback is None:
+            return
+        self.add_callback(self.drain)
+        self.installed = True
+
+    def uninstall(self):
+        if not self.installed:
+            return
+        self.installed = False
+        if self.remove_callback is not None:
+            try:
+                self.remove_callback(self.drain)
+            except Exception:
+                pass
+
+    @property
+    def pending(self):
+        latest = self._latest
+        return latest is not None and latest[0] != self._shown_seq
+
+    def drain(self):
+        """
+        Показывает новое сообщение, если с прошлого показа прошло interval секунд.
+        Возвращает True, если сообщение было показано.
+        """
+        latest = self._latest
+        if latest is None or latest[0] == self._shown_seq:
+            # Все показано и рендеров нет - цикл событий больше не нужен
+            if not self._open:
+                self.uninstall()
+            return False
+
+        now = self.clock()
+        if self._shown_at is not None and now - self._shown_at < self.interval:
+            return False
+
+        self._shown_seq, text = latest
+        self._shown_at = now
+        try:
+            self.show(text)
+        except Exception:
+            pass
+        return True
@@ -0,0 +1,175 @@
+import json
+import time
+import urllib.request
+
+import pytest
+
+import aggregator
+from session import RenderSession
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def test_parse_url():
+    assert aggregator.parse_url("udp://farm:9000") == ('udp', ('farm', 9000))
+    assert aggregator.parse_url("http://127.0.0.1:8080/") == ('http', ('127.0.0.1', 8080))
+    assert aggregator.parse_url("farm:9000") == ('udp', ('farm', 9000))
+    with pytest.raises(ValueError):
+        aggregator.parse_url("tcp://farm:9000")
+
+
+def test_session_progress_is_cumulative():
+    session = RenderSession(start_time=100.0, total_frames=10)
+    session.set_frame_range(1, 10)
+    for frame in (1, 2, 3, 7):
+        session.add_frame(frame, 2.0)
+    progress = session.progress()
+    assert progress['n'] == 4
+    assert progress['ranges'] == [(1, 3), (7, 7)]
+    assert progress['expect'] == (1, 10, 1)
+    assert progress['busy'] == 8.0
+
+
+def message(sender, seq, n, ranges, expect, done=False, t=1000.0, job="shot:/out/karma"):
+    return {'v': aggregator.PROTOCOL_VERSION, 'job': job, 'id': sender, 'host': sender, 'seq': seq,
+            't': t, 'done': done, 'n': n, 'total': expect[1] - expect[0] + 1, 'busy': n * 10.0,
+            'start': 900.0, 'ranges': ranges, 'step': 1, 'expect': (expect[0], expect[1], 1)}
+
+
+def test_aggregator_merges_hosts_and_reports_once():
+    clock = FakeClock()
+    reports = []
+    agg = aggregator.Aggregator(reports.append, settle_time=5, stale_timeout=60, clock=clock)
+
+    assert agg.handle(message("a", 1, 5, [(1, 5)], (1, 10)))
+    assert agg.handle(message("b", 1, 2, [(11, 12)], (11, 20)))
+    status = agg.status("shot:/out/karma")
+    assert (status['done'], status['total'], status['hosts']) == (7, 20, 2)
+    assert status['rate'] > 0 and status['eta'] > 0
+
+    # Устаревший пакет (пришел не по порядку) не откатывает прогресс
+    assert not agg.handle(message("a", 1, 1, [(1, 1)], (1, 10)))
+
+    agg.handle(message("a", 2, 10, [(1, 10)], (1, 10), done=True))
+    agg.handle(message("b", 2, 9, [(11, 17), (19, 20)], (11, 20), done=True))
+    assert agg.check() == []  # ждем settle_time
+    clock.now += 6
+    assert agg.check() == ["shot:/out/karma"]
+    assert agg.check() == []
+
+    assert len(reports) == 1
+    assert "Хостов: 2" in reports[0]
+    assert "Кадров: 19/20" in reports[0]
+    assert "Не отрендерены (1): 18" in reports[0]
+
+
+def test_aggregator_waits_for_stale_hosts():
+    clock = FakeClock()
+    reports = []
+    agg = aggregator.Aggregator(reports.append, settle_time=5, stale_timeout=60, clock=clock)
+    agg.handle(message("a", 1, 10, [(1, 10)], (1, 10), done=True))
+    agg.handle(message("b", 1, 3, [(11, 13)], (11, 20)))
+    clock.now += 10
+    assert agg.check() == []
+    clock.now += 60
+    assert agg.check() == ["shot:/out/karma"]
+    assert "Нет связи: b" in reports[0]
+
+
+def test_rerun_blade_is_not_counted_twice():
+    clock = FakeClock()
+    reports = []
+    agg = aggregator.Aggregator(reports.append, settle_time=5, stale_timeout=60, clock=clock)
+    agg.handle(message("a", 1, 10, [(1, 10)], (1, 10), done=True))
+    agg.handle(message("b", 1, 3, [(11, 13)], (11, 20)))
+    # Блейд b упал, менеджер фермы перезапустил тот же кусок новой сессией
+    agg.handle(message("b-rerun", 1, 10, [(11, 20)], (11, 20), done=True))
+    status = agg.status("shot:/out/karma")
+    assert (status['done'], status['total'], status['hosts']) == (20, 20, 3)
+
+    clock.now += 70
+    assert agg.check() == ["shot:/out/karma"]
+    assert "Кадров: 20/20" in reports[0]
+
+
+@pytest.mark.parametrize("scheme", ["udp", "http"])
+def test_simulated_farm(scheme):
+    reports = []
+    agg = aggregator.Aggregator(reports.append, settle_time=0.2)
+    try:
+        if scheme == "udp":
+            host, port = agg.serve_udp("127.0.0.1", 0)
+        else:
+            host, port = agg.serve_http("127.0.0.1", 0)[:2]
+        url = f"{scheme}://{host}:{port}"
+
+        sessions = []
+        reporters = []
+        for index in range(3):
+            session = RenderSession(start_time=time.time(), total_frames=4, hostname=f"blade{index}")
+            first = index * 4 + 1
+            session.set_frame_range(first, first + 3)
+            reporter = aggregator.ProgressReporter(url, "shot", f"blade{index}", f"blade{index}",
+                                                   session.progress, job_total=12, interval=0.1)
+            sessions.append((session, first))
+            reporters.append(reporter)
+
+        for offset in range(4):
+            for (session, first), reporter in zip(sessions, reporters):
+                session.add_frame(first + offset, 0.5)
+                reporter.update()
+        assert wait_for(lambda: "shot" in agg.jobs and agg.status("shot")['done'] == 12)
+        assert agg.check() == []
+
+        for reporter in reporters:
+            reporter.finish()
+            reporter.close()
+        assert wait_for(lambda: all(s.done for s in agg.jobs["shot"].senders.values()))
+        assert wait_for(lambda: agg.check() == ["shot"] or reports)
+
+        if scheme == "http":
+            with urllib.request.urlopen(f"http://{host}:{port}/jobs", timeout=2) as response:
+                jobs = json.loads(response.read())
+            assert jobs[0]['done'] == 12
+    finally:
+        agg.close()
+
+    assert len(reports) == 1
+    assert "Хостов: 3" in reports[0]
+    assert "Кадры: 1-12" in reports[0]
+    assert "Не отрендерены" not in reports[0]
+
+
+def test_finish_does_not_block_on_slow_aggregator():
+    import socket
+    # Сервер принимает соединение, но не отвечает - HTTP ждет таймаута
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    try:
+        host, port = server.getsockname()
+        session = RenderSession(total_frames=1)
+        reporter = aggregator.ProgressReporter(f"http://{host}:{port}", "shot", "blade", "blade",
+                                               session.progress, timeout=0.5)
+        started = time.time()
+        reporter.finish()
+        reporter.close()
+        assert time.time() - started < 0.2
+        assert reporter.wait(timeout=5.0)
+    finally:
+        server.close()
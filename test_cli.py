@@ -0,0 +1,62 @@
+import os
+import tempfile
+import threading
+import time
+
+import render_estimator
+
+
+def test_module_imports_without_houdini():
+    assert render_estimator.hou is None or hasattr(render_estimator.hou, 'pwd')
+
+
+def test_compile_patterns_requires_frame_token():
+    assert render_estimator.compile_patterns(["/out/shot.####.exr"])[0].expand(7) == "/out/shot.0007.exr"
+    try:
+        render_estimator.compile_patterns(["/out/shot.exr"])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("pattern without a frame token must be rejected")
+
+
+def test_watch_command_follows_frames(capsys):
+    with tempfile.TemporaryDirectory() as tmp:
+        pattern = os.path.join(tmp, "shot.$F4.exr")
+
+        def render():
+            time.sleep(0.3)
+            for frame in range(1001, 1005):
+                with open(os.path.join(tmp, f"shot.{frame:04d}.exr"), "wb") as f:
+                    f.write(b"exr")
+                time.sleep(0.05)
+
+        threading.Thread(target=render).start()
+        code = render_estimator.main(["watch", "--pattern", pattern, "--range", "1001", "1004",
+                                      "--name", "cli_test", "--no-notify", "--no-history"])
+        assert code == 0
+        out = capsys.readouterr().out
+        assert "Кадры: 1001-1004" in out
+        assert "Не отрендерены" not in out
+
+
+def test_watch_command_reads_render_log(monkeypatch):
+    monkeypatch.setattr(render_estimator.log_progress.LogProgress, "DEFAULT_INTERVAL", 0.1)
+    with tempfile.TemporaryDirectory() as tmp:
+        pattern = os.path.join(tmp, "shot.####.exr")
+        log_path = os.path.join(tmp, "render.log")
+
+        def render():
+            for frame in (1, 2):
+                for percent in (25, 50, 100):
+                    with open(log_path, "a") as f:
+                        f.write(f"ALF_PROGRESS {percent}%\n")
+                    time.sleep(0.2)
+                with open(os.path.join(tmp, f"shot.{frame:04d}.exr"), "wb") as f:
+                    f.write(b"exr")
+
+        threading.Thread(target=render).start()
+        code = render_estimator.main(["watch", "--pattern", pattern, "--range", "1", "2", "--log", log_path,
+                                      "--name", "cli_log_test", "--no-notify", "--no-history"])
+        assert code == 0
+        assert render_estimator.active_sessions["cli_log_test"].frame_watch.log_progress.fraction is not None
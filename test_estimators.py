@@ -0,0 +1,60 @@
+from estimators import (CumulativeMeanEstimator, EwmaEstimator,
+                        SlidingWindowEstimator, TwoPhaseEstimator,
+                        create_estimator)
+
+
+def test_cumulative_mean():
+    est = CumulativeMeanEstimator()
+    assert est.remaining(10) == 0.0
+    for d in (10, 20, 30):
+        est.add(d)
+    assert est.per_frame() == 20
+    assert est.remaining(5) == 100
+    assert est.remaining(-1) == 0.0
+
+
+def test_sliding_window_follows_recent_frames():
+    est = SlidingWindowEstimator(window=3)
+    for d in (1, 1, 1, 1, 10, 10, 10):
+        est.add(d)
+    assert est.per_frame() == 10
+    assert len(est.samples) == 3
+
+
+def test_ewma():
+    est = EwmaEstimator(alpha=0.5)
+    est.add(10)
+    est.add(20)
+    assert est.per_frame() == 15
+
+
+def test_two_phase_separates_startup():
+    est = TwoPhaseEstimator(CumulativeMeanEstimator())
+    # Первый кадр: 60 сек загрузки сцены + 10 сек кадр
+    est.add(70)
+    assert est.per_frame() == 70
+    assert est.startup() == 0.0
+    est.add(10)
+    assert est.per_frame() == 10
+    assert est.startup() == 60
+    assert est.remaining(8) == 80
+
+
+def test_create_estimator():
+    assert isinstance(create_estimator(), TwoPhaseEstimator)
+    assert isinstance(create_estimator(startup=False), CumulativeMeanEstimator)
+    assert isinstance(create_estimator("unknown").inner, CumulativeMeanEstimator)
+    assert create_estimator(" Window ", window=5).inner.window == 5
+    assert create_estimator("ewma", alpha=0.1, startup=False).alpha == 0.1
+
+
+def test_prior_from_history():
+    est = create_estimator()
+    est.set_prior(20, startup=30)
+    # До первого кадра прогноз целиком из истории
+    assert est.remaining(10) == 230
+    est.add(50)
+    assert est.per_frame() == 20
+    assert est.startup() == 30
+    est.add(10)
+    assert est.per_frame() == 10
@@ -0,0 +1,48 @@
+import random
+
+from frame_stats import FrameTimeStore, P2Quantile
+
+
+def test_running_stats():
+    store = FrameTimeStore()
+    for frame, duration in ((1, 4.0), (2, 2.0), (3, 6.0)):
+        store.add(frame, duration)
+    assert len(store) == 3
+    assert store.total == 12.0
+    assert store.mean == 4.0
+    assert store.variance == 4.0
+    assert (store.min_frame, store.min_time) == (2, 2.0)
+    assert (store.max_frame, store.max_time) == (3, 6.0)
+    assert list(store.frames) == [1, 2, 3]
+    assert list(store) == [(1, 4.0), (2, 2.0), (3, 6.0)]
+    assert store.percentile(0.5) == 4.0
+
+
+def test_p2_quantile_accuracy():
+    rng = random.Random(1)
+    samples = [rng.uniform(0, 100) for _ in range(20000)]
+    for p in (0.5, 0.9, 0.99):
+        sketch = P2Quantile(p)
+        for x in samples:
+            sketch.add(x)
+        exact = sorted(samples)[int(p * (len(samples) - 1))]
+        assert abs(sketch.value() - exact) < 1.5, p
+
+
+def test_empty_store():
+    store = FrameTimeStore()
+    assert not store
+    assert store.mean == 0.0
+    assert store.percentile(0.9) is None
+
+
+def test_copy_is_independent():
+    store = FrameTimeStore()
+    for frame in range(1, 8):
+        store.add(frame, float(frame))
+    snapshot = store.copy()
+    store.add(8, 100.0)
+    assert len(snapshot) == 7
+    assert list(snapshot.frames) == list(range(1, 8))
+    assert snapshot.max_time == 7.0
+    assert snapshot.percentile(0.99) != store.percentile(0.99)
@@ -0,0 +1,69 @@
+import random
+
+from session import RenderSession
+from utils import FrameTracker, format_frame_list
+
+
+def test_step_aware_ranges_and_missing():
+    tracker = FrameTracker(1, 100, 2)
+    for frame in range(1, 101, 2):
+        if frame not in (11, 13, 51):
+            tracker.add(frame)
+    assert tracker.format() == "1-9x2, 15-49x2, 53-99x2"
+    assert tracker.missing_count == 3
+    assert tracker.format_missing() == "11-13x2,51"
+    assert 15 in tracker and 13 not in tracker
+
+
+def test_out_of_order_merges_intervals():
+    tracker = FrameTracker(1001, 1010)
+    for frame in (1005, 1003, 1004, 1010, 1001, 1002):
+        assert tracker.add(frame)
+    assert not tracker.add(1003)
+    assert tracker.ranges() == [(1001, 1005), (1010, 1010)]
+    assert tracker.missing_ranges() == [(1006, 1009)]
+    assert len(tracker) == 6
+
+
+def test_large_shuffled_sequence():
+    frames = list(range(1, 50001))
+    random.Random(3).shuffle(frames)
+    tracker = FrameTracker(1, 50000)
+    for frame in frames[:-2]:
+        tracker.add(frame)
+    missing = sorted(frames[-2:])
+    assert tracker.missing_count == 2
+    assert [a for a, _b in tracker.missing_ranges()] == missing
+    for frame in missing:
+        tracker.add(frame)
+    assert tracker.format() == "1-50000"
+    assert tracker.format_missing() == ""
+
+
+def test_off_grid_frames_and_truncation():
+    tracker = FrameTracker(1, 10, 2)
+    tracker.add(4)
+    assert tracker.format() == "4"
+    assert tracker.missing_count == 5
+
+    tracker = FrameTracker(1, 1000)
+    for frame in range(1, 1001, 2):
+        tracker.add(frame)
+    assert tracker.format(max_ranges=3) == "1, 3, 5, ... (+497)"
+
+
+def test_format_frame_list():
+    assert format_frame_list([1, 2, 3, 5, 6, 7, 10]) == "1-3, 5-7, 10"
+    assert format_frame_list([10, 9, 1, 2, 2]) == "1-2, 9-10"
+    assert format_frame_list([]) == ""
+
+
+def test_session_tracks_expected_range():
+    session = RenderSession(start_time=0.0)
+    session.add_frame(3, 1.0)
+    session.set_frame_range(1, 5, 1)
+    session.add_frame(1, 1.0)
+    stats = session.snapshot()
+    session.add_frame(2, 1.0)
+    assert stats['frames'].format_missing() == "2,4-5"
+    assert session.snapshot()['frames'].format_missing() == "4-5"
@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+import render_estimator
+from history import HistoryWriter, load_predictions, predict_total
+
+KEY = ("shot.hip", "/out/karma1", "Karma XPU", "1920x1080")
+
+
+def test_history_roundtrip():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "sub", "history.sqlite")
+        assert load_predictions(db_path, KEY) == ({}, 0.0)
+
+        writer = HistoryWriter(db_path, KEY, run_id="run1")
+        for frame, duration in ((1, 10.0), (2, 20.0), (3, 30.0)):
+            writer.record(frame, duration, size=100)
+        writer.record_run(startup=5.0, frames=3)
+        assert writer.flush(timeout=5.0)
+
+        writer = HistoryWriter(db_path, KEY, run_id="run2")
+        writer.record(1, 20.0)
+        assert writer.flush(timeout=5.0)
+
+        predictions, startup = load_predictions(db_path, KEY, frames=[1, 2])
+        assert predictions == {1: 15.0, 2: 20.0}
+        assert startup == 5.0
+
+        other, _ = load_predictions(db_path, KEY[:3] + ("640x480",))
+        assert other == {}
+
+
+def test_predict_total():
+    assert predict_total({}, [1, 2]) == (0.0, 0)
+    # Кадр 3 без истории получает среднее по известным
+    assert predict_total({1: 10.0, 2: 20.0}, [1, 2, 3]) == (45.0, 2)
+
+
+def test_history_excludes_startup_from_first_frame():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "history.sqlite")
+        key = ("shot.hip", "/out/karma1", "Karma CPU", "1920x1080")
+        session = render_estimator.render_session.RenderSession(
+            estimator=render_estimator.estimators.create_estimator("mean"), total_frames=3, rop_name=key[1])
+        session.notify = False
+        session.history_writer = render_estimator.history.HistoryWriter(db_path, key, run_id="run1")
+        # Первый кадр: 30 сек старта + 10 сек кадра
+        for frame, duration in ((1, 40.0), (2, 10.0), (3, 10.0)):
+            session.add_frame(frame, duration)
+            render_estimator.record_history(session, frame, duration)
+        render_estimator.finalize_and_send_report(session)
+
+        predictions, startup = render_estimator.history.load_predictions(db_path, key)
+        assert predictions == {1: 10.0, 2: 10.0, 3: 10.0}
+        assert startup == 30.0
@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+import pytest
+
+import estimators
+from log_progress import LogProgress, LogTail, ProgressParser, compile_patterns
+from session import RenderSession
+
+
+def append(path, text):
+    with open(path, "ab") as f:
+        f.write(text.encode("utf-8"))
+
+
+def test_parser_patterns():
+    parser = ProgressParser()
+    assert parser.parse("ALF_PROGRESS 45%") == 0.45
+    assert parser.parse("[12:00:01] Render progress: 12.5%") == 0.125
+    assert parser.parse("Block 16/64 rendered by GPU 0") == 0.25
+    assert parser.parse("Loading scene") is None
+    assert ProgressParser(r"done (\d+) of (\d+)").parse("done 3 of 4") == 0.75
+    with pytest.raises(ValueError):
+        compile_patterns(r"no groups")
+
+
+def test_tail_reads_only_new_lines():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "render.log")
+        append(path, "ALF_PROGRESS 99%\n")  # прошлый рендер
+        tail = LogTail(path)
+        assert tail.read_lines() == []
+
+        append(path, "ALF_PROGRESS 10%\nALF_PRO")
+        assert tail.read_lines() == ["ALF_PROGRESS 10%"]
+        append(path, "GRESS 20%\r")
+        assert tail.read_lines() == ["ALF_PROGRESS 20%"]
+        offset = tail.offset
+        assert tail.read_lines() == []
+        assert tail.offset == offset
+
+        # Лог начат заново (усечен)
+        with open(path, "wb") as f:
+            f.write(b"ALF_PROGRESS 5%\n")
+        assert tail.read_lines() == ["ALF_PROGRESS 5%"]
+        tail.close()
+
+
+def test_tail_skips_to_recent_data():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "render.log")
+        tail = LogTail(path, max_read=64)
+        append(path, "".join(f"ALF_PROGRESS {i}%\n" for i in range(100)))
+        lines = tail.read_lines()
+        assert lines[-1] == "ALF_PROGRESS 99%"
+        assert len(lines) < 10
+        tail.close()
+
+
+def test_log_progress_polls_latest_fraction():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "render.log")
+        source = LogProgress(path, interval=2.0)
+        assert source.poll(100.0) is None  # лога еще нет
+        append(path, "ALF_PROGRESS 30%\nALF_PROGRESS 40%\nSaving image\n")
+        assert source.poll(101.0) == 0.4
+        assert source.next_poll() == 103.0
+        assert source.poll(103.0) is None
+        source.close()
+
+
+def test_frame_progress_refines_eta():
+    session = RenderSession(estimator=estimators.create_estimator("mean", startup=False),
+                            start_time=0.0, total_frames=3)
+    session.add_frame(1, 100.0)
+    assert session.estimate()[1] == 200.0
+
+    # Кадр 2: 10% -> 50% за 20 сек, значит до конца кадра еще 25 сек
+    session.set_frame_progress(0.1, 110.0)
+    session.set_frame_progress(0.5, 130.0)
+    assert session.estimate()[1] == pytest.approx(100.0 + 25.0)
+    assert session.snapshot()['frame_progress'] == 0.5
+
+    # Кадр готов - прогресс сбрасывается
+    session.add_frame(2, 50.0)
+    assert session.snapshot()['frame_progress'] is None
+    assert session.estimate()[1] == 75.0
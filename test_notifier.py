@@ -0,0 +1,250 @@
+import gc
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import notifier
+from notifier import LiveMessage, TelegramNotifier
+
+
+class FakeTelegram(HTTPServer):
+    """
+    Локальная замена api.telegram.org: отвечает заданными статусами по очереди.
+    """
+
+    def __init__(self, statuses=(), delay=0.0):
+        super().__init__(("127.0.0.1", 0), FakeTelegramHandler)
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, json.loads(body)))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        ok = status == 200
+        data = {"ok": ok, "result": {"message_id": len(self.server.requests)}} if ok else {"ok": False, "description": "fail"}
+        raw = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+
+def _notifier(server, outbox, **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return TelegramNotifier("TOKEN", api_url=server.url, outbox_dir=outbox, **kwargs)
+
+
+def test_send_is_non_blocking_and_delivers():
+    server = FakeTelegram(delay=0.5)
+    try:
+        with tempfile.TemporaryDirectory() as outbox:
+            sender = _notifier(server, outbox)
+            results = []
+            t0 = time.perf_counter()
+            sender.send("sendMessage", {"chat_id": 1, "text": "hi"}, callback=results.append)
+            assert time.perf_counter() - t0 < 0.1
+            assert sender.wait(timeout=5.0)
+            assert server.requests == [("/botTOKEN/sendMessage", {"chat_id": 1, "text": "hi"})]
+            assert results == [{"message_id": 1}]
+    finally:
+        server.stop()
+
+
+def test_retry_on_server_error():
+    server = FakeTelegram(statuses=[500, 502])
+    try:
+        with tempfile.TemporaryDirectory() as outbox:
+            sender = _notifier(server, outbox, retries=3)
+            sender.send("sendMessage", {"text": "retry"})
+            assert sender.wait(timeout=5.0)
+            assert len(server.requests) == 3
+            assert os.listdir(outbox) == []
+    finally:
+        server.stop()
+
+
+def test_failed_message_goes_to_outbox_and_is_resent():
+    server = FakeTelegram(statuses=[500, 500])
+    try:
+        with tempfile.TemporaryDirectory() as outbox:
+            sender = _notifier(server, outbox, retries=2)
+            sender.send("sendMessage", {"text": "later"})
+            assert sender.wait(timeout=5.0)
+            assert len(os.listdir(outbox)) == 1
+
+            sender.flush_outbox()
+            assert sender.wait(timeout=5.0)
+            assert server.requests[-1][1] == {"text": "later"}
+            assert os.listdir(outbox) == []
+    finally:
+        server.stop()
+
+
+def test_shared_outbox_is_resent_once():
+    server = FakeTelegram(delay=0.05)
+    try:
+        with tempfile.TemporaryDirectory() as outbox:
+            offline = TelegramNotifier("TOKEN", api_url="http://127.0.0.1:9", outbox_dir=outbox,
+                                       connect_timeout=0.2, retries=1)
+            for i in range(5):
+                offline.send("sendMessage", {"text": f"spooled {i}"})
+            assert offline.wait(timeout=5.0)
+            assert len(os.listdir(outbox)) == 5
+
+            # Два процесса (рендера) стартуют одновременно и досылают общий outbox
+            senders = [_notifier(server, outbox) for _ in range(2)]
+            for sender in senders:
+                sender.flush_outbox()
+            for sender in senders:
+                assert sender.wait(timeout=5.0)
+            assert sorted(body["text"] for _path, body in server.requests) == [f"spooled {i}" for i in range(5)]
+            assert os.listdir(outbox) == []
+    finally:
+        server.stop()
+
+
+def test_failed_resend_returns_claim_to_outbox():
+    server = FakeTelegram(statuses=[500, 500, 500])
+    try:
+        with tempfile.TemporaryDirectory() as outbox:
+            sender = _notifier(server, outbox, retries=1)
+            sender.send("sendMessage", {"text": "later"})
+            assert sender.wait(timeout=5.0)
+            name = os.listdir(outbox)[0]
+
+            sender.flush_outbox()
+            assert sender.wait(timeout=5.0)
+            assert os.listdir(outbox) == [name]
+
+            # Захват упавшего процесса возвращается в outbox по таймауту
+            claimed = os.path.join(outbox, name + ".123-abcd" + notifier.CLAIM_SUFFIX)
+            os.rename(os.path.join(outbox, name), claimed)
+            os.utime(claimed, (0, 0))
+            sender.flush_outbox()
+            assert sender.wait(timeout=5.0)
+            assert server.requests[-1][1] == {"text": "later"}
+            assert os.listdir(outbox) == [name]
+    finally:
+        server.stop()
+
+
+def test_notifier_is_not_pinned_by_atexit():
+    with tempfile.TemporaryDirectory() as outbox:
+        ref = weakref.ref(TelegramNotifier("TOKEN", outbox_dir=outbox))
+        gc.collect()
+        assert ref() is None
+
+
+def test_read_timeout_spools_message():
+    server = FakeTelegram(delay=1.0)
+    try:
+        with tempfile.TemporaryDirectory() as outbox:
+            sender = _notifier(server, outbox, read_timeout=0.2, retries=1)
+            sender.send("sendMessage", {"text": "slow"})
+            assert sender.wait(timeout=5.0)
+            assert len(os.listdir(outbox)) == 1
+    finally:
+        server.stop()
+
+
+def test_unreachable_host_shutdown():
+    with tempfile.TemporaryDirectory() as outbox:
+        sender = TelegramNotifier("TOKEN", api_url="http://127.0.0.1:9", outbox_dir=outbox,
+                                  connect_timeout=0.2, retries=10, backoff=5.0)
+        sender.send("sendMessage", {"text": "offline"})
+        sender.shutdown(timeout=0.3)
+        assert len(os.listdir(outbox)) == 1
+
+
+def test_live_message_coalesces_edits():
+    server = FakeTelegram()
+    try:
+        with tempfile.TemporaryDirectory() as outbox:
+            sender = _notifier(server, outbox)
+            progress = {"done": 0}
+            live = LiveMessage(sender, 1, lambda: f"done {progress['done']}", interval=1.0)
+            live.start()
+            assert sender.wait(timeout=5.0)
+            assert live.message_id == 1
+
+            for _ in range(50):
+                progress["done"] += 1
+                live.update()
+            time.sleep(1.5)
+            assert sender.wait(timeout=5.0)
+            edits = [body for path, body in server.requests if path.endswith("/editMessageText")]
+            assert edits == [{"chat_id": 1, "message_id": 1, "text": "done 50"}]
+
+            live.finish("finished")
+            live.update()
+            assert sender.wait(timeout=5.0)
+            assert server.requests[-1][1]["text"] == "finished"
+    finally:
+        server.stop()
+
+
+def test_live_message_final_report_survives_failed_edit():
+    # Сообщение создано, а финальная правка отклонена (удалено или слишком старое)
+    server = FakeTelegram(statuses=[200, 400])
+    try:
+        with tempfile.TemporaryDirectory() as outbox:
+            sender = _notifier(server, outbox)
+            live = LiveMessage(sender, 1, lambda: "progress", interval=1.0)
+            live.start()
+            assert sender.wait(timeout=5.0)
+
+            assert live.finish("report") == 1
+            assert sender.wait(timeout=5.0)
+            assert [path.rsplit("/", 1)[-1] for path, _ in server.requests] == \
+                ["sendMessage", "editMessageText", "sendMessage"]
+            assert server.requests[-1][1] == {"chat_id": 1, "text": "report"}
+    finally:
+        server.stop()
+
+
+def test_live_message_failed_start_is_not_spooled():
+    server = FakeTelegram(statuses=[500, 500])
+    try:
+        with tempfile.TemporaryDirectory() as outbox:
+            sender = _notifier(server, outbox, retries=2)
+            live = LiveMessage(sender, 1, lambda: "⏳ Рендер идет: 0/10", interval=1.0)
+            live.start()
+            assert sender.wait(timeout=5.0)
+            assert live.message_id is None
+            assert os.listdir(outbox) == []
+            # Без исходного сообщения вызывающий шлет отчет целиком
+            assert live.finish("report") is None
+    finally:
+        server.stop()
+
+
+def test_reload_keeps_notifier():
+    # Отдельный процесс: reload пересоздает классы модулей, которые импортируют другие тесты
+    import subprocess
+    import sys
+    code = ("import importlib, render_estimator as r; marker = object(); r.telegram_notifier = marker; "
+            "importlib.reload(r); assert r.telegram_notifier is marker")
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
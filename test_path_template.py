@@ -0,0 +1,74 @@
+import render_estimator
+from path_template import PathTemplate
+
+
+def _expand_vars(text):
+    return text.replace("$HIPNAME", "shot").replace("$HIP", "/proj").replace("$OS", "karma1")
+
+
+def test_frame_tokens():
+    cases = {
+        "/r/a.$F4.exr": "/r/a.0007.exr",
+        "/r/a.$F.exr": "/r/a.7.exr",
+        "/r/a.${F3}.exr": "/r/a.007.exr",
+        "/r/a.${F}.exr": "/r/a.7.exr",
+        "/r/a.\\$F4.exr": "/r/a.0007.exr",
+        "/r/a.%04d.exr": "/r/a.0007.exr",
+        "/r/a.%d.exr": "/r/a.7.exr",
+        "/r/a.####.exr": "/r/a.0007.exr",
+        "/r/a.$FF.exr": "/r/a.7.exr",
+        "/r/still.exr": "/r/still.exr",
+    }
+    for raw, expected in cases.items():
+        template = PathTemplate.compile(raw)
+        assert template is not None, raw
+        assert template.expand(7) == expected, raw
+
+
+def test_float_frame_and_variables():
+    template = PathTemplate.compile("$HIP/render/$HIPNAME.$OS.$F4.$FF.exr", expand=_expand_vars)
+    assert template.has_frame
+    assert template.expand(12.5) == "/proj/render/shot.karma1.0012.12.5.exr"
+
+
+def test_fps_is_not_a_frame_token():
+    template = PathTemplate.compile("/r/$FPS/a.$F2.exr", expand=lambda s: s.replace("$FPS", "24"))
+    assert template.expand(3) == "/r/24/a.03.exr"
+
+
+def test_dynamic_paths_are_not_compiled():
+    assert PathTemplate.compile("/r/`chs('ver')`/a.$F4.exr", expand=_expand_vars) is None
+    assert PathTemplate.compile("/r/a.$T.exr", expand=_expand_vars) is None
+    # Переменные без функции разворачивания - не статичны
+    assert PathTemplate.compile("$HIP/a.$F4.exr") is None
+    assert PathTemplate.compile("") is None
+
+
+def test_frame_matcher():
+    directory, parse = PathTemplate.compile("/r/shot/a.$F4.exr").frame_matcher()
+    assert directory == "/r/shot"
+    assert parse("a.0012.exr") == 12
+    assert parse("a.12.exr") is None
+    assert parse("b.0012.exr") is None
+    # Номер кадра в пути папки - листинг одной папки не поможет
+    assert PathTemplate.compile("/r/$F4/a.exr").frame_matcher() is None
+
+
+def test_template_from_examples():
+    # productName из USD уже развернут - шаблон восстанавливается по нескольким кадрам
+    template = PathTemplate.from_examples([(1001, "/r/v002/beauty.1001.exr"), (1050, "/r/v002/beauty.1050.exr")])
+    assert template.expand(999) == "/r/v002/beauty.0999.exr"
+    template = PathTemplate.from_examples([(1, "/r/a.1.exr"), (12, "/r/a.12.exr")])
+    assert template.expand(7) == "/r/a.7.exr"
+    # Номер кадра совпал с другим числом в пути - выбирается то, что воспроизводит все примеры
+    template = PathTemplate.from_examples([(2, "/r/v2/a.0002.exr"), (3, "/r/v2/a.0003.exr")])
+    assert template.expand(4) == "/r/v2/a.0004.exr"
+    assert PathTemplate.from_examples([(1, "/r/a.exr"), (2, "/r/a.exr")]).expand(5) == "/r/a.exr"
+    assert PathTemplate.from_examples([(1, "/r/a.exr"), (2, "/r/b.exr")]) is None
+
+
+def test_frame_independent_products():
+    template = render_estimator.path_template.PathTemplate.compile
+    assert render_estimator.is_per_frame_product((template("/out/beauty.$F4.exr"), None), 1, 10)
+    assert not render_estimator.is_per_frame_product((template("/out/shot.abc"), None), 1, 10)
+    assert not render_estimator.is_per_frame_product((None, lambda frame: "/out/cache.usd"), 1, 10)
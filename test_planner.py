@@ -0,0 +1,90 @@
+import itertools
+import json
+import os
+import tempfile
+
+import planner
+import render_estimator
+from history import HistoryWriter, load_predictions
+
+
+def brute_force_makespan(costs, hosts, startup):
+    best = None
+    for cuts in itertools.combinations(range(1, len(costs)), hosts - 1):
+        bounds = (0,) + cuts + (len(costs),)
+        span = max(startup + sum(costs[a:b]) for a, b in zip(bounds, bounds[1:]))
+        best = span if best is None else min(best, span)
+    return best
+
+
+def test_frame_costs_interpolates_missing_frames():
+    assert planner.frame_costs([1, 2, 3, 4, 5], {2: 10.0, 4: 20.0}) == [10.0, 10.0, 15.0, 20.0, 20.0]
+    assert planner.frame_costs([1, 2], {}) == [1.0, 1.0]
+
+
+def test_contiguous_plan_is_optimal():
+    costs = [5.0, 1.0, 1.0, 8.0, 2.0, 2.0, 2.0, 9.0, 1.0, 3.0]
+    frames = list(range(1001, 1011))
+    for hosts in (2, 3, 4):
+        chunks = planner.plan_contiguous(frames, costs, hosts, startup=2.0)
+        assert [f for chunk in chunks for f in chunk.frames] == frames
+        assert abs(planner.makespan(chunks) - brute_force_makespan(costs, hosts, 2.0)) < 1e-4
+
+
+def test_heavy_tail_gets_more_hosts():
+    # Вторая половина шота в 10 раз дороже - ровное деление проигрывает
+    frames = list(range(1, 101))
+    costs = [1.0] * 50 + [10.0] * 50
+    chunks = planner.plan_contiguous(frames, costs, 4, startup=5.0)
+    even = planner.plan_even(frames, costs, 4, startup=5.0)
+    assert planner.makespan(chunks) < planner.makespan(even) * 0.7
+    assert len(chunks[0].frames) > len(chunks[-1].frames)
+    assert chunks[0].format() == "1-" + str(chunks[0].frames[-1])
+
+
+def test_interleaved_plan_covers_all_frames():
+    frames = list(range(1, 200, 2))
+    costs = [float(i % 7 + 1) for i in range(len(frames))]
+    chunks = planner.plan_interleaved(frames, costs, 6, startup=1.0)
+    assert sorted(f for chunk in chunks for f in chunk.frames) == frames
+    assert planner.makespan(chunks) <= 1.0 + sum(costs) / 6 + max(costs)
+
+
+def test_history_key_wildcards():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "history.sqlite")
+        writer = HistoryWriter(db_path, ("shot.hip", "/out/karma1", "Karma XPU", "1920x1080"), run_id="run1")
+        writer.record(1, 10.0)
+        assert writer.flush(timeout=5.0)
+        assert load_predictions(db_path, (None, "/out/karma1", None, None))[0] == {1: 10.0}
+        assert load_predictions(db_path, (None, "/out/other", None, None))[0] == {}
+
+
+def test_plan_command(capsys):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "history.sqlite")
+        writer = HistoryWriter(db_path, ("shot.hip", "shot010", "Karma CPU", "1920x1080"), run_id="run1")
+        for frame in range(1001, 1101):
+            writer.record(frame, 10.0 if frame < 1051 else 100.0)
+        writer.record_run(startup=30.0, frames=100)
+        assert writer.flush(timeout=5.0)
+
+        code = render_estimator.main(["plan", "--range", "1001", "1100", "--hosts", "4", "--name", "shot010",
+                                      "--db", db_path, "--json"])
+        assert code == 0
+        result = json.loads(capsys.readouterr().out)
+        assert result['startup'] == 30.0
+        assert result['known_frames'] == 100
+        assert len(result['hosts']) == 4
+        assert sum(host['count'] for host in result['hosts']) == 100
+        assert result['makespan'] < result['even_makespan']
+
+
+def test_plan_json_without_history_is_clean(capsys):
+    with tempfile.TemporaryDirectory() as tmp:
+        code = render_estimator.main(["plan", "--range", "1", "10", "--hosts", "2", "--name", "missing",
+                                      "--db", os.path.join(tmp, "history.sqlite"), "--json"])
+        assert code == 0
+        captured = capsys.readouterr()
+        assert json.loads(captured.out)['known_frames'] == 0
+        assert "No history" in captured.err
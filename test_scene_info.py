@@ -0,0 +1,174 @@
+import threading
+import types
+
+import render_estimator
+import scene_info
+from scene_info import find_render_products, find_usd_lights, product_name
+
+
+class FakePrim:
+    def __init__(self, name, type_name="Xform", children=()):
+        self.name = name
+        self.type_name = type_name
+        self.children = list(children)
+        self.visited = False
+
+    def GetName(self):
+        return self.name
+
+    def GetTypeName(self):
+        self.visited = True
+        return self.type_name
+
+    def GetChildren(self):
+        return self.children
+
+    def IsValid(self):
+        return True
+
+
+class FakeAttribute:
+    def __init__(self, value):
+        self.value = value
+
+    def Get(self, frame):
+        return self.value(frame) if callable(self.value) else self.value
+
+
+class FakeProduct(FakePrim):
+    def __init__(self, name, product):
+        super().__init__(name, "RenderProduct")
+        self.path = f"/Render/Products/{name}"
+        self.product = product
+
+    def GetAttribute(self, name):
+        return FakeAttribute(self.product) if name == "productName" else None
+
+
+class FakeStage:
+    def __init__(self, *children):
+        self.root = FakePrim("", children=children)
+
+    def GetPseudoRoot(self):
+        return self.root
+
+    def GetPrimAtPath(self, path):
+        stack = [(child, "/" + child.name) for child in self.root.children]
+        while stack:
+            prim, prim_path = stack.pop()
+            if getattr(prim, "path", prim_path) == path or prim_path == path:
+                return prim
+            stack.extend((child, f"{prim_path}/{child.name}") for child in prim.children)
+        return None
+
+
+def _stage():
+    hidden = FakePrim("inside_mesh", "SphereLight")
+    return FakeStage(
+        FakePrim("lights", children=[FakePrim("key", "RectLight"), FakePrim("sky", "KarmaSkyDomeLight")]),
+        FakePrim("geo", children=[FakePrim("body", "Mesh", [hidden])]),
+        FakePrim("scatter", "PointInstancer", [FakePrim("proto", children=[FakePrim("p", "Mesh")])]),
+    ), hidden
+
+
+def test_find_lights_prunes_geometry():
+    if scene_info.Usd is not None:
+        return
+    stage, hidden = _stage()
+    lights, truncated = find_usd_lights(stage)
+    assert lights == ["key", "sky"]
+    assert not truncated
+    assert not hidden.visited
+
+
+def test_find_lights_budget():
+    if scene_info.Usd is not None:
+        return
+    stage = FakeStage(*[FakePrim(f"l{i}", "DistantLight") for i in range(10)])
+    lights, truncated = find_usd_lights(stage, max_prims=4)
+    assert lights == ["l0", "l1", "l2", "l3"]
+    assert truncated
+
+
+def test_find_render_products():
+    if scene_info.Usd is not None:
+        return
+    beauty = FakeProduct("beauty", lambda f: f"/r/beauty.{int(f):04d}.exr")
+    deep = FakeProduct("deep", "/r/deep.exr")
+    stage = FakeStage(FakePrim("Render", "Scope", [FakePrim("Products", "Scope", [beauty, deep])]),
+                      FakePrim("geo", children=[FakePrim("body", "Mesh")]))
+    assert find_render_products(stage) == [beauty, deep]
+    assert product_name(beauty, 12) == "/r/beauty.0012.exr"
+    assert product_name(deep, 12) == "/r/deep.exr"
+    assert find_render_products(FakeStage(FakePrim("geo"))) == []
+
+
+class FakeRop:
+    def __init__(self, **parms):
+        self.parms = parms
+
+    def parm(self, name):
+        if name not in self.parms:
+            return None
+        value = self.parms[name]
+        return type("Parm", (), {"eval": lambda self: value})()
+
+
+def test_invalid_light_limit_falls_back_to_default():
+    if scene_info.Usd is not None:
+        return
+    collector = render_estimator.SceneInfoCollector(FakeRop(lights_max_prims="lots"))
+    collector._stage_resolved = True
+    collector._stage, _hidden = _stage()
+    assert collector.lights() == (["key", "sky"], False)
+
+
+def test_pending_scene_info_runs_on_main_thread_only():
+    session = render_estimator.render_session.RenderSession()
+    calls = []
+    session.scene_info_ready.clear()
+    session.scene_info_pending = lambda: (calls.append(threading.current_thread()), session.scene_info_ready.set())
+
+    # Фоновый поток (watcher) не трогает hou - только ждет
+    worker = threading.Thread(target=render_estimator.wait_scene_info, args=(session, 0.1))
+    worker.start()
+    worker.join()
+    assert calls == []
+
+    render_estimator.wait_scene_info(session, timeout=1.0)
+    assert calls == [threading.main_thread()]
+    assert session.scene_info_pending is None
+
+
+def test_scene_info_is_read_in_pre_render_for_foreground_renders(monkeypatch):
+    callbacks = []
+    ui = types.SimpleNamespace(addEventLoopCallback=callbacks.append, removeEventLoopCallback=callbacks.remove)
+    monkeypatch.setattr(render_estimator, "hou", types.SimpleNamespace(
+        ui=ui, isUIAvailable=lambda: True, hipFile=types.SimpleNamespace(path=lambda: "/nonexistent/shot.hip")))
+    collected = []
+
+    class Collector:
+        timings = {}
+
+        def collect(self):
+            collected.append(threading.current_thread())
+            return {'camera_name': "/cameras/main"}
+
+    monkeypatch.setattr(render_estimator, "get_scene_collector", lambda session, rop: Collector())
+
+    # Foreground рендер: цикл событий стоит до конца рендера - сцена читается сразу
+    rop = FakeRop(history_enabled="0")
+    session = render_estimator.render_session.RenderSession()
+    render_estimator.start_scene_info(session, rop, [1, 2])
+    assert collected == [threading.main_thread()] and callbacks == []
+    assert session.scene_info_ready.wait(5.0)
+    assert session.get('camera_name') == "/cameras/main"
+
+    # SCENE_INFO_DEFERRED=1 - сбор на цикле событий
+    rop.parms["scene_info_deferred"] = "1"
+    session = render_estimator.render_session.RenderSession()
+    render_estimator.start_scene_info(session, rop, [1, 2])
+    assert len(collected) == 1 and len(callbacks) == 1
+    callbacks[0]()
+    assert len(collected) == 2 and callbacks == []
+    assert session.scene_info_ready.wait(5.0)
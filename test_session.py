@@ -0,0 +1,76 @@
+import threading
+
+import estimators
+from session import RenderSession
+
+
+def test_add_frame_and_estimate():
+    session = RenderSession(estimator=estimators.create_estimator("mean", startup=False), start_time=0.0, total_frames=4)
+    assert session.add_frame(1, 10.0, size_bytes=5, finished_at=10.0) == (10.0, 30.0, 1)
+    per_frame, remaining, done = session.add_frame(2, 20.0, finished_at=30.0)
+    assert (per_frame, remaining, done) == (15.0, 30.0, 2)
+    assert session.get('last_frame_time') == 30.0
+    assert session.get('total_size_bytes') == 5
+
+
+def test_history_predictions_weight_remaining_frames():
+    session = RenderSession(estimator=estimators.create_estimator("mean", startup=False), start_time=0.0, total_frames=4)
+    # В прошлый раз конец шота был в 10 раз тяжелее начала
+    session.set_predictions({1: 10.0, 2: 10.0, 3: 100.0, 4: 100.0}, [1, 2, 3, 4])
+    session.add_frame(1, 10.0)
+    assert session.add_frame(2, 10.0)[1] == 200.0
+    assert session.add_frame(3, 100.0)[1] == 100.0
+
+    session.set_predictions(None, [1, 2, 3, 4])
+    assert session.estimate()[1] == 40.0
+
+
+def test_snapshot_is_immutable_copy():
+    session = RenderSession(start_time=0.0, lights=['key'])
+    session.add_frame(1, 2.0)
+    stats = session.snapshot()
+    session.add_frame(2, 3.0)
+    session.update(lights=['key', 'rim'])
+    assert stats['frames_rendered'] == 1
+    assert len(stats['frame_times']) == 1
+    assert stats['lights'] == ('key',)
+    try:
+        stats['frames_rendered'] = 5
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("snapshot must be read-only")
+
+
+def test_concurrent_updates_are_not_lost():
+    session = RenderSession(start_time=0.0)
+
+    def worker(offset):
+        for i in range(500):
+            session.add_frame(offset + i, 1.0)
+            session.add_size(1)
+
+    threads = [threading.Thread(target=worker, args=(n * 1000,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = session.snapshot()
+    assert stats['frames_rendered'] == 2000
+    assert stats['total_size_bytes'] == 2000
+    assert len(stats['frame_times']) == 2000
+
+
+def test_claim_report_once():
+    session = RenderSession()
+    assert session.claim_report()
+    assert not session.claim_report()
+
+
+def test_close_stops_session_threads():
+    session = RenderSession()
+    thread = session.start_thread(lambda: session.stop_event.wait(30), "Test_Thread")
+    assert thread.session is session
+    assert session.close(timeout=2.0)
+    assert session.closed
+    assert not thread.is_alive()
@@ -0,0 +1,100 @@
+import threading
+
+import render_estimator
+from status_bar import StatusPump
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _pump(interval=0.5):
+    shown = []
+    callbacks = []
+    clock = FakeClock()
+    pump = StatusPump(shown.append, callbacks.append, callbacks.remove, interval=interval, clock=clock)
+    return pump, shown, callbacks, clock
+
+
+def test_burst_is_coalesced_and_throttled():
+    pump, shown, callbacks, clock = _pump()
+    pump.begin("/out/karma1")
+    assert callbacks == [pump.drain]
+
+    for frame in range(1, 11):
+        pump.post(f"frame {frame}")
+    assert pump.drain()
+    assert shown == ["frame 10"]
+
+    # Новое сообщение раньше интервала ждет следующего прохода цикла событий
+    pump.post("frame 11")
+    clock.now = 0.2
+    assert not pump.drain()
+    clock.now = 0.6
+    assert pump.drain()
+    assert shown == ["frame 10", "frame 11"]
+
+    # Нечего показывать - UI не трогается
+    clock.now = 5.0
+    assert not pump.drain()
+    assert len(shown) == 2
+
+
+def test_uninstalls_after_last_render_ends():
+    pump, shown, callbacks, clock = _pump()
+    pump.begin("/out/a")
+    pump.begin("/out/b")
+    assert len(callbacks) == 1
+
+    pump.end("/out/a", "a done")
+    assert pump.drain()
+    assert callbacks and pump.installed
+
+    clock.now = 1.0
+    pump.end("/out/b", "b done")
+    assert pump.drain()
+    assert shown == ["a done", "b done"]
+    # Следующий проход - все показано, рендеров нет
+    pump.drain()
+    assert callbacks == [] and not pump.installed
+
+    pump.begin("/out/a")
+    assert callbacks == [pump.drain]
+
+
+def test_post_from_threads():
+    pump, shown, _callbacks, clock = _pump(interval=0.0)
+    pump.begin(None)
+
+    def worker(n):
+        for i in range(200):
+            pump.post(f"{n}:{i}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert pump.pending
+    assert pump.drain()
+    assert shown[-1].endswith(":199")
+    assert not pump.pending
+
+
+def test_post_status_shows_immediately_on_main_thread(monkeypatch):
+    shown = []
+    pump = render_estimator.status_bar.StatusPump(shown.append)
+    monkeypatch.setattr(render_estimator, "status_pump", pump)
+
+    render_estimator.post_status("frame 1")
+    assert shown == ["frame 1"]
+
+    # Из фонового потока - только в ящик, покажет цикл событий
+    thread = threading.Thread(target=render_estimator.post_status, args=("frame 2",))
+    thread.start()
+    thread.join()
+    assert shown == ["frame 1"] and pump.pending
@@ -0,0 +1,596 @@
+import os
+import tempfile
+import threading
+import time
+import types
+
+import pytest
+
+import render_estimator
+from watcher import (DirectoryIndex, FrameRange, HorizonIndex, PollSchedule, SizeWorker, WatcherHub,
+                     create_inotify_backend, file_time, frame_durations)
+
+
+def _touch(path, data=b"x"):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_directory_index_scan():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {f: os.path.join(tmp, f"shot.{f:04d}.exr") for f in range(1, 6)}
+        index = DirectoryIndex(paths)
+        assert len(index) == 5
+        assert len(index.by_dir) == 1
+
+        _touch(paths[2], b"abc")
+        _touch(paths[4])
+        _touch(os.path.join(tmp, "other.exr"))
+
+        found = index.pop_completed(min_mtime=time.time() - 60)
+        assert [x[0] for x in found] == [2, 4]
+        assert found[0][3] == 3
+        assert 2 not in index and 4 not in index
+        assert len(index) == 3
+
+        # Старые файлы (до старта рендера) не считаются готовыми
+        assert index.pop_completed(min_mtime=time.time() + 60) == []
+
+
+def test_directory_index_missing_dir():
+    index = DirectoryIndex({1: "/nonexistent/dir/a.0001.exr"})
+    assert index.scan() == []
+    assert len(index) == 1
+
+
+def test_directory_index_waits_for_all_products():
+    with tempfile.TemporaryDirectory() as tmp:
+        deep_dir = os.path.join(tmp, "deep")
+        os.makedirs(deep_dir)
+        products = {
+            f: (os.path.join(tmp, f"beauty.{f:04d}.exr"), os.path.join(tmp, f"crypto.{f:04d}.exr"),
+                os.path.join(deep_dir, f"deep.{f:04d}.exr"))
+            for f in (1, 2)
+        }
+        index = DirectoryIndex(products)
+        assert len(index.by_dir) == 2
+        assert index.lookup(deep_dir, "deep.0002.exr") == 2
+
+        # Только beauty - кадр еще не готов
+        _touch(products[1][0], b"abcd")
+        assert index.pop_completed() == []
+
+        _touch(products[1][1], b"ab")
+        _touch(products[1][2], b"abcdef")
+        _touch(products[2][0])
+        found = index.pop_completed()
+        assert [(x[0], x[1], x[3]) for x in found] == [(1, products[1][0], 12)]
+        assert 1 not in index and 2 in index
+        assert index.lookup(deep_dir, "deep.0001.exr") is None
+
+
+def test_scan_reports_file_times():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {f: os.path.join(tmp, f"shot.{f:04d}.exr") for f in (1, 2)}
+        now = time.time()
+        _touch(paths[1])
+        _touch(paths[2])
+        os.utime(paths[1], (now - 20, now - 20))
+        os.utime(paths[2], (now - 5, now - 5))
+        found = DirectoryIndex(paths).scan()
+        assert [x[2] for x in found] == [file_time(os.stat(paths[1])), file_time(os.stat(paths[2]))]
+        assert all(x[2] >= os.stat(paths[x[0]]).st_mtime for x in found)
+
+
+def test_frame_durations_from_file_times():
+    found = [(3, "c", 130.0, 0), (1, "a", 104.0, 0), (2, "b", 111.5, 0)]
+    durations, last = frame_durations(found, prev_time=100.0, now=131.0)
+    assert durations == {1: 4.0, 2: 7.5, 3: 18.5}
+    assert last == 130.0
+
+    # Кадр старше уже учтенных (найден sweep'ом) - не отрицательное время
+    durations, last = frame_durations([(9, "x", 90.0, 0)], prev_time=130.0, now=131.0)
+    assert durations == {9: 0.0} and last == 130.0
+
+    # Время файлов "из будущего" - часы сервера сдвинуты
+    assert frame_durations([(1, "a", 200.0, 0)], prev_time=100.0, now=131.0) is None
+
+
+def test_frame_range():
+    frames = FrameRange(1, 10, 3)
+    assert list(frames) == [1, 4, 7, 10]
+    assert frames.index_of(7) == 2
+    assert frames.index_of(8) is None
+    assert len(FrameRange(5, 1)) == 0
+
+
+def test_horizon_index_window_and_sweep():
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "shot.{:04d}.exr")
+        generated = []
+
+        def path_for_frame(frame):
+            generated.append(frame)
+            return template.format(frame)
+
+        index = HorizonIndex(FrameRange(1, 100000), path_for_frame, horizon=4)
+        # Пути генерируются только для окна
+        assert len(generated) == 4
+        assert len(index) == 100000
+
+        _touch(template.format(1))
+        _touch(template.format(2))
+        # Кадр далеко за окном - окно его не видит
+        _touch(template.format(500))
+        found = index.pop_completed(min_mtime=time.time() - 60)
+        assert [x[0] for x in found] == [1, 2]
+        assert sorted(index.window.paths) == [3, 4, 5, 6]
+
+        index.SWEEP_CHUNK = 1000
+        found = index.sweep(min_mtime=time.time() - 60)
+        assert [x[0] for x in found] == [500]
+        assert len(index) == 100000 - 3
+
+        # Найденный sweep'ом кадр не попадает в окно повторно
+        for f in range(3, 500):
+            _touch(template.format(f))
+        while index.pop_completed(min_mtime=time.time() - 60):
+            pass
+        assert 500 not in index.window.paths
+        assert sorted(index.window.paths) == [501, 502, 503, 504]
+        assert len(index) == 100000 - 500
+
+
+def test_horizon_index_frame_matcher():
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "shot.{:04d}.exr")
+
+        def parse(name):
+            if name.startswith("shot.") and name.endswith(".exr"):
+                return int(name[5:-4])
+            return None
+
+        index = HorizonIndex(FrameRange(1, 1000), template.format, horizon=2, frame_matcher=(tmp, parse))
+        assert index.directories() == {tmp}
+
+        # Событие о кадре вне окна - кадр добавляется в окно
+        _touch(template.format(700))
+        assert index.lookup(tmp, "shot.0700.exr") == 700
+        assert index.lookup(tmp, "other.exr") is None
+        assert [x[0] for x in index.pop_completed()] == [700]
+
+        _touch(template.format(800))
+        assert [x[0] for x in index.sweep()] == [800]
+        assert index.sweep() == []
+        assert len(index) == 998
+
+
+def test_poll_schedule():
+    schedule = PollSchedule(min_interval=0.1, max_interval=15.0, stall_timeout=600, stall_factor=5, stall_min=60)
+    # Статистики нет - опрос раз в секунду, таймаут на загрузку сцены
+    assert schedule.interval(0.0, None) == 1.0
+    assert schedule.stall_timeout(None) == 600
+
+    # Долгие кадры (40 мин): в середине кадра - потолок, ближе к концу - чаще
+    assert schedule.interval(60.0, 2400.0) == 15.0
+    assert schedule.interval(2399.0, 2400.0) == 0.5
+    assert schedule.interval(2399.9, 2400.0) == 0.1
+    # Кадр запаздывает - интервал растет
+    assert schedule.interval(70.0, 60.0) == 4.0
+    assert schedule.interval(160.0, 60.0) == 13.0
+    assert schedule.interval(2800.0, 2400.0) == 15.0
+
+    # Быстрые превью-кадры - почти без задержки
+    assert schedule.interval(0.1, 0.3) == 0.1
+
+    assert schedule.stall_timeout(2400.0) == 12000.0
+    assert schedule.stall_timeout(0.3) == 60
+
+
+def test_size_worker_retries_until_file_is_written():
+    with tempfile.TemporaryDirectory() as tmp:
+        ready = os.path.join(tmp, "a.0001.exr")
+        late = os.path.join(tmp, "a.0002.exr")
+        _touch(ready, b"12345")
+
+        worker = SizeWorker()
+        worker.RETRY_DELAYS = (0.05, 0.05, 0.05, 5.0)
+        sizes = {}
+        worker.submit(ready, lambda size: sizes.__setitem__("ready", size))
+        worker.submit(late, lambda size: sizes.__setitem__("late", size))
+
+        time.sleep(0.08)
+        # Файл дописан после первой попытки - подхватывается повтором
+        _touch(late, b"123")
+        assert worker.wait(timeout=2.0)
+        assert sizes == {"ready": 5, "late": 3}
+        assert worker.total_bytes == 8
+        assert len(worker) == 0
+
+
+def test_size_worker_sums_products():
+    with tempfile.TemporaryDirectory() as tmp:
+        beauty = os.path.join(tmp, "beauty.0001.exr")
+        deep = os.path.join(tmp, "deep.0001.exr")
+        _touch(beauty, b"1234")
+        worker = SizeWorker()
+        worker.RETRY_DELAYS = (0.05, 5.0)
+        sizes = []
+        worker.submit((beauty, deep), sizes.append)
+        time.sleep(0.02)
+        # deep еще не записан - ждем повтор
+        _touch(deep, b"12")
+        assert worker.wait(timeout=2.0)
+        assert sizes == [6]
+
+
+def test_size_worker_wait_skips_remaining_retries():
+    worker = SizeWorker()
+    worker.RETRY_DELAYS = (30.0,)
+    sizes = []
+    worker.submit("/nonexistent/dir/a.0001.exr", sizes.append)
+    time.sleep(0.05)
+    # Рендер закончен - повтор выполняется сразу и становится последним
+    assert worker.wait(timeout=2.0)
+    assert sizes == [0]
+
+
+def test_inotify_backend_events():
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = os.path.join(tmp, "render")
+        backend = create_inotify_backend([out_dir])
+        if backend is None:
+            pytest.skip("inotify is not available")
+        try:
+            # Папки еще нет - watch добавится при следующем wait()
+            assert backend.missing == {out_dir}
+            os.makedirs(out_dir)
+            assert backend.wait(timeout=0.01) == []
+            assert backend.watches and backend.needs_rescan
+
+            _touch(os.path.join(out_dir, "shot.0001.exr"))
+            os.rename(_tmp_file(tmp), os.path.join(out_dir, "shot.0002.exr"))
+            events = backend.wait(timeout=1.0)
+            assert (out_dir, "shot.0001.exr") in events
+            assert (out_dir, "shot.0002.exr") in events
+
+            # interrupt() из другого потока прерывает ожидание
+            threading.Timer(0.05, backend.interrupt).start()
+            t0 = time.monotonic()
+            assert backend.wait(timeout=5.0) == []
+            assert time.monotonic() - t0 < 1.0
+        finally:
+            backend.close()
+
+
+def test_inotify_backend_high_fd():
+    # select() не принимает fd >= 1024 - бэкенд должен работать и с такими
+    resource = pytest.importorskip("resource")
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and hard < 1100:
+        pytest.skip("file descriptor limit is too low")
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, 1100), hard))
+    fillers = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            while not fillers or fillers[-1] < 1024:
+                fillers.append(os.open(os.devnull, os.O_RDONLY))
+            backend = create_inotify_backend([tmp])
+            if backend is None:
+                pytest.skip("inotify is not available")
+            try:
+                assert backend.fd >= 1024
+                assert backend.wait(timeout=0.01) == []
+                _touch(os.path.join(tmp, "shot.0001.exr"))
+                assert (tmp, "shot.0001.exr") in backend.wait(timeout=1.0)
+            finally:
+                backend.close()
+    finally:
+        for fd in fillers:
+            os.close(fd)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+class _IndexJob:
+    """
+    Минимальное задание WatcherHub поверх DirectoryIndex.
+    """
+
+    def __init__(self, paths, interval=0.05):
+        self.index = DirectoryIndex(paths)
+        self.interval = interval
+        self.found = []
+        self.events = []
+        self.finished = threading.Event()
+        self.last_poll = 0.0
+
+    @property
+    def active(self):
+        return bool(self.index)
+
+    def directories(self):
+        return self.index.by_dir.keys()
+
+    def on_event(self, directory, name, timestamp):
+        frame = self.index.lookup(directory, name)
+        if frame is not None:
+            self.events.append(frame)
+        return frame is not None
+
+    def next_poll(self, now, evented=False):
+        return self.last_poll + (60.0 if evented else self.interval)
+
+    def poll(self, now, changed=False):
+        self.last_poll = now
+        self.found += [frame for frame, _path, _time, _size in self.index.pop_completed()]
+
+    def finish(self):
+        self.finished.set()
+
+
+@pytest.mark.parametrize("backend_factory", [None, create_inotify_backend])
+def test_watcher_hub_serves_several_renders(backend_factory):
+    with tempfile.TemporaryDirectory() as tmp:
+        dirs = [os.path.join(tmp, name) for name in ("rop_a", "rop_b")]
+        for d in dirs:
+            os.makedirs(d)
+        jobs = [_IndexJob({f: os.path.join(d, f"shot.{f:04d}.exr") for f in (1, 2)}) for d in dirs]
+
+        hub = WatcherHub(backend_factory=backend_factory)
+        for job in jobs:
+            hub.add(job)
+        assert len(hub) == 2
+        # Один поток на все рендеры
+        assert [t.name for t in threading.enumerate()].count(WatcherHub.THREAD_NAME) == 1
+        thread = hub._thread
+
+        # Дать хабу подписаться на папки до записи файлов
+        time.sleep(0.2)
+        for d in dirs:
+            for f in (1, 2):
+                _touch(os.path.join(d, f"shot.{f:04d}.exr"))
+
+        for job in jobs:
+            assert job.finished.wait(5.0)
+            assert sorted(job.found) == [1, 2]
+
+        # Заданий не осталось - поток хаба завершается
+        thread.join(5.0)
+        assert not thread.is_alive()
+        assert len(hub) == 0
+
+
+class _SlowCloseBackend:
+    """
+    Бэкенд-заглушка: первый бэкенд закрывается, только когда создан второй
+    (старый поток хаба завершается, пока add() уже запустил новый).
+    """
+    created = []
+    closed = []
+
+    def __init__(self, directories):
+        self.index = len(self.created) + 1
+        self.needs_rescan = False
+        self.created.append(self)
+
+    def watch(self, directories):
+        pass
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, 0.01))
+        return []
+
+    def interrupt(self):
+        pass
+
+    def close(self):
+        deadline = time.time() + 5.0
+        while self.index == 1 and len(self.created) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.closed.append(self.index)
+
+
+def test_watcher_hub_old_thread_keeps_new_backend():
+    with tempfile.TemporaryDirectory() as tmp:
+        _touch(os.path.join(tmp, "a.0001.exr"))
+        first = _IndexJob({1: os.path.join(tmp, "a.0001.exr")})
+        second = _IndexJob({1: os.path.join(tmp, "b.0001.exr")})
+        hub = WatcherHub(backend_factory=_SlowCloseBackend)
+
+        hub.add(first)
+        old_thread = hub._thread
+        assert first.finished.wait(5.0)
+        # Старый поток завершается (закрывает свой бэкенд) - новый add() запускает новый поток
+        while hub._thread is not None:
+            time.sleep(0.01)
+        hub.add(second)
+        old_thread.join(5.0)
+
+        assert _SlowCloseBackend.closed == [1]
+        assert hub._backend is _SlowCloseBackend.created[1]
+        assert second.active
+        hub.remove(second)
+        hub._thread.join(5.0)
+        assert _SlowCloseBackend.closed == [1, 2]
+
+
+def test_watcher_hub_remove_skips_finish():
+    job = _IndexJob({1: "/nonexistent/dir/a.0001.exr"})
+    hub = WatcherHub(backend_factory=None)
+    hub.add(job)
+    hub.remove(job)
+    assert len(hub) == 0
+    assert not job.finished.wait(0.2)
+
+
+def test_watcher_hub_wake_polls_immediately():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shot.0001.exr")
+        # Следующий опрос только через минуту
+        job = _IndexJob({1: path}, interval=60.0)
+        hub = WatcherHub(backend_factory=None)
+        hub.add(job)
+        time.sleep(0.1)
+        _touch(path)
+        assert not job.finished.wait(0.3)
+
+        # Как drain(): задание хочет опрос сейчас и будит хаб
+        job.interval = 0.0
+        hub.wake()
+        assert job.finished.wait(0.5)
+        assert job.found == [1]
+
+
+def _tmp_file(tmp):
+    path = os.path.join(tmp, "partial.tmp")
+    _touch(path)
+    return path
+
+
+def test_horizon_sweep_requires_all_products():
+    with tempfile.TemporaryDirectory() as tmp:
+        beauty = os.path.join(tmp, "beauty.{:04d}.exr")
+        deep = os.path.join(tmp, "deep.{:04d}.exr")
+
+        def parse(name):
+            if name.startswith("beauty.") and name.endswith(".exr"):
+                return int(name[7:-4])
+            return None
+
+        index = HorizonIndex(FrameRange(1, 100), lambda f: (beauty.format(f), deep.format(f)), horizon=2,
+                             frame_matcher=(tmp, parse))
+        _touch(beauty.format(50))
+        # Только основной файл - кадр еще не готов
+        assert index.sweep() == []
+        _touch(deep.format(50))
+        assert [x[0] for x in index.sweep()] == [50]
+
+
+def _frame_watch(tmp, frames, hub):
+    session = render_estimator.render_session.RenderSession(total_frames=len(frames), rop_name="watch_test")
+    session.notify = False
+    session.key = "watch_test"
+    pending = render_estimator.watcher.DirectoryIndex({f: os.path.join(tmp, f"shot.{f:04d}.exr") for f in frames})
+    watch = session.frame_watch = render_estimator.FrameWatch(session, pending, hub=hub)
+    hub.add(watch)
+    return session, watch
+
+
+def test_frame_watch_drain_and_cancel(capsys):
+    hub = render_estimator.watcher.WatcherHub(backend_factory=None)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Все кадры на диске - drain() находит их, watcher отправляет отчет сам
+        session, watch = _frame_watch(tmp, [1, 2], hub)
+        for frame in (1, 2):
+            with open(os.path.join(tmp, f"shot.{frame:04d}.exr"), "wb") as f:
+                f.write(b"exr")
+        assert watch.drain(timeout=5.0)
+        assert session.stop_event.wait(5.0)
+        assert "Рендер завершен" in capsys.readouterr().out
+
+        # Кадров нет - drain() по таймауту возвращает watcher к обычному расписанию
+        session, watch = _frame_watch(tmp, [3], hub)
+        assert not watch.drain(timeout=0.2)
+        assert not watch.draining and not watch.drain_sweep
+        assert watch.next_poll(time.time(), evented=True) > time.time() + 1.0
+
+        # cancel() снимает задание и отправляет отчет с заголовком остановки
+        assert watch.cancel(title="⛔ Рендер остановлен", timeout=5.0)
+        assert session.stop_event.wait(5.0)
+        assert "Рендер остановлен" in capsys.readouterr().out
+        assert watch.pending == 1
+
+
+class _FakeParm:
+    def __init__(self, value):
+        self.value = value
+
+    def eval(self):
+        return self.value
+
+
+class _FakeRop:
+    def __init__(self, path, **parms):
+        self._path = path
+        self.parms = parms
+
+    def path(self):
+        return self._path
+
+    def parm(self, name):
+        return _FakeParm(self.parms[name]) if name in self.parms else None
+
+
+def test_finish_render_hands_over_to_watcher_by_default(monkeypatch, capsys):
+    hub = render_estimator.watcher.WatcherHub(backend_factory=None)
+    with tempfile.TemporaryDirectory() as tmp:
+        session, watch = _frame_watch(tmp, [1], hub)
+        rop = _FakeRop(session.key)
+        fake_hou = types.SimpleNamespace(pwd=lambda: rop, isUIAvailable=lambda: False,
+                                         hipFile=types.SimpleNamespace(path=lambda: os.path.join(tmp, "shot.hip")))
+        monkeypatch.setattr(render_estimator, "hou", fake_hou)
+        monkeypatch.setitem(render_estimator.active_sessions, session.key, session)
+
+        # Кадр может дописываться после Post-Render (сетевое хранилище) - watcher ждет дальше
+        t0 = time.monotonic()
+        render_estimator.finish_render()
+        assert time.monotonic() - t0 < 0.5
+        assert watch.active and "Handing over" in capsys.readouterr().out
+
+        # WATCHER_DETACHED=0 - строгая остановка с отчетом о ненайденных кадрах
+        rop.parms["watcher_detached"] = "0"
+        render_estimator.finish_render()
+        assert watch.stopped_event.is_set()
+        assert session.stop_event.wait(5.0)
+        assert "Рендер остановлен" in capsys.readouterr().out
+
+
+def test_log_deadline_skips_file_scan(monkeypatch):
+    hub = render_estimator.watcher.WatcherHub(backend_factory=None)
+    with tempfile.TemporaryDirectory() as tmp:
+        session = render_estimator.render_session.RenderSession(total_frames=1, rop_name="log_scan_test")
+        pending = render_estimator.watcher.DirectoryIndex({1: os.path.join(tmp, "shot.0001.exr")})
+        watch = render_estimator.FrameWatch(session, pending, hub=hub)
+        watch.log_progress = render_estimator.log_progress.LogProgress(os.path.join(tmp, "render.log"), interval=0.5)
+        scans = []
+        monkeypatch.setattr(watch, "check_for_updates", lambda sweep=False: scans.append(sweep))
+
+        # inotify: файлы проверяются по событиям, срок лога наступает раньше
+        now = time.time() + 1.0
+        assert watch.next_poll(now, evented=True) <= now < watch.next_file_check(now, evented=True)
+        watch.poll(now)
+        assert scans == [] and watch.log_progress.last_poll_time == now
+
+        # События папки - скан нужен, даже если подошел и срок лога
+        now += 1.0
+        watch.poll(now, changed=True)
+        assert scans == [False]
+        watch.log_progress.close()
+
+
+def test_slow_report_does_not_stall_other_watchers(monkeypatch):
+    release = threading.Event()
+    original = render_estimator.finalize_and_send_report
+
+    def slow_finalize(session, title="✅ Рендер завершен!"):
+        if session.get('rop_name') == "slow":
+            release.wait(5.0)
+        original(session, title)
+
+    monkeypatch.setattr(render_estimator, "finalize_and_send_report", slow_finalize)
+    hub = render_estimator.watcher.WatcherHub(backend_factory=None)
+    with tempfile.TemporaryDirectory() as tmp:
+        slow, slow_watch = _frame_watch(tmp, [1], hub)
+        slow.update(rop_name="slow")
+        with open(os.path.join(tmp, "shot.0001.exr"), "wb") as f:
+            f.write(b"exr")
+        assert slow_watch.drain(timeout=5.0)
+
+        # Отчет первого рендера еще висит, а watcher второго находит кадры
+        other, other_watch = _frame_watch(tmp, [2], hub)
+        with open(os.path.join(tmp, "shot.0002.exr"), "wb") as f:
+            f.write(b"exr")
+        assert other_watch.drain(timeout=2.0)
+        assert not slow.closed
+        release.set()
+        assert slow.stop_event.wait(5.0)
@@ -1,3 +1,4 @@
+from bisect import bisect_right
 
 def format_duration(seconds):
     """
@@ -16,35 +17,165 @@ def format_frame_list(frames):
     Форматирует список кадров в компактную строку с диапазонами.
     Пример: [1, 2, 3, 5, 10] -> "1-3, 5, 10"
     """
-    if not frames:
-        return ""
-        
-    # Сортируем и убираем дубликаты
-    sorted_frames = sorted(list(set(map(int, frames))))
-    
-    if not sorted_frames:
-        return ""
-
-    ranges = []
-    start = sorted_frames[0]
-    end = sorted_frames[0]
-    
-    for i in range(1, len(sorted_frames)):
-        frame = sorted_frames[i]
-        if frame == end + 1:
-            end = frame
+    tracker = FrameTracker()
+    for frame in frames:
+        tracker.add(int(frame))
+    return tracker.format(max_ranges=None)
+
+def format_frame_number(frame):
+    frame = float(frame)
+    return str(int(frame)) if frame.is_integer() else f"{frame:g}"
+
+class FrameTracker:
+    """
+    Готовые кадры ожидаемого диапазона (start, end, step) в виде набора интервалов.
+    Интервалы хранятся в индексах диапазона (номер шага), поэтому кадры с шагом 2
+    дают один интервал "1-99x2". Добавление кадра - бинарный поиск O(log k) по k интервалам
+    и слияние с соседями; новый интервал посреди списка сдвигает хвост списков (O(k)),
+    но при рендере почти по порядку кадр лишь продлевает последний интервал, а k - единицы.
+    Ни форматирование, ни поиск пропущенных кадров не требуют сортировки всех кадров (50k+ кадров).
+    Без диапазона (start=None) кадры считаются с шагом 1, а пропуски неизвестны.
+    Кадры вне сетки диапазона хранятся отдельно.
+    """
+    # Сколько интервалов показывать в строке (лимит длины сообщения Telegram)
+    DEFAULT_MAX_RANGES = 50
+
+    def __init__(self, start=None, end=None, step=1):
+        self.step = step or 1
+        if start is None:
+            self.start = 0
+            self.size = None
         else:
-            if start == end:
-                ranges.append(str(start))
-            else:
-                ranges.append(f"{start}-{end}")
-            start = frame
-            end = frame
-            
-    # Добавляем последний диапазон
-    if start == end:
-        ranges.append(str(start))
-    else:
-        ranges.append(f"{start}-{end}")
-        
-    return ", ".join(ranges)
+            self.start = start
+            self.size = max(0, int((end - start) / self.step + 1e-9) + 1)
+        # Интервалы [lo, hi] в индексах диапазона, отсортированы и не пересекаются
+        self._lo = []
+        self._hi = []
+        self.count = 0
+        # Кадры вне сетки диапазона
+        self.outside = set()
+
+    def __len__(self):
+        return self.count + len(self.outside)
+
+    def __contains__(self, frame):
+        index = self._index(frame)
+        if index is None:
+            return frame in self.outside
+        i = bisect_right(self._lo, index) - 1
+        return i >= 0 and self._hi[i] >= index
+
+    def _index(self, frame):
+        if self.size is None:
+            index = int(frame)
+            return index if index == frame else None
+        index = int(round((frame - self.start) / self.step))
+        if not 0 <= index < self.size or abs(self.start + index * self.step - frame) > 1e-6:
+            return None
+        return index
+
+    def _frame(self, index):
+        return self.start + index * self.step
+
+    def add(self, frame):
+        """
+        Отмечает кадр готовым. Возвращает False, если он уже был отмечен.
+        """
+        index = self._index(frame)
+        if index is None:
+            if frame in self.outside:
+                return False
+            self.outside.add(frame)
+            return True
+
+        lo, hi = self._lo, self._hi
+        i = bisect_right(lo, index) - 1
+        if i >= 0 and hi[i] >= index:
+            return False
+        join_left = i >= 0 and hi[i] == index - 1
+        join_right = i + 1 < len(lo) and lo[i + 1] == index + 1
+        if join_left and join_right:
+            hi[i] = hi[i + 1]
+            del lo[i + 1], hi[i + 1]
+        elif join_left:
+            hi[i] = index
+        elif join_right:
+            lo[i + 1] = index
+        else:
+            lo.insert(i + 1, index)
+            hi.insert(i + 1, index)
+        self.count += 1
+        return True
+
+    def copy(self):
+        other = FrameTracker.__new__(FrameTracker)
+        other.__dict__.update(self.__dict__)
+        other._lo = list(self._lo)
+        other._hi = list(self._hi)
+        other.outside = set(self.outside)
+        return other
+
+    def ranges(self):
+        """
+        Готовые интервалы [(первый кадр, последний кадр), ...].
+        """
+        return [(self._frame(a), self._frame(b)) for a, b in zip(self._lo, self._hi)]
+
+    def expected_range(self):
+        """
+        (первый кадр, последний кадр, шаг) ожидаемого диапазона или None.
+        """
+        if self.size is None:
+            return None
+        return self.start, self._frame(self.size - 1), self.step
+
+    @property
+    def missing_count(self):
+        return None if self.size is None else self.size - self.count
+
+    def missing_ranges(self):
+        """
+        Пропущенные интервалы ожидаемого диапазона [(первый кадр, последний кадр), ...].
+        Пустой список, если диапазон неизвестен.
+        """
+        if self.size is None:
+            return []
+        gaps = []
+        prev = -1
+        for a, b in zip(self._lo, self._hi):
+            if a > prev + 1:
+                gaps.append((self._frame(prev + 1), self._frame(a - 1)))
+            prev = b
+        if prev < self.size - 1:
+            gaps.append((self._frame(prev + 1), self._frame(self.size - 1)))
+        return gaps
+
+    def format(self, max_ranges=DEFAULT_MAX_RANGES, separator=", "):
+        """
+        Компактная строка готовых кадров с учетом шага: "1-99x2, 150".
+        """
+        parts = [self._format_range(a, b) for a, b in self.ranges()]
+        parts += [format_frame_number(f) for f in sorted(self.outside)]
+        return _join_ranges(parts, max_ranges, separator)
+
+    def format_missing(self, max_ranges=DEFAULT_MAX_RANGES, separator=","):
+        """
+        Пропущенные кадры строкой для перерендера ("5-9,20-30x2" - диапазоны
+        через запятую без пробелов, как в списках кадров Deadline/Tractor).
+        """
+        parts = [self._format_range(a, b) for a, b in self.missing_ranges()]
+        return _join_ranges(parts, max_ranges, separator)
+
+    def _format_range(self, first, last):
+        if first == last:
+            return format_frame_number(first)
+        text = f"{format_frame_number(first)}-{format_frame_number(last)}"
+        if self.step != 1:
+            text += f"x{format_frame_number(self.step)}"
+        return text
+
+def _join_ranges(parts, max_ranges, separator):
+    if max_ranges and len(parts) > max_ranges:
+        hidden = len(parts) - max_ranges
+        return separator.join(parts[:max_ranges]) + f"{separator}... (+{hidden})"
+    return separator.join(parts)
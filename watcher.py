@@ -0,0 +1,841 @@
+"""
+Движок File Watcher без зависимости от hou.
+Отслеживает появление файлов кадров в папках рендера.
+"""
+import ctypes
+import ctypes.util
+import errno
+import heapq
+import itertools
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+
+def file_time(st):
+    """
+    Момент, когда готовый файл появился на диске.
+    Обычно это mtime, но при переносе файла на место (rename из временного файла,
+    копирование с сохранением времени) mtime может быть старше - тогда берется
+    время создания (st_birthtime, где ФС его дает) или ctime.
+    """
+    created = getattr(st, 'st_birthtime', None)
+    if created is None:
+        # POSIX: время смены метаданных (в т.ч. rename), Windows: время создания
+        created = st.st_ctime
+    return max(st.st_mtime, created)
+
+
+def frame_durations(found, prev_time, now, max_skew=2.0):
+    """
+    Длительности кадров по времени файлов из scan(): кадры упорядочиваются
+    по времени появления, и каждый получает интервал от предыдущего готового кадра.
+    Возвращает ({кадр: длительность}, время последнего кадра) или None, если время
+    файлов не согласуется с локальными часами (сетевой диск со сдвинутым временем).
+    """
+    ordered = sorted(found, key=lambda item: item[2])
+    if ordered and ordered[-1][2] > now + max_skew:
+        return None
+    durations = {}
+    for frame, _path, timestamp, _size in ordered:
+        # Кадр, найденный позже уже учтенных (sweep), не может получить отрицательное время
+        durations[frame] = max(0.0, timestamp - prev_time)
+        prev_time = max(prev_time, timestamp)
+    return durations, prev_time
+
+
+class DirectoryIndex:
+    """
+    Индекс ожидаемых файлов, сгруппированный по папкам.
+    За один проход делается ровно один os.scandir на каждую папку,
+    поэтому стоимость проверки зависит от количества папок, а не кадров.
+    У кадра может быть несколько файлов (render products, AOV, deep, cryptomatte) -
+    кадр считается готовым, только когда найдены все его файлы.
+    """
+
+    # Если ожидаемых файлов в папке во много раз меньше, чем файлов в ней,
+    # дешевле сделать stat каждого, чем листать всю папку
+    STAT_RATIO = 8
+
+    def __init__(self, paths_to_watch):
+        # paths_to_watch = {frame_number: file_path или кортеж путей}
+        self.paths = {}
+        # {папка: {имя_файла: номер_кадра}}
+        self.by_dir = {}
+        # {папка: кол-во записей при последнем листинге}
+        self.dir_sizes = {}
+        for frame, path in paths_to_watch.items():
+            self.add(frame, path)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __bool__(self):
+        return bool(self.paths)
+
+    def __contains__(self, frame):
+        return frame in self.paths
+
+    def add(self, frame, path):
+        if not isinstance(path, str):
+            # Одинаковые пути у разных products не должны мешать "все файлы найдены"
+            path = tuple(dict.fromkeys(path))
+            if len(path) == 1:
+                path = path[0]
+        self.paths[frame] = path
+        for file_path in _frame_files(path):
+            directory, name = os.path.split(file_path)
+            self.by_dir.setdefault(directory or '.', {})[os.path.normcase(name)] = frame
+
+    def lookup(self, directory, name):
+        """
+        Возвращает номер ожидаемого кадра для файла или None.
+        """
+        names = self.by_dir.get(directory or '.')
+        if names is None:
+            return None
+        return names.get(os.path.normcase(name))
+
+    def discard(self, frame):
+        path = self.paths.pop(frame, None)
+        if path is None:
+            return
+        for file_path in _frame_files(path):
+            directory, name = os.path.split(file_path)
+            directory = directory or '.'
+            names = self.by_dir.get(directory)
+            if names is not None:
+                names.pop(os.path.normcase(name), None)
+                if not names:
+                    del self.by_dir[directory]
+
+    def scan(self, min_mtime=None):
+        """
+        Сканирует все папки и возвращает список (кадр, путь, время файла, size)
+        для готовых кадров, отсортированный по номеру кадра.
+        Время файла - file_time(). Размер и время берутся из DirEntry.stat(): на Windows
+        это данные самого листинга, на POSIX stat делается только для реально найденных файлов.
+        Если в папке уже во много раз больше файлов, чем ожидается, вместо листинга
+        делается stat ожидаемых файлов (их немного благодаря HorizonIndex).
+        Для кадра из нескольких файлов время - самое позднее, размер - суммарный.
+        """
+        # {кадр: [кол-во найденных файлов, время, размер]}
+        hits = {}
+        for directory, names in self.by_dir.items():
+            if len(names) * self.STAT_RATIO < self.dir_sizes.get(directory, 0):
+                self._stat_names(directory, names, min_mtime, hits)
+            else:
+                self._scan_directory(directory, names, min_mtime, hits)
+
+        found = []
+        for frame, (count, timestamp, size) in hits.items():
+            path = self.paths[frame]
+            if isinstance(path, str):
+                found.append((frame, path, timestamp, size))
+            elif count == len(path):
+                found.append((frame, path[0], timestamp, size))
+        found.sort()
+        return found
+
+    @staticmethod
+    def _hit(hits, frame, st, min_mtime):
+        if min_mtime is not None and st.st_mtime < min_mtime:
+            return
+        hit = hits.get(frame)
+        if hit is None:
+            hits[frame] = [1, file_time(st), st.st_size]
+        else:
+            hit[0] += 1
+            hit[1] = max(hit[1], file_time(st))
+            hit[2] += st.st_size
+
+    def _scan_directory(self, directory, names, min_mtime, hits):
+        entries = 0
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    entries += 1
+                    frame = names.get(os.path.normcase(entry.name))
+                    if frame is None:
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    self._hit(hits, frame, st, min_mtime)
+        except OSError:
+            # Папки еще нет (рендер не начал писать) или она недоступна
+            return
+        self.dir_sizes[directory] = entries
+
+    def _stat_names(self, directory, names, min_mtime, hits):
+        for name, frame in list(names.items()):
+            try:
+                st = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            self._hit(hits, frame, st, min_mtime)
+
+    def pop_completed(self, min_mtime=None):
+        """
+        То же, что scan(), но найденные кадры удаляются из ожидания.
+        """
+        found = self.scan(min_mtime)
+        for frame, _path, _mtime, _size in found:
+            self.discard(frame)
+        return found
+
+
+def _frame_files(path):
+    """
+    Все файлы кадра: путь или кортеж путей (по одному на render product).
+    """
+    return (path,) if isinstance(path, str) else path
+
+
+class FrameRange:
+    """
+    Диапазон кадров (start, end, step) без материализации списка.
+    """
+
+    def __init__(self, start, end, step=1):
+        self.start = start
+        self.end = end
+        self.step = step if step else 1
+        self.length = max(0, int((end - start) / self.step + 1e-6) + 1)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0 or index >= self.length:
+            raise IndexError(index)
+        return int(self.start + index * self.step)
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self[i]
+
+    def index_of(self, frame):
+        """
+        Индекс кадра в диапазоне или None.
+        """
+        i = int(round((frame - self.start) / self.step))
+        if 0 <= i < self.length and self[i] == frame:
+            return i
+        return None
+
+
+class HorizonIndex:
+    """
+    Ожидаемые кадры длинного диапазона. Активно проверяются только horizon
+    ближайших незавершенных кадров (husk пишет кадры почти по порядку),
+    остальные - редким sweep() для кадров, готовых не по порядку.
+    Пути генерируются лениво через path_for_frame(frame), поэтому память
+    и работа за проход не растут с длиной диапазона.
+    frame_matcher = (папка, parse(имя) -> кадр) позволяет находить "отставшие" кадры
+    по листингу папки без генерации путей всего диапазона.
+    """
+    DEFAULT_HORIZON = 64
+    # Сколько путей генерировать за один sweep без frame_matcher
+    SWEEP_CHUNK = 5000
+
+    def __init__(self, frames, path_for_frame, horizon=DEFAULT_HORIZON, frame_matcher=None):
+        self.frames = frames
+        self.path_for_frame = path_for_frame
+        self.horizon = max(1, int(horizon))
+        self.frame_matcher = frame_matcher
+        self.window = DirectoryIndex({})
+        # Следующий индекс диапазона, который еще не попадал в окно
+        self.next_index = 0
+        # Кадры за пределами окна, найденные раньше времени
+        self.done_ahead = set()
+        self.remaining = len(frames)
+        self._sweep_index = 0
+        self._fill()
+
+    def __len__(self):
+        return self.remaining
+
+    def __bool__(self):
+        return self.remaining > 0
+
+    def __contains__(self, frame):
+        return frame in self.window
+
+    @property
+    def by_dir(self):
+        return self.window.by_dir
+
+    def directories(self):
+        dirs = set(self.window.by_dir)
+        if self.frame_matcher is not None:
+            dirs.add(self.frame_matcher[0])
+        return dirs
+
+    def _fill(self):
+        while len(self.window) < self.horizon and self.next_index < len(self.frames):
+            frame = self.frames[self.next_index]
+            self.next_index += 1
+            if frame in self.done_ahead:
+                self.done_ahead.discard(frame)
+                continue
+            self.window.add(frame, self.path_for_frame(frame))
+
+    def lookup(self, directory, name):
+        """
+        Кадр по имени файла: из окна или (если есть frame_matcher) из всего диапазона.
+        Кадр вне окна добавляется в окно, чтобы следующий скан его подобрал.
+        """
+        frame = self.window.lookup(directory, name)
+        if frame is not None or self.frame_matcher is None:
+            return frame
+        if directory != self.frame_matcher[0]:
+            return None
+        frame = self.frame_matcher[1](name)
+        if frame is None or not self._is_pending_ahead(frame):
+            return None
+        self.window.add(frame, self.path_for_frame(frame))
+        return frame
+
+    def _is_pending_ahead(self, frame):
+        index = self.frames.index_of(frame)
+        return (index is not None and index >= self.next_index
+                and frame not in self.done_ahead and frame not in self.window)
+
+    def _complete(self, found):
+        for frame, _path, _mtime, _size in found:
+            self.window.discard(frame)
+            self.remaining -= 1
+            index = self.frames.index_of(frame)
+            if index is not None and index >= self.next_index:
+                self.done_ahead.add(frame)
+        self._fill()
+
+    def pop_completed(self, min_mtime=None):
+        """
+        Проверяет только окно ближайших кадров. Найденные кадры удаляются из ожидания.
+        """
+        found = self.window.scan(min_mtime)
+        self._complete(found)
+        return found
+
+    def sweep(self, min_mtime=None):
+        """
+        Редкая проверка кадров за пределами окна (готовых не по порядку).
+        С frame_matcher - один листинг папки; без него - пути генерируются
+        порциями по SWEEP_CHUNK, за несколько вызовов обходя весь диапазон.
+        """
+        if self.next_index >= len(self.frames):
+            return []
+
+        candidates = {}
+        if self.frame_matcher is not None:
+            directory, parse = self.frame_matcher
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        frame = parse(entry.name)
+                        if frame is not None and self._is_pending_ahead(frame):
+                            # Все файлы кадра (AOV, deep), а не только совпавший по имени
+                            candidates[frame] = self.path_for_frame(frame)
+            except OSError:
+                return []
+        else:
+            if self._sweep_index < self.next_index or self._sweep_index >= len(self.frames):
+                self._sweep_index = self.next_index
+            end = min(len(self.frames), self._sweep_index + self.SWEEP_CHUNK)
+            for i in range(self._sweep_index, end):
+                frame = self.frames[i]
+                if frame not in self.done_ahead:
+                    candidates[frame] = self.path_for_frame(frame)
+            self._sweep_index = end
+
+        if not candidates:
+            return []
+        found = DirectoryIndex(candidates).scan(min_mtime)
+        self._complete(found)
+        return found
+
+
+class PollSchedule:
+    """
+    Адаптивный интервал опроса и таймаут зависания по статистике времени кадров.
+    Пока до ожидаемого окончания кадра далеко, опрос редкий (половина оставшегося
+    времени), ближе к нему - все чаще, до min_interval. Если кадр запаздывает,
+    интервал плавно растет. Таймаут зависания - p99 времени кадра * stall_factor
+    (не меньше stall_min); до первого кадра - stall_timeout (загрузка сцены).
+    """
+    DEFAULT_MIN_INTERVAL = 0.1
+    DEFAULT_MAX_INTERVAL = 15.0
+    DEFAULT_STALL_TIMEOUT = 600.0
+    DEFAULT_STALL_FACTOR = 5.0
+    DEFAULT_STALL_MIN = 60.0
+    # Интервал без статистики (как раньше)
+    INITIAL_INTERVAL = 1.0
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 stall_timeout=DEFAULT_STALL_TIMEOUT, stall_factor=DEFAULT_STALL_FACTOR,
+                 stall_min=DEFAULT_STALL_MIN):
+        self.min_interval = max(0.01, float(min_interval))
+        self.max_interval = max(self.min_interval, float(max_interval))
+        self.initial_stall_timeout = float(stall_timeout)
+        self.stall_factor = float(stall_factor)
+        self.stall_min = float(stall_min)
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def interval(self, elapsed, expected):
+        """
+        Пауза до следующего опроса.
+        elapsed - сколько прошло с последнего готового кадра,
+        expected - типичное время кадра (None, пока статистики нет).
+        """
+        if not expected or expected <= 0:
+            return self._clamp(self.INITIAL_INTERVAL)
+        remaining = expected - elapsed
+        if remaining > 0:
+            return self._clamp(remaining / 2)
+        # Кадр запаздывает - отступаем пропорционально опозданию
+        return self._clamp(expected * 0.05 - remaining * 0.1)
+
+    def stall_timeout(self, p99):
+        """
+        Сколько ждать без новых кадров, прежде чем считать рендер зависшим.
+        """
+        if not p99 or p99 <= 0:
+            return self.initial_stall_timeout
+        return max(self.stall_min, p99 * self.stall_factor)
+
+
+class SizeWorker:
+    """
+    Фоновый подсчет размеров готовых файлов, чтобы stat на медленном
+    файловом сервере не тормозил поток Houdini после каждого кадра.
+    path - путь или кортеж путей кадра (render products), размер суммируется.
+    Пока какой-то файл не найден или пустой (еще не дописан), stat повторяется
+    с растущей паузой RETRY_DELAYS. callback(size) вызывается из фонового
+    потока один раз на кадр (с размером найденных файлов, 0 - если ни одного).
+    """
+    RETRY_DELAYS = (0.25, 0.5, 1.0, 2.0, 4.0)
+    IDLE_TIMEOUT = 30.0
+
+    def __init__(self):
+        self.total_bytes = 0
+        self._cond = threading.Condition()
+        # Куча (время попытки, порядковый номер, путь, номер попытки, callback)
+        self._heap = []
+        self._counter = itertools.count()
+        self._active = 0
+        self._hurry = False
+        self._thread = None
+
+    def __len__(self):
+        """
+        Кол-во файлов, размер которых еще не определен.
+        """
+        with self._cond:
+            return len(self._heap) + self._active
+
+    def submit(self, path, callback=None):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic(), next(self._counter), path, 0, callback))
+            self._ensure_thread()
+            self._cond.notify()
+
+    def wait(self, timeout=5.0):
+        """
+        Ждет размеры всех файлов (не дольше timeout). Отложенные повторы
+        выполняются сразу и считаются последними: рендер уже закончен.
+        Возвращает False, если не все файлы успели обработаться.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._hurry = True
+            self._cond.notify_all()
+            try:
+                while self._heap or self._active:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._hurry = False
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="RenderEstimator_Size_Thread")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._heap:
+                        due = self._heap[0][0]
+                        delay = 0.0 if self._hurry else due - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    elif not self._cond.wait(self.IDLE_TIMEOUT) and not self._heap:
+                        # Простой - поток завершается, submit() запустит новый
+                        self._thread = None
+                        return
+                _due, _seq, path, attempt, callback = heapq.heappop(self._heap)
+                final = self._hurry or attempt >= len(self.RETRY_DELAYS)
+                self._active += 1
+
+            size, complete = self._stat_size(path)
+
+            if not complete and not final:
+                with self._cond:
+                    self._active -= 1
+                    heapq.heappush(self._heap, (time.monotonic() + self.RETRY_DELAYS[attempt],
+                                                next(self._counter), path, attempt + 1, callback))
+                continue
+
+            # Счетчик активных уменьшается только после callback, чтобы wait() видел результат
+            try:
+                if callback is not None:
+                    callback(size)
+            except Exception as e:
+                print(f"[RenderEstimator] Size callback error: {e}")
+            finally:
+                with self._cond:
+                    self.total_bytes += size
+                    self._active -= 1
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _stat_size(path):
+        """
+        Возвращает (суммарный размер, все ли файлы найдены и не пустые).
+        """
+        total = 0
+        complete = True
+        for file_path in _frame_files(path):
+            try:
+                size = os.stat(file_path).st_size
+            except OSError:
+                size = 0
+            total += size
+            complete = complete and size > 0
+        return total, complete
+
+
+# --- inotify (Linux) ---
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_ONLYDIR = 0x01000000
+IN_Q_OVERFLOW = 0x00004000
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class InotifyBackend:
+    """
+    Событийный бэкенд на inotify: ждет IN_CLOSE_WRITE/IN_MOVED_TO в папках рендера
+    вместо опроса раз в секунду. Работает только на Linux.
+    Папки, которых еще нет (рендер не начал писать), подхватываются при следующих вызовах wait().
+    """
+
+    def __init__(self, directories):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("libc has no inotify support")
+
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        # Self-pipe: interrupt() прерывает wait() из другого потока
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        # poll() вместо select(): select не принимает fd >= FD_SETSIZE (1024),
+        # а в Houdini с сотнями открытых файлов номера fd бывают и больше
+        self._poller = select.poll()
+        self._poller.register(self.fd, select.POLLIN)
+        self._poller.register(self._wake_r, select.POLLIN)
+
+        # {wd: папка}
+        self.watches = {}
+        self.missing = set(directories)
+        # Флаг "нужен полный скан": новые watches (файлы могли появиться до них) или переполнение очереди
+        self.needs_rescan = False
+        try:
+            self._add_missing()
+        except OSError:
+            self.close()
+            raise
+
+    def watch(self, directories):
+        """
+        Добавляет папки для наблюдения (новые папки подхватываются при следующем wait()).
+        """
+        known = set(self.watches.values())
+        for directory in directories:
+            if directory not in known:
+                self.missing.add(directory)
+
+    def _add_missing(self):
+        for directory in list(self.missing):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                              IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR)
+            if wd >= 0:
+                self.watches[wd] = directory
+                self.missing.discard(directory)
+                self.needs_rescan = True
+                continue
+            err = ctypes.get_errno()
+            # Папки еще нет - попробуем позже. Остальные ошибки (лимит watches и т.п.) - фатальны для бэкенда
+            if err not in (errno.ENOENT, errno.ENOTDIR):
+                raise OSError(err, os.strerror(err), directory)
+
+    def wait(self, timeout):
+        """
+        Ждет события не дольше timeout секунд.
+        Возвращает список (папка, имя_файла) для закрытых/перемещенных файлов.
+        OSError означает, что бэкенд больше не работоспособен и нужен фолбэк на опрос.
+        """
+        if self.missing:
+            self._add_missing()
+
+        try:
+            readable = [fd for fd, _mask in self._poller.poll(max(0, int(timeout * 1000)))]
+        except InterruptedError:
+            return []
+        if self._wake_r in readable:
+            try:
+                os.read(self._wake_r, 4096)
+            except BlockingIOError:
+                pass
+        if self.fd not in readable:
+            return []
+
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset:offset + name_len].rstrip(b'\0')
+                offset += name_len
+                if mask & IN_Q_OVERFLOW:
+                    # Очередь переполнена: часть событий потеряна, нужен полный скан
+                    self.needs_rescan = True
+                    continue
+                directory = self.watches.get(wd)
+                if directory is not None and name:
+                    events.append((directory, os.fsdecode(name)))
+        return events
+
+    def interrupt(self):
+        """
+        Прерывает текущий (или следующий) wait() - можно звать из любого потока.
+        """
+        try:
+            os.write(self._wake_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self):
+        for fd in (self.fd, self._wake_r, self._wake_w):
+            if fd is not None and fd >= 0:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.fd = self._wake_r = self._wake_w = None
+
+
+def create_inotify_backend(directories):
+    """
+    Возвращает InotifyBackend или None, если inotify недоступен
+    (не Linux, лимит watches, неподдерживаемая ФС и т.п.).
+    """
+    try:
+        return InotifyBackend(directories)
+    except (OSError, AttributeError):
+        return None
+
+
+class WatcherHub:
+    """
+    Один фоновый поток на все File Watcher'ы процесса: несколько одновременных рендеров
+    (фоновые рендеры, ROP network с несколькими Karma ROP) не требуют по потоку на рендер.
+    Один inotify на папки всех заданий; без него - опрос каждого задания по его расписанию.
+    Поток запускается при первом add() и завершается, когда заданий не осталось.
+
+    Задание (job) - объект с методами:
+        directories()                 - папки для событийного бэкенда;
+        on_event(папка, имя, время)   - событие файла, True если файл относится к заданию;
+        poll(now, changed)            - проверка файлов задания (changed - были события
+                                        задания или нужен полный скан);
+        next_poll(now, evented)       - время следующего poll() (evented - работает inotify);
+        active                        - False, когда задание закончено (все кадры, таймаут, остановка);
+        finish()                      - вызывается один раз из потока хаба после снятия задания.
+    """
+    THREAD_NAME = "RenderEstimator_FileWatcher_Thread"
+    # Максимальное ожидание за раз (новые задания, остановка, таймауты)
+    WAIT_TIMEOUT = 1.0
+
+    def __init__(self, backend_factory=create_inotify_backend):
+        # backend_factory(папки) -> событийный бэкенд или None (None вместо функции - только опрос)
+        self.backend_factory = backend_factory
+        self._lock = threading.Lock()
+        self._jobs = []
+        self._wake = threading.Event()
+        self._thread = None
+        self._backend = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def wake(self):
+        """
+        Прерывает ожидание потока хаба: задания сразу проверяются (drain/cancel).
+        """
+        self._wake.set()
+        # Под локом: бэкенд не закроется (и его fd не переиспользуется) во время записи
+        with self._lock:
+            if self._backend is not None:
+                self._backend.interrupt()
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs)
+
+    def add(self, job):
+        with self._lock:
+            self._jobs.append(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.THREAD_NAME)
+                self._thread.daemon = True
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, job):
+        """
+        Снимает задание без вызова finish().
+        """
+        with self._lock:
+            if job in self._jobs:
+                self._jobs.remove(job)
+        self.wake()
+
+    def _run(self):
+        backend = None
+        use_events = self.backend_factory is not None
+        try:
+            while True:
+                with self._lock:
+                    finished = [job for job in self._jobs if not job.active]
+                    for job in finished:
+                        self._jobs.remove(job)
+                    jobs = list(self._jobs)
+                    if not jobs and not finished:
+                        # Простой - поток завершается, add() запустит новый
+                        self._thread = None
+                        return
+                    self._wake.clear()
+
+                for job in finished:
+                    self._call(job, 'finish')
+                if not jobs:
+                    continue
+
+                if use_events and backend is None:
+                    backend = self.backend_factory(self._directories(jobs))
+                    use_events = backend is not None
+                    with self._lock:
+                        self._backend = backend
+                    print(f"[RenderEstimator] File Watcher backend: {'inotify' if backend else 'polling'}.")
+
+                now = time.time()
+                next_poll = min(job.next_poll(now, backend is not None) for job in jobs)
+                timeout = min(self.WAIT_TIMEOUT, max(0.0, next_poll - now))
+
+                if backend is None:
+                    # Спим до ближайшего опроса (add/remove прерывают ожидание)
+                    if timeout > 0:
+                        self._wake.wait(timeout)
+                    now = time.time()
+                    for job in jobs:
+                        if job.active and job.next_poll(now, False) <= now:
+                            self._call(job, 'poll', now, False)
+                    continue
+
+                backend.watch(self._directories(jobs))
+                try:
+                    events = backend.wait(timeout)
+                except (OSError, ValueError) as e:
+                    print(f"[RenderEstimator] inotify failed ({e}). Falling back to polling.")
+                    self._close_backend(backend)
+                    backend = None
+                    use_events = False
+                    continue
+
+                now = time.time()
+                touched = set()
+                for directory, name in events:
+                    for job in jobs:
+                        if job.on_event(directory, name, now):
+                            touched.add(job)
+                # Скан только при событиях + новые папки/переполнение очереди + редкие проходы задания
+                rescan, backend.needs_rescan = backend.needs_rescan, False
+                for job in jobs:
+                    changed = rescan or job in touched
+                    if job.active and (changed or job.next_poll(now, True) <= now):
+                        self._call(job, 'poll', now, changed)
+        finally:
+            self._close_backend(backend)
+
+    def _close_backend(self, backend):
+        """
+        Закрывает бэкенд этого потока. self._backend очищается, только если это он же:
+        новый поток (add() во время завершения старого) уже мог опубликовать свой.
+        """
+        if backend is None:
+            return
+        with self._lock:
+            if self._backend is backend:
+                self._backend = None
+        # wake() больше не видит этот бэкенд - закрытие не гонится с interrupt()
+        backend.close()
+
+    @staticmethod
+    def _directories(jobs):
+        dirs = set()
+        for job in jobs:
+            dirs.update(job.directories())
+        return dirs
+
+    def _call(self, job, method, *args):
+        # Ошибка одного задания не должна останавливать остальные рендеры
+        try:
+            getattr(job, method)(*args)
+        except Exception as e:
+            print(f"[RenderEstimator] File Watcher job error ({method}): {e}")
+            if method == 'poll':
+                # Задание снимается, а finish() отправит то, что уже найдено
+                self.remove(job)
+                self._call(job, 'finish')